@@ -0,0 +1,52 @@
+"""Shared fixtures for the benchmarks.
+
+Run with `pytest benchmarks/`. Timings are collected by
+pytest-benchmark and peak memory (as measured by tracemalloc)
+is recorded in the `extra_info` of each benchmark.
+"""
+
+import tracemalloc
+
+import pytest
+
+from dbtease.dbt import DbtProject
+from dbtease.schedule import DbtSchedule
+from dbtease.warehouses.base import DummyWarehouse
+
+from generators import generate_schedule_config
+
+
+@pytest.fixture
+def track_peak_memory(benchmark):
+    """Run a function once under tracemalloc, recording its peak memory."""
+
+    def _track(func, *args, **kwargs):
+        tracemalloc.start()
+        try:
+            func(*args, **kwargs)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        benchmark.extra_info["peak_memory_mb"] = round(peak / (1024 * 1024), 2)
+
+    return _track
+
+
+@pytest.fixture(scope="session")
+def project():
+    """A project which doesn't need a file on disk."""
+    return DbtProject(package_name="bench", profile_name="bench")
+
+
+@pytest.fixture
+def make_schedule(project):
+    """Make a schedule from a synthetic config."""
+
+    def _make(n_schemas, **kwargs):
+        return DbtSchedule.from_dict(
+            generate_schedule_config(n_schemas=n_schemas, **kwargs),
+            warehouse=DummyWarehouse(),
+            project=project,
+        )
+
+    return _make
@@ -0,0 +1,86 @@
+"""Generators for synthetic schedules and manifests."""
+
+import json
+import random
+
+
+def generate_schedule_config(n_schemas=200, n_layers=10, max_parents=3, seed=0):
+    """Make a dbt_schedule.yml style config with a layered DAG of schemas.
+
+    Each schema depends on up to max_parents schemas from earlier layers.
+    """
+    rng = random.Random(seed)
+    schemas = {}
+    layers = [[] for _ in range(n_layers)]
+    for idx in range(n_schemas):
+        name = f"schema_{idx}"
+        layer = idx * n_layers // n_schemas
+        layers[layer].append(name)
+        config = {
+            "paths": [f"models/{name}", f"data/{name}"],
+            "materialized": idx % 3 == 0,
+        }
+        if config["materialized"]:
+            config["schedule"] = rng.choice(["0 */2 * * *", "0 0,12 * * *", "*/15 * * * *"])
+        upstream = [schema for earlier in layers[:layer] for schema in earlier]
+        if upstream:
+            config["depends_on"] = rng.sample(
+                upstream, min(len(upstream), rng.randint(1, max_parents))
+            )
+        schemas[name] = config
+    return {
+        "deployment": "bench_prod",
+        "schemas": schemas,
+        "redeploy_schedule": "0 3 * * *",
+    }
+
+
+def generate_manifest(n_nodes=10000, n_schemas=200, changed=(), seed=0):
+    """Make a manifest string with nodes spread over the schemas.
+
+    Args:
+        changed: Indices of nodes whose checksums should differ from
+            the default. Diffing two manifests with different `changed`
+            gives a known diff.
+    """
+    rng = random.Random(seed)
+    changed = set(changed)
+    nodes = {}
+    for idx in range(n_nodes):
+        schema = f"schema_{idx % n_schemas}"
+        nodes[f"model.bench.model_{idx}"] = {
+            "resource_type": "model",
+            "root_path": "/project",
+            "original_file_path": f"models/{schema}/model_{idx}.sql",
+            "checksum": {
+                "name": "sha256",
+                "checksum": f"{idx}-changed" if idx in changed else str(idx),
+            },
+            # Pad out nodes so they're of a realistic size.
+            "raw_sql": "select " + ", ".join(f"col_{col}" for col in range(rng.randint(5, 50))),
+            "depends_on": {"nodes": [f"model.bench.model_{rng.randrange(n_nodes)}"]},
+            "tags": ["bench"],
+        }
+    sources = {
+        f"source.bench.src_{idx}": {
+            "root_path": "/project",
+            "original_file_path": f"models/schema_{idx % n_schemas}/sources.yml",
+            "loader": "bench",
+        }
+        for idx in range(n_nodes // 100)
+    }
+    macros = {
+        f"macro.bench.macro_{idx}": {
+            "original_file_path": f"macros/macro_{idx}.sql",
+            "macro_sql": f"{{% macro macro_{idx}() %}}select {idx}{{% endmacro %}}",
+        }
+        for idx in range(n_nodes // 100)
+    }
+    return json.dumps(
+        {
+            "metadata": {"generated_at": "2021-01-01T00:00:00Z"},
+            "nodes": nodes,
+            "sources": sources,
+            "macros": macros,
+        }
+    )
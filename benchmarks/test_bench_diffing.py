@@ -0,0 +1,21 @@
+"""Benchmarks for diffing manifests."""
+
+import pytest
+
+from dbtease.dbt import diff_manifests
+
+from generators import generate_manifest
+
+
+@pytest.mark.parametrize("n_nodes", [10000, 100000])
+def test_bench_diff_manifests(benchmark, track_peak_memory, n_nodes):
+    changed = range(0, n_nodes, 100)
+    live_manifest = generate_manifest(n_nodes=n_nodes)
+    local_manifest = generate_manifest(n_nodes=n_nodes, changed=changed)
+    track_peak_memory(diff_manifests, live_manifest, local_manifest)
+    benchmark.extra_info["manifest_size_mb"] = round(len(live_manifest) / (1024 * 1024), 2)
+    # Large manifests take a while, so only run them a few times.
+    node_diff = benchmark.pedantic(
+        diff_manifests, args=(live_manifest, local_manifest), rounds=3
+    )
+    assert len(node_diff) == len(changed)
@@ -0,0 +1,65 @@
+"""Benchmarks for loading schedules and planning deploys."""
+
+import datetime
+
+import pytest
+
+from dbtease.config_context import ConfigContext
+from dbtease.schedule import DbtSchedule
+from dbtease.warehouses.base import DummyWarehouse
+
+from generators import generate_manifest, generate_schedule_config
+
+
+@pytest.mark.parametrize("n_schemas", [100, 1000])
+def test_bench_schedule_from_dict(benchmark, track_peak_memory, project, n_schemas):
+    config = generate_schedule_config(n_schemas=n_schemas, n_layers=20)
+
+    def _load():
+        return DbtSchedule.from_dict(config, warehouse=DummyWarehouse(), project=project)
+
+    track_peak_memory(_load)
+    schedule = benchmark(_load)
+    assert len(schedule.graph) == n_schemas
+
+
+@pytest.mark.parametrize("n_schemas,n_paths", [(100, 1000), (500, 10000)])
+def test_bench_generate_plan_from_paths(
+    benchmark, track_peak_memory, make_schedule, n_schemas, n_paths
+):
+    schedule = make_schedule(n_schemas, n_layers=20)
+    paths = [
+        f"models/schema_{idx % (n_schemas * 2)}/model_{idx}.sql"
+        for idx in range(n_paths)
+    ]
+    track_peak_memory(schedule.generate_plan_from_paths, paths)
+    plan = benchmark(schedule.generate_plan_from_paths, paths)
+    # Half the paths point at schemas which don't exist.
+    assert plan["unmatched_files"]
+
+
+@pytest.mark.parametrize("n_schemas", [100, 1000])
+def test_bench_evaluate_schedules(
+    benchmark, track_peak_memory, make_schedule, n_schemas
+):
+    schedule = make_schedule(n_schemas)
+    an_hour_ago = datetime.datetime.utcnow() - datetime.timedelta(hours=1)
+    last_refreshes = {name: an_hour_ago for name, _ in schedule.iter_schemas()}
+    track_peak_memory(schedule.evaluate_schedules, last_refreshes=last_refreshes)
+    benchmark(schedule.evaluate_schedules, last_refreshes=last_refreshes)
+
+
+@pytest.mark.parametrize("n_nodes", [10000])
+def test_bench_config_context_roundtrip(benchmark, track_peak_memory, tmp_path, n_nodes):
+    manifest = generate_manifest(n_nodes=n_nodes)
+    profiles_yml = "bench:\n  target: prod\n"
+
+    def _roundtrip():
+        with ConfigContext(
+            file_dict={"profiles.yml": profiles_yml, "manifest.json": manifest},
+            config_path=str(tmp_path / ".dbtease"),
+        ) as ctx:
+            return ctx.read_file("manifest.json")
+
+    track_peak_memory(_roundtrip)
+    assert benchmark(_roundtrip) == manifest
@@ -0,0 +1,20 @@
+"""Benchmarks for how long the CLI takes to start."""
+
+import subprocess
+import sys
+
+import pytest
+
+
+@pytest.mark.parametrize(
+    "statement",
+    ["import dbtease.cli", "from dbtease.cli import cli; cli(['--help'])"],
+)
+def test_bench_cli_startup(benchmark, statement):
+    # Each round is a fresh interpreter, so nothing is already imported.
+    cmd = [sys.executable, "-c", statement]
+
+    def _start():
+        subprocess.run(cmd, check=False, stdout=subprocess.DEVNULL)
+
+    benchmark.pedantic(_start, rounds=5, warmup_rounds=1)
@@ -84,12 +84,17 @@ setup(
         "crontab",
         "networkx",
         "gitpython",
+        "ijson>=3.1",
         "colorama ; platform_system==\"Windows\"",
         "snowflake-connector-python",
         "slack_sdk",
         "boto3",
         "jinja2<3.0.0",
     ],
+    extras_require={
+        # Export traces to OpenTelemetry.
+        "otel": ["opentelemetry-api"],
+    },
     entry_points={
         "console_scripts": [
             "dbtease = dbtease.cli:cli",
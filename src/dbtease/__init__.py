@@ -1,11 +1,12 @@
 """Init py for dbtease."""
 
 # Set the version attribute of the library
-import pkg_resources
 import configparser
+import os.path
 
-# Get the current version
+# Get the current version. NB: We read the file directly
+# rather than through pkg_resources, which is slow to import.
 config = configparser.ConfigParser()
-config.read([pkg_resources.resource_filename("dbtease", "config.ini")])
+config.read([os.path.join(os.path.dirname(__file__), "config.ini")])
 
 __version__ = config.get("dbtease", "version")
@@ -4,8 +4,16 @@ import logging
 from typing import List
 
 from dbtease.alerts.base import Alerter
-from dbtease.alerts.logger import LoggingAlerter
-from dbtease.alerts.slack import SlackAlerter
+from dbtease.plugins import PluginRegistry
+
+# Alerters are only imported when they're used.
+alerter_registry = PluginRegistry(
+    "Alerters",
+    {
+        "logger": "dbtease.alerts.logger:LoggingAlerter",
+        "slack": "dbtease.alerts.slack:SlackAlerter",
+    },
+)
 
 
 class AlterterBundle:
@@ -30,13 +38,9 @@ class AlterterBundle:
 
     @classmethod
     def from_config(cls, config):
-        lookup = {
-            "logger": LoggingAlerter,
-            "slack": SlackAlerter,
-        }
         alerters = []
         for alert_config in config:
             alerter_type = alert_config.pop("method")
-            alerter_class = lookup[alerter_type]
+            alerter_class = alerter_registry.get(alerter_type)
             alerters.append(alerter_class(**alert_config))
         return cls(alerters=alerters)
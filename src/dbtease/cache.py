@@ -0,0 +1,96 @@
+"""Local on-disk cache for dbtease artifacts."""
+
+import os
+import os.path
+import hashlib
+import logging
+import tempfile
+from typing import Optional
+
+logger = logging.getLogger("dbtease.cache")
+
+
+def default_cache_dir():
+    """Location of the cache, respecting DBTEASE_CACHE_DIR and XDG_CACHE_HOME."""
+    if "DBTEASE_CACHE_DIR" in os.environ:
+        return os.path.expanduser(os.environ["DBTEASE_CACHE_DIR"])
+    cache_home = os.environ.get("XDG_CACHE_HOME", None) or "~/.cache"
+    return os.path.join(os.path.expanduser(cache_home), "dbtease")
+
+
+def default_cache_size():
+    """Maximum size of the cache in bytes, from DBTEASE_CACHE_MAX_MB."""
+    return int(os.environ.get("DBTEASE_CACHE_MAX_MB", 1024)) * 1024 * 1024
+
+
+def digest(content: bytes) -> str:
+    """Content digest used to address cached and stored artifacts."""
+    return hashlib.sha256(content).hexdigest()
+
+
+class FileCache:
+    """Cache of bytes on disk, addressed by a relative path key.
+
+    When the cache grows beyond max_size bytes, the least recently
+    used items are removed.
+    """
+
+    def __init__(self, path=None, max_size=None):
+        self.path = path or os.path.join(default_cache_dir(), "files")
+        self.max_size = max_size if max_size is not None else default_cache_size()
+
+    def _path(self, key):
+        return os.path.join(self.path, *key.split("/"))
+
+    def get(self, key) -> Optional[bytes]:
+        """Read an item from the cache, returning None if not present."""
+        try:
+            with open(self._path(key), "rb") as cache_file:
+                content = cache_file.read()
+            # Mark as recently used.
+            os.utime(self._path(key))
+        except OSError:
+            return None
+        logger.debug("Cache hit: %r", key)
+        return content
+
+    def put(self, key, content: bytes):
+        """Write an item to the cache.
+
+        Writes go to a temporary file first so that concurrent readers
+        never see a partial file. Failures to write are logged rather
+        than raised, because the cache is only ever an optimisation.
+        """
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+            with os.fdopen(fd, "wb") as tmp_file:
+                tmp_file.write(content)
+            os.replace(tmp_path, path)
+        except OSError as err:
+            logger.warning("Unable to write %r to cache: %s", key, err)
+            return
+        self.prune()
+
+    def prune(self):
+        """Remove the least recently used items until within max_size."""
+        cached_files = []
+        for dirpath, _, fnames in os.walk(self.path):
+            for fname in fnames:
+                fpath = os.path.join(dirpath, fname)
+                try:
+                    stat = os.stat(fpath)
+                except OSError:
+                    continue
+                cached_files.append((stat.st_mtime, stat.st_size, fpath))
+        total_size = sum(size for _, size, _ in cached_files)
+        for _, size, fpath in sorted(cached_files):
+            if total_size <= self.max_size:
+                break
+            logger.debug("Evicting from cache: %r", fpath)
+            try:
+                os.remove(fpath)
+            except OSError:
+                continue
+            total_size -= size
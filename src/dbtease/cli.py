@@ -2,15 +2,26 @@
 
 import click
 import logging
+import os.path
+import signal
+import subprocess
 import sys
+import dataclasses
 import datetime
+import threading
+import time
 
 from dbtease.schedule import DbtSchedule
+from dbtease.workspace import Workspace
 
 from dbtease.config_context import ConfigContext
 from dbtease.shell import run_shell_command
 
-from dbtease.dbt import diff_manifests
+from dbtease.dbt import diff_manifests, manifest_node_paths, parse_run_results
+from dbtease.concurrency import run_dag, run_limited, simulate_dag
+from dbtease.cache import FileCache, digest
+from dbtease.deps import DepsManager
+from dbtease import tracing
 
 
 # Set up logging properly
@@ -22,15 +33,36 @@ formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(messag
 ch.setFormatter(formatter)
 root.addHandler(ch)
 
+# Full output of commands goes here, the console only gets stdout.
+COMMAND_LOG_PATH = os.path.join("logs", "dbtease_commands.log")
+
+
+def command_timeout():
+    """The timeout for shell commands in seconds, if set."""
+    timeout = os.environ.get("DBTEASE_COMMAND_TIMEOUT")
+    return float(timeout) if timeout else None
+
 
 @click.group()
 @click.version_option()
-def cli():
-    pass
+@click.pass_context
+def cli(ctx):
+    # Trace where the time goes, unless disabled with an empty path.
+    tracing.configure(
+        path=os.environ.get("DBTEASE_TRACE_PATH", tracing.DEFAULT_TRACE_PATH),
+        otel=bool(os.environ.get("DBTEASE_TRACE_OTEL")),
+    )
+    tracing.set_tags(command=ctx.invoked_subcommand)
 
 
 def common_setup(
-    project_dir, profiles_dir, schedule_dir, deploy=True, aws_profile=None
+    project_dir,
+    profiles_dir,
+    schedule_dir,
+    deploy=True,
+    aws_profile=None,
+    lock_timeout=None,
+    read_only=False,
 ):
     schedule_dir = schedule_dir or project_dir
     # Load the schedule
@@ -40,7 +72,17 @@ def common_setup(
         project_dir=project_dir,
         aws_profile=aws_profile,
     )
+    if lock_timeout is not None:
+        schedule.warehouse.lock_config = dataclasses.replace(
+            schedule.warehouse.lock_config, wait=True, timeout=lock_timeout
+        )
+    # Close warehouse connections whenever the command finishes.
+    click.get_current_context().call_on_close(schedule.warehouse.close)
+    # Only commands which change things should create the state store.
+    if not read_only:
+        schedule.warehouse.ensure_state_store()
     status_dict = schedule.status_dict(deploy=deploy)
+    tracing.set_tags(deployment=schedule.name, commit=status_dict["current_hash"])
     return schedule, status_dict
 
 
@@ -53,17 +95,27 @@ def echo_status(status_dict, project_name):
         ("Uncommitted Changes", status_dict["dirty_tree"]),
         ("Redeploy Due", status_dict["redeploy_due"]),
         ("Refreshes Due", ", ".join(status_dict["refreshes_due"])),
+        ("Next Due (UTC)", status_dict["next_due"] or "Never"),
+        ("Active Locks", ", ".join(status_dict["locks"])),
     ]
     for label, value in config_pairs:
         click.echo(f"{label:22} - {value}")
     click.echo("===")
 
 
+def format_duration(seconds, estimated=True):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h {minutes:02}m {seconds:02}s" + (" (estimated)" if estimated else "")
+
+
 def echo_plan(plan_dict):
     click.echo("=== deploy plan ===")
     config_pairs = [
         ("Deployment Plan", ", ".join(plan_dict["deploy_order"])),
         ("Triggers Full Deploy", plan_dict["trigger_full_deploy"]),
+        ("Predicted Duration", format_duration(plan_dict["predicted_duration"])),
+        ("Critical Path", format_duration(plan_dict["critical_path"])),
     ]
     for label, value in config_pairs:
         click.echo(f"{label:22} - {value}")
@@ -79,40 +131,71 @@ def echo_plan(plan_dict):
     click.echo("===")
 
 
-def get_compiled_manifest(schedule):
+def _compiled_manifest_key(schedule, commit_hash, profiles_yml):
+    """Cache key for a compiled manifest.
+
+    As well as the commit, this depends on the project config and
+    the profile we compile with, which may not be under version control.
+    """
+    config_content = [profiles_yml.encode("utf8")]
+    for fname in ("dbt_project.yml", "packages.yml"):
+        try:
+            with open(os.path.join(schedule.project_dir, fname), "rb") as config_file:
+                config_content.append(config_file.read())
+        except FileNotFoundError:
+            config_content.append(b"")
+    config_digest = digest(b"\0".join(config_content))
+    return f"compiled/{schedule.name}/{commit_hash}/{config_digest}/manifest.json"
+
+
+def get_compiled_manifest(schedule, status_dict=None, use_cache=True):
+    profiles_yml = schedule.project.generate_profiles_yml(
+        # Use deploy context
+        database=schedule.deploy_config["database"],
+        schema=schedule.schema_prefix,
+    )
+    # We can only use the cache for committed changes.
+    cache_key = None
+    if use_cache and status_dict and not status_dict["dirty_tree"]:
+        cache_key = _compiled_manifest_key(
+            schedule, status_dict["current_hash"], profiles_yml
+        )
+        cached_manifest = FileCache().get(cache_key)
+        if cached_manifest:
+            click.secho("Using cached manifest for this commit.", fg="bright_blue")
+            return cached_manifest.decode("utf8")
     with ConfigContext(
-        file_dict={
-            # Use deploy context
-            "profiles.yml": schedule.project.generate_profiles_yml(
-                database=schedule.deploy_config["database"],
-                schema=schedule.schema_prefix,
-            )
-        }
+        file_dict={"profiles.yml": profiles_yml},
+        config_path=schedule.project_path(".dbtease"),
     ) as ctx:
-        profile_args = ["--profiles-dir", str(ctx)]
+        profile_args = dbt_project_args(schedule, ctx)
         # dbt deps
-        cli_run_dbt_command(["deps"])
+        cli_dbt_deps(schedule)
         # Compile to generate manifest
         cli_run_dbt_command(["compile"] + profile_args)
         # Stash the docs and the manifest
-        ctx.stash_files("target/manifest.json")
+        ctx.stash_files(*target_files(schedule, "manifest.json"))
         # Get manifest
         new_manifest = ctx.read_file("manifest.json")
-        return new_manifest
+    if cache_key:
+        FileCache().put(cache_key, new_manifest.encode("utf8"))
+    return new_manifest
 
 
-def generate_plan(schedule, status_dict):
+def generate_plan(schedule, status_dict, use_cache=True):
     """Generate a plan from a manifest diff."""
     # Fetch manifest of current live build
     live_manifest = schedule.warehouse.fetch_manifest(
         schedule.name, status_dict["deployed_hash"]
     )
     # Compiled Manifest
-    new_manifest = get_compiled_manifest(schedule)
+    new_manifest = get_compiled_manifest(
+        schedule, status_dict=status_dict, use_cache=use_cache
+    )
     node_diff = diff_manifests(live_manifest, new_manifest)
 
     paths = [path for _, path in node_diff]
-    plan = schedule.generate_plan_from_paths(paths)
+    plan = schedule.generate_plan_from_paths(paths, manifest=new_manifest)
     if not node_diff:
         click.secho("NO MODELS CHANGED", fg="green")
     else:
@@ -124,9 +207,14 @@ def generate_plan(schedule, status_dict):
 @click.option("--project-dir", default=".")
 @click.option("--profiles-dir", default="~/.dbt/")
 @click.option("--schedule-dir", default=None)
-def status(project_dir, profiles_dir, schedule_dir):
+@click.option(
+    "--no-cache", is_flag=True, help="Always compile, ignoring cached manifests."
+)
+def status(project_dir, profiles_dir, schedule_dir, no_cache):
     """Get the current status of deployment."""
-    schedule, status_dict = common_setup(project_dir, profiles_dir, schedule_dir)
+    schedule, status_dict = common_setup(
+        project_dir, profiles_dir, schedule_dir, read_only=True
+    )
     # Output the status.
     echo_status(status_dict, schedule.name)
     if (
@@ -137,7 +225,7 @@ def status(project_dir, profiles_dir, schedule_dir):
         return
 
     click.secho("Hash differs or tree is dirty. Generating a manifest...\n", fg="cyan")
-    generate_plan(schedule, status_dict)
+    generate_plan(schedule, status_dict, use_cache=not no_cache)
 
 
 @cli.command()
@@ -146,9 +234,34 @@ def status(project_dir, profiles_dir, schedule_dir):
 @click.option("--schedule-dir", default=None)
 @click.option("--database", default=None)
 @click.option("--append-commit-to-db", is_flag=True)
-def test(project_dir, profiles_dir, schedule_dir, database, append_commit_to_db):
+@click.option(
+    "--clone",
+    type=click.Choice(["none", "database", "schemas"]),
+    default="none",
+    help=(
+        "Start from a zero-copy clone of the live database, or of just the "
+        "schemas affected by the changes, and only rebuild modified models."
+    ),
+)
+@click.option(
+    "--lock-timeout",
+    default=None,
+    type=click.FloatRange(min=0),
+    help="Wait up to this many seconds for locks, rather than failing if they're taken.",
+)
+def test(
+    project_dir,
+    profiles_dir,
+    schedule_dir,
+    database,
+    append_commit_to_db,
+    clone,
+    lock_timeout,
+):
     """Tests the current active changes."""
-    schedule, status_dict = common_setup(project_dir, profiles_dir, schedule_dir)
+    schedule, status_dict = common_setup(
+        project_dir, profiles_dir, schedule_dir, lock_timeout=lock_timeout
+    )
     # Output the status.
     echo_status(status_dict, schedule.name)
     # Validate state
@@ -179,6 +292,7 @@ def test(project_dir, profiles_dir, schedule_dir, database, append_commit_to_db)
             fg="yellow",
         )
         defer_to_state = False
+        clone = "none"
     else:
         defer_to_state = True
         # Fetch manifest of current live build
@@ -186,106 +300,89 @@ def test(project_dir, profiles_dir, schedule_dir, database, append_commit_to_db)
             schedule.name, deployed_hash
         )
 
+    clone_schemas = []
+    if clone == "schemas":
+        click.secho("Generating Manifest to find affected schemas...", fg="cyan")
+        plan, _ = generate_plan(schedule, status_dict)
+        clone_schemas = plan["deploy_order"]
+
     try:
         # Set up our config files
-        with ConfigContext(file_dict=file_dict) as ctx:
-            profile_args = ["--profiles-dir", str(ctx)]
+        with ConfigContext(
+            file_dict=file_dict, config_path=schedule.project_path(".dbtease")
+        ) as ctx:
+            profile_args = dbt_project_args(schedule, ctx)
             # dbt deps
-            cli_run_dbt_command(["deps"])
+            cli_dbt_deps(schedule)
             # Deploy
             # Try to get a lock on the build database
             click.secho("Acquiring Build Lock", fg="bright_blue")
             with schedule.warehouse.lock(build_db):
                 # make sure we've got a database to work with.
-                click.secho("Cleaning test database", fg="bright_blue")
-                schedule.warehouse.create_wipe_db(build_db)
-                if defer_to_state:
-                    # run dbt seed
-                    cli_run_dbt_command(
-                        [
-                            "seed",
-                            "--select",
-                            "state:modified",
-                            "--full-refresh",
-                            "--state",
-                            str(ctx),
-                        ]
-                        + profile_args
-                    )
-                    # run dbt. NOTE: full refresh + to also do donwstream dependencies. Defer so we don't build what we don't need.
-                    cli_run_dbt_command(
-                        [
-                            "run",
-                            "--models",
-                            "state:modified+",
-                            "--full-refresh",
-                            "--fail-fast",
-                            "--defer",
-                            "--state",
-                            str(ctx),
-                        ]
-                        + profile_args
+                deploy_db = schedule.deploy_config["database"]
+                if clone == "database":
+                    click.secho("Cloning live database", fg="bright_blue")
+                    schedule.warehouse.create_wipe_db(build_db, source=deploy_db)
+                else:
+                    click.secho("Cleaning test database", fg="bright_blue")
+                    schedule.warehouse.create_wipe_db(build_db)
+                cli_clone_schemas(
+                    schedule,
+                    [
+                        sch
+                        for schema_name in clone_schemas
+                        for sch in schedule.get_schema(schema_name).schemas
+                    ],
+                    build_db,
+                )
+                if clone != "none":
+                    # Rebuild the modified nodes from scratch. Then update the
+                    # (cloned) nodes downstream of them incrementally. Anything
+                    # else we need comes from the clone, or is deferred to live.
+                    cli_run_dbt_phase(
+                        schedule,
+                        "state:modified",
+                        profile_args,
+                        seed_selector="state:modified",
+                        full_refresh=True,
+                        defer=True,
+                        state=str(ctx),
                     )
-                    # dbt test. with dependencies
-                    cli_run_dbt_command(
-                        [
-                            "test",
-                            "--models",
-                            "state:modified+",
-                            "--defer",
-                            "--state",
-                            str(ctx),
-                        ]
-                        + profile_args
+                    cli_run_dbt_phase(
+                        schedule,
+                        "state:modified+",
+                        profile_args,
+                        exclude="state:modified",
+                        defer=True,
+                        state=str(ctx),
                     )
-                    # run - incrementally this time (but only run the models which are incremental and their dependencies)
-                    cli_run_dbt_command(
-                        [
-                            "run",
-                            "--models",
-                            "state:modified+,config.materialized:incremental+",
-                            "--defer",
-                            "--fail-fast",
-                            "--state",
-                            str(ctx),
-                        ]
-                        + profile_args
+                elif defer_to_state:
+                    # seed, run and test. NOTE: full refresh + to also do donwstream dependencies. Defer so we don't build what we don't need.
+                    cli_run_dbt_phase(
+                        schedule,
+                        "state:modified+",
+                        profile_args,
+                        seed_selector="state:modified",
+                        full_refresh=True,
+                        defer=True,
+                        state=str(ctx),
                     )
-                    # dbt test again, with dependencies
-                    cli_run_dbt_command(
-                        [
-                            "test",
-                            "--models",
-                            "state:modified+,config.materialized:incremental+",
-                            "--defer",
-                            "--state",
-                            str(ctx),
-                        ]
-                        + profile_args
+                    # run and test - incrementally this time (but only run the models which are incremental and their dependencies)
+                    cli_run_dbt_phase(
+                        schedule,
+                        "state:modified+,config.materialized:incremental+",
+                        profile_args,
+                        defer=True,
+                        state=str(ctx),
                     )
                 else:
-                    # run dbt seed
-                    cli_run_dbt_command(["seed", "--full-refresh"] + profile_args)
-                    # run dbt build --full-refresh
-                    cli_run_dbt_command(
-                        ["run", "--full-refresh", "--fail-fast"] + profile_args
-                    )
-                    # run dbt test
-                    cli_run_dbt_command(["test"] + profile_args)
-                    # run incrementally
-                    cli_run_dbt_command(
-                        [
-                            "run",
-                            "--models",
-                            "config.materialized:incremental+",
-                            "--fail-fast",
-                        ]
-                        + profile_args
+                    # seed, run and test with --full-refresh
+                    cli_run_dbt_phase(
+                        schedule, None, profile_args, seed_selector="", full_refresh=True
                     )
-                    # dbt test again, with dependencies
-                    cli_run_dbt_command(
-                        ["test", "--models", "config.materialized:incremental+"]
-                        + profile_args
+                    # run and test incrementally
+                    cli_run_dbt_phase(
+                        schedule, "config.materialized:incremental+", profile_args
                     )
         click.secho("SUCCESS", fg="green")
         schedule.handle_event(
@@ -307,7 +404,17 @@ def test(project_dir, profiles_dir, schedule_dir, database, append_commit_to_db)
 
 def cli_run_command(cmd):
     click.secho(f"Running: {' '.join(cmd)}", fg="bright_blue")
-    retcode, stdoutlines, stderrlines = run_shell_command(cmd, echo=click.echo)
+    try:
+        retcode, stdoutlines, stderrlines = run_shell_command(
+            cmd,
+            echo=click.echo,
+            log_path=COMMAND_LOG_PATH,
+            timeout=command_timeout(),
+        )
+    except subprocess.TimeoutExpired as err:
+        raise click.ClickException(
+            f"Command timed out after {err.timeout}s. See {COMMAND_LOG_PATH} for output."
+        )
     if retcode != 0:
         # TODO: Better error message here.
         for errline in stderrlines:
@@ -316,6 +423,18 @@ def cli_run_command(cmd):
     return retcode, stdoutlines
 
 
+def dbt_project_args(schedule, ctx):
+    """Args for dbt to run the project, with the profiles in a config context."""
+    return ["--profiles-dir", str(ctx), "--project-dir", schedule.project_path()]
+
+
+def target_files(schedule, *fnames):
+    """Paths to artifacts dbt writes to the project's target path."""
+    return [
+        schedule.project_path(schedule.project.target_path, fname) for fname in fnames
+    ]
+
+
 def cli_run_dbt_command(cmd):
     try:
         retcode, stdoutlines = cli_run_command(["dbt"] + cmd)
@@ -324,65 +443,80 @@ def cli_run_dbt_command(cmd):
     return retcode, stdoutlines
 
 
-def schemawise_refresh(deploy_plan, schedule, manifest, current_hash):
-    # dbt deps
-    cli_run_dbt_command(["deps"])
-    # Iterate Schemas to Deploy
-    for schema_name in deploy_plan:
-        click.secho(f"BUILDING: {schema_name}", fg="cyan")
-        schema = schedule.get_schema(schema_name)
-        build_db = (
-            schema.build_config.get("database", None)
-            or schedule.build_config["database"]
-        )
-        # Set up context
-        with ConfigContext(
-            file_dict={
-                "profiles.yml": schedule.project.generate_profiles_yml(
-                    database=build_db,
-                    schema=schedule.schema_prefix,
-                ),
-                "manifest.json": manifest,
+def refresh_schema(
+    schema_name,
+    schedule,
+    manifest,
+    current_hash,
+    build_db,
+    deploy_lock,
+    threads=None,
+    isolated=False,
+):
+    """Build, test and swap a single schema into the deploy database.
+
+    If `isolated` (i.e. when running alongside other refreshes), dbt
+    writes its artifacts and logs to paths of its own, and the build
+    database (which is specific to this schema) is dropped afterward.
+    """
+    click.secho(f"BUILDING: {schema_name}", fg="cyan")
+    schema = schedule.get_schema(schema_name)
+    # Set up context
+    with ConfigContext(
+        file_dict={
+            "profiles.yml": schedule.project.generate_profiles_yml(
+                database=build_db,
+                schema=schedule.schema_prefix,
+            ),
+            "manifest.json": manifest,
+        },
+        config_path=schedule.project_path(f".dbtease_{schema_name}"),
+    ) as ctx:
+        profile_args = dbt_project_args(schedule, ctx)
+        # Keep concurrent dbt runs from overwriting each other's artifacts.
+        path_args = {}
+        if isolated:
+            path_args = {
+                "target_path": os.path.join(str(ctx), "target"),
+                "log_path": schedule.project_path("logs", f"dbt_{schema_name}"),
             }
-        ) as ctx:
-            profile_args = ["--profiles-dir", str(ctx)]
-            # defer only works for run and test
-            defer_args = ["--defer", "--state", str(ctx)]
-            # Acquire lock on build database
-            with schedule.warehouse.lock(build_db):
-                build_timestamp = datetime.datetime.utcnow()
-                # Make a blank build database.
-                click.secho(
-                    f"Creating clean build database: {build_db!r}", fg="bright_blue"
-                )
-                schedule.warehouse.create_wipe_db(build_db)
-                # If it's a materialised schema, clone the live version into it
-                if schema.materialized:
-                    for idx, sch in enumerate(schema.schemas):
-                        click.secho(
-                            f"Cloning live schema: {sch!r} [{idx + 1}/{len(schema.schemas)}]",
-                            fg="bright_blue",
-                        )
-                        schedule.warehouse.clone_schema(
-                            sch, build_db, source=schedule.deploy_config["database"]
-                        )
-                # Refresh the schema (NB: Incremental)
-                # NOTE: No seeds, because they're assumed unchanged.
-                cli_run_dbt_command(
-                    ["run", "--models", schema.selector(), "--fail-fast"]
-                    + profile_args
-                    + defer_args
-                )
-                # run dbt test
-                cli_run_dbt_command(
-                    ["test", "--models", schema.selector(), "--fail-fast"]
-                    + profile_args
-                    + defer_args
-                )
-                # Deploy schema
-                # Get lock on deploy DB
-                click.secho("Acquiring Deploy Lock", fg="bright_blue")
-                with schedule.warehouse.lock(schedule.deploy_config["database"]):
+        # Acquire lock on build database
+        with schedule.warehouse.lock(build_db) as build_lease:
+            build_timestamp = datetime.datetime.utcnow()
+            # Make a blank build database.
+            click.secho(
+                f"Creating clean build database: {build_db!r}", fg="bright_blue"
+            )
+            schedule.warehouse.create_wipe_db(build_db)
+            # If it's a materialised schema, clone the live version into it
+            if schema.materialized:
+                cli_clone_schemas(schedule, schema.schemas, build_db)
+            # Refresh the schema (NB: Incremental) and test it.
+            # NOTE: No seeds, because they're assumed unchanged.
+            cli_run_dbt_phase(
+                schedule,
+                schema.selector(),
+                profile_args,
+                defer=True,
+                state=str(ctx),
+                fail_fast_tests=True,
+                commit_hash=current_hash,
+                threads=threads,
+                **path_args,
+            )
+            # Deploy schema
+            # Get lock on deploy DB. Only one of our own threads can hold
+            # it at a time, so we wait on those rather than failing.
+            click.secho("Acquiring Deploy Lock", fg="bright_blue")
+            with tracing.span("deploy_lock_wait"):
+                deploy_lock.acquire()
+            try:
+                with schedule.warehouse.lock(
+                    schedule.deploy_config["database"]
+                ) as deploy_lease:
+                    # Don't swap if either lock was lost while we waited.
+                    build_lease.check()
+                    deploy_lease.check()
                     # Deploy
                     click.secho("Deploying...", fg="bright_blue")
                     schedule.warehouse.deploy_schemas(
@@ -399,22 +533,296 @@ def schemawise_refresh(deploy_plan, schedule, manifest, current_hash):
                         message="Successful Refresh",
                         metadata={"schema_name": schema_name, "hash": current_hash},
                     )
+            finally:
+                deploy_lock.release()
+            if isolated:
+                # The live schemas have been swapped out, so it's no longer needed.
+                click.secho(f"Dropping build database: {build_db!r}", fg="bright_blue")
+                schedule.warehouse.drop_db(build_db)
+
+
+def cli_clone_schemas(schedule, schemas, build_db):
+    """Clone live schemas into the build database, several at once."""
+    if not schemas:
+        return
+    concurrency = schedule.build_config.get("clone_concurrency", 8)
+    click.secho(
+        f"Cloning {len(schemas)} live schemas ({concurrency} at a time)",
+        fg="bright_blue",
+    )
+
+    def _progress(sch, done, total):
+        click.secho(f"Cloned live schema: {sch!r} [{done}/{total}]", fg="bright_blue")
+
+    schedule.warehouse.clone_schemas(
+        schemas,
+        build_db,
+        source=schedule.deploy_config["database"],
+        concurrency=concurrency,
+        progress=_progress,
+    )
+
+
+def cli_run_dbt_phase(
+    schedule,
+    selector,
+    profile_args,
+    seed_selector=None,
+    full_refresh=False,
+    defer=False,
+    state=None,
+    fail_fast_tests=False,
+    commit_hash=None,
+    exclude=None,
+    threads=None,
+    target_path=None,
+    log_path=None,
+):
+    """Seed (optionally), run and test a selection of the project.
+
+    If the schedule is configured with `dbt_build`, this is done in a
+    single `dbt build` so that the project is only parsed once. Otherwise
+    it's done with separate `seed`, `run` and `test` commands.
+
+    Args:
+        selector: The models to run and test, None for all.
+        seed_selector: The seeds to load. None for no seeds, and
+            an empty string for all seeds.
+        exclude: Models to exclude from the selection.
+        threads: The number of dbt threads, if not the profile default.
+        target_path: Where dbt writes its artifacts, if not the project default.
+        log_path: Where dbt writes its logs, if not the project default.
+        commit_hash: If provided, the node timings of each
+            step are recorded against this commit.
+    """
+
+    def _run_step(cmd):
+        started = time.time()
+        try:
+            cli_run_dbt_command(cmd)
+        finally:
+            if commit_hash:
+                cli_record_run_results(
+                    schedule, commit_hash, since=started, target_path=target_path
+                )
+
+    state_args = ["--state", state] if state else []
+    defer_args = ["--defer"] if defer else []
+    full_refresh_args = ["--full-refresh"] if full_refresh else []
+    # Put these with the profile args, which every step uses.
+    if threads:
+        profile_args = profile_args + ["--threads", str(threads)]
+    if target_path:
+        profile_args = profile_args + ["--target-path", target_path]
+    if log_path:
+        profile_args = profile_args + ["--log-path", log_path]
+    if schedule.dbt_build:
+        build_cmd = ["build"]
+        if selector:
+            build_cmd += ["--select", selector]
+        excludes = [exclude] if exclude else []
+        if seed_selector is None:
+            excludes.append("resource_type:seed")
+        # Seed, run and test never ran snapshots, so neither should build.
+        excludes.append("resource_type:snapshot")
+        build_cmd += ["--exclude", " ".join(excludes)]
+        _run_step(
+            build_cmd
+            + full_refresh_args
+            + ["--fail-fast"]
+            + defer_args
+            + state_args
+            + profile_args
+        )
+        return
+    # Seeds are always fully refreshed, and never deferred.
+    if seed_selector is not None:
+        seed_cmd = ["seed"]
+        if seed_selector:
+            seed_cmd += ["--select", seed_selector]
+        _run_step(seed_cmd + ["--full-refresh"] + state_args + profile_args)
+    model_args = ["--models", selector] if selector else []
+    if exclude:
+        model_args += ["--exclude", exclude]
+    _run_step(
+        ["run"]
+        + model_args
+        + full_refresh_args
+        + ["--fail-fast"]
+        + defer_args
+        + state_args
+        + profile_args
+    )
+    _run_step(
+        ["test"]
+        + model_args
+        + (["--fail-fast"] if fail_fast_tests else [])
+        + defer_args
+        + state_args
+        + profile_args
+    )
+
 
+def cli_record_run_results(schedule, commit_hash, since=None, target_path=None):
+    """Store the node timings from the last dbt command in the warehouse.
+
+    By default, dbt's artifacts are in the project's target path.
+    Pass `target_path` if the command wrote them elsewhere (e.g. an
+    isolated refresh).
+    """
+    target_dir = target_path or schedule.project_path(schedule.project.target_path)
+    results_path = os.path.join(target_dir, "run_results.json")
+    # Don't record stale results if dbt didn't get as far as writing them.
+    if not os.path.exists(results_path) or (
+        since and os.path.getmtime(results_path) < since
+    ):
+        click.secho("No run results to record.", fg="yellow")
+        return
+    try:
+        with open(results_path, encoding="utf8") as results_file:
+            timings = parse_run_results(results_file.read())
+        # Work out which schema each node belongs to from its path.
+        node_paths = {}
+        manifest_path = os.path.join(target_dir, "manifest.json")
+        if os.path.exists(manifest_path):
+            with open(manifest_path, "rb") as manifest_file:
+                node_paths = manifest_node_paths(manifest_file)
+        for timing in timings:
+            schemas = schedule.path_index.match(node_paths.get(timing.node, ""))
+            timing.schema = min(schemas) if schemas else None
+        schedule.warehouse.record_run_results(
+            project_name=schedule.name, commit_hash=commit_hash, timings=timings
+        )
+    except Exception as err:
+        # Timings are nice to have, but shouldn't stop a deploy.
+        click.secho(f"Failed to record run results: {err}", fg="yellow")
 
-def database_deploy(schedule, current_hash, defer_to_state, deploy_order):
+
+def cli_dbt_deps(schedule):
+    """Install dbt packages, only running dbt deps if they've changed."""
+    deps_manager = DepsManager(
+        project_dir=schedule.project_dir,
+        install_path=schedule.project.packages_install_path,
+    )
+    deps_manager.ensure(
+        lambda: cli_run_dbt_command(["deps", "--project-dir", schedule.project_path()])
+    )
+
+
+def schemawise_refresh(deploy_plan, schedule, manifest, current_hash, jobs=1):
+    """Refresh schemas, up to `jobs` at once.
+
+    If the schedule has a resource budget, schemas are only built
+    together while their weights fit in it, and each is built with
+    as many dbt threads as its weight (or the profile's threads if it
+    has none). A build with the budget to itself uses all of it.
+    Without a budget, builds use the profile's threads.
+    """
+    # dbt deps
+    cli_dbt_deps(schedule)
+    deploy_lock = threading.Lock()
+    budget = schedule.resources
+    weights = (
+        budget.weights(schedule.get_schema(name) for name in deploy_plan)
+        if budget
+        else None
+    )
+    # Only one build at a time, so it can have every slot.
+    alone = jobs == 1 or len(deploy_plan) == 1
+
+    def _build_db(schema_name):
+        schema = schedule.get_schema(schema_name)
+        build_db = (
+            schema.build_config.get("database", None)
+            or schedule.build_config["database"]
+        )
+        # When building in parallel, each schema needs its own build database.
+        if jobs > 1:
+            build_db += "_" + schema_name
+        return build_db
+
+    def _refresh(schema_name):
+        with tracing.tag(schema=schema_name), tracing.span("refresh_schema"):
+            refresh_schema(
+                schema_name,
+                schedule,
+                manifest,
+                current_hash,
+                build_db=_build_db(schema_name),
+                deploy_lock=deploy_lock,
+                isolated=jobs > 1,
+                threads=(
+                    budget.threads(weights.get(schema_name), alone=alone)
+                    if budget
+                    else None
+                ),
+            )
+
+    # Start the longest chains of work first.
+    durations = schedule.estimate_durations(manifest=manifest, schemas=deploy_plan)
+    priorities = schedule.critical_path_priorities(deploy_plan, durations)
+    dependencies = schedule.plan_dependencies(deploy_plan)
+    capacity = budget.slots if budget else None
+    predicted = simulate_dag(
+        dependencies, durations, jobs, priorities, weights=weights, capacity=capacity
+    )
+    click.secho(f"Predicted refresh time: {format_duration(predicted)}", fg="cyan")
+    if jobs > 1:
+        click.secho(f"Refreshing with up to {jobs} concurrent jobs.", fg="cyan")
+        if budget:
+            click.secho(f"Within a budget of {budget.slots} slots.", fg="cyan")
+        try:
+            run_dag(
+                dependencies,
+                _refresh,
+                jobs=jobs,
+                priority=priorities,
+                on_interrupt=schedule.warehouse.cancel,
+                weights=weights,
+                capacity=capacity,
+            )
+        finally:
+            # Every refresh has stopped by now. Only cancel this run's
+            # queries, not those of later runs (e.g. when serving).
+            schedule.warehouse.clear_cancel()
+    else:
+        # Iterate Schemas to Deploy
+        for schema_name in schedule.determine_deploy_order(deploy_plan, durations):
+            _refresh(schema_name)
+
+
+def database_deploy(
+    schedule, current_hash, defer_to_state, deploy_order, live_manifest=None
+):
+    """Build and deploy the project, or the schemas in deploy_order.
+
+    If deferring to state and given the manifest of the live deploy, only
+    the modified nodes (and those downstream of them) in each schema are
+    rebuilt. Otherwise, each schema is rebuilt completely.
+    """
     # Do the deploy.
     build_timestamp = datetime.datetime.utcnow()
+    file_dict = {
+        # Use build context first
+        "profiles.yml": schedule.project.generate_profiles_yml(
+            database=schedule.build_config["database"],
+            schema=schedule.schema_prefix,
+        )
+    }
+    # With a budget, deploys (one dbt command at a time) use all of it,
+    # and full deploys may switch to a bigger warehouse.
+    budget = schedule.resources
+    threads = budget.threads(alone=True) if budget else None
+    deploy_size = budget.full_deploy_size if budget and not defer_to_state else None
+    # Only rebuild what's changed, compared to the live manifest.
+    incremental = bool(defer_to_state and live_manifest)
+    if incremental:
+        file_dict["manifest.json"] = live_manifest
     # Set up our config files
     with ConfigContext(
-        file_dict={
-            # Use build context first
-            "profiles.yml": schedule.project.generate_profiles_yml(
-                database=schedule.build_config["database"],
-                schema=schedule.schema_prefix,
-            )
-        }
+        file_dict=file_dict, config_path=schedule.project_path(".dbtease")
     ) as ctx:
-        profile_args = ["--profiles-dir", str(ctx)]
+        profile_args = dbt_project_args(schedule, ctx)
         # if we're going to upload docs, check we have access.
         if schedule.filestore:
             if not schedule.filestore.check_access():
@@ -422,11 +830,15 @@ def database_deploy(schedule, current_hash, defer_to_state, deploy_order):
                     "Access check to filestore failed. Make sure you have access."
                 )
         # dbt deps
-        cli_run_dbt_command(["deps"])
+        cli_dbt_deps(schedule)
         # Deploy
         # Try to get a lock on the build database
         click.secho("Acquiring Build Lock", fg="bright_blue")
-        with schedule.warehouse.lock(schedule.build_config["database"]):
+        with schedule.warehouse.lock(
+            schedule.build_config["database"]
+        ) as build_lease, schedule.warehouse.resized(
+            deploy_size, restore_size=budget.default_size if budget else None
+        ):
             if defer_to_state:
                 # NOTE: Although we only need to update the changed models, we still have to
                 # deploy monolithically do make sure dependencies don't break.
@@ -442,50 +854,79 @@ def database_deploy(schedule, current_hash, defer_to_state, deploy_order):
                     source=schedule.deploy_config["database"],
                 )
 
-                # Build each schema individually, but deploy in one transaction.
-                for idx, schema_name in enumerate(deploy_order):
+                # Everything else in the clone is unchanged, so it's
+                # only the selected nodes which need rebuilding.
+                state_args = {"state": str(ctx)} if incremental else {}
+                model_filter = "state:modified+" if incremental else None
+                seed_filter = "state:modified" if incremental else None
+                if incremental:
                     click.secho(
-                        f"BUILDING: {schema_name} [{idx + 1}/{len(deploy_order)}]",
+                        "Incremental deploy: only building modified nodes and their dependents.",
                         fg="cyan",
                     )
-                    schema = schedule.get_schema(schema_name)
-                    # run dbt seed
-                    cli_run_dbt_command(
-                        ["seed", "--select", schema.selector(), "--full-refresh"]
-                        + profile_args
-                    )
-                    # run dbt build --full-refresh
-                    cli_run_dbt_command(
-                        [
-                            "run",
-                            "--models",
-                            schema.selector(),
-                            "--full-refresh",
-                            "--fail-fast",
-                        ]
-                        + profile_args
-                    )
-                    # run dbt test
-                    cli_run_dbt_command(
-                        ["test", "--models", schema.selector()] + profile_args
+
+                if schedule.dbt_build:
+                    # One dbt build for all the schemas, letting dbt order them.
+                    click.secho(f"BUILDING: {', '.join(deploy_order)}", fg="cyan")
+                    schemas = [
+                        schedule.get_schema(schema_name) for schema_name in deploy_order
+                    ]
+                    cli_run_dbt_phase(
+                        schedule,
+                        " ".join(schema.selector(model_filter) for schema in schemas),
+                        profile_args,
+                        seed_selector=" ".join(
+                            schema.selector(seed_filter) for schema in schemas
+                        ),
+                        full_refresh=True,
+                        commit_hash=current_hash,
+                        threads=threads,
+                        **state_args,
                     )
+                else:
+                    # Build each schema individually, but deploy in one transaction.
+                    for idx, schema_name in enumerate(deploy_order):
+                        click.secho(
+                            f"BUILDING: {schema_name} [{idx + 1}/{len(deploy_order)}]",
+                            fg="cyan",
+                        )
+                        schema = schedule.get_schema(schema_name)
+                        # seed, run and test with --full-refresh
+                        with tracing.tag(schema=schema_name):
+                            cli_run_dbt_phase(
+                                schedule,
+                                schema.selector(model_filter),
+                                profile_args,
+                                seed_selector=schema.selector(seed_filter),
+                                full_refresh=True,
+                                commit_hash=current_hash,
+                                threads=threads,
+                                **state_args,
+                            )
             else:
                 # make sure we've got a database to work with.
                 click.secho("Initialising build database", fg="bright_blue")
                 schedule.warehouse.create_wipe_db(schedule.build_config["database"])
-                # run dbt seed
-                cli_run_dbt_command(["seed", "--full-refresh"] + profile_args)
                 # run dbt snapshot?
-                # run dbt build --full-refresh
-                cli_run_dbt_command(
-                    ["run", "--full-refresh", "--fail-fast"] + profile_args
+                # seed, run and test with --full-refresh
+                cli_run_dbt_phase(
+                    schedule,
+                    None,
+                    profile_args,
+                    seed_selector="",
+                    full_refresh=True,
+                    commit_hash=current_hash,
+                    threads=threads,
                 )
-                # run dbt test
-                cli_run_dbt_command(["test"] + profile_args)
 
             # Get lock on deploy DB
             click.secho("Acquiring Deploy Lock", fg="bright_blue")
-            with schedule.warehouse.lock(schedule.deploy_config["database"]):
+            with schedule.warehouse.lock(
+                schedule.deploy_config["database"]
+            ) as deploy_lease:
+                # Don't swap if either lock was lost while we waited.
+                build_lease.check()
+                deploy_lease.check()
                 # Deploy
                 click.secho("Deploying...", fg="bright_blue")
                 schedule.warehouse.deploy(
@@ -506,6 +947,9 @@ def database_deploy(schedule, current_hash, defer_to_state, deploy_order):
 
         # Update to deploy context to build and update docs.
         click.secho("Updating to deploy context", fg="bright_blue")
+        docs_files = target_files(
+            schedule, "manifest.json", "catalog.json", "index.html"
+        )
         with ctx.patch_files(
             {
                 "profiles.yml": schedule.project.generate_profiles_yml(
@@ -518,9 +962,7 @@ def database_deploy(schedule, current_hash, defer_to_state, deploy_order):
             # For the same reason we still need profile args.
             cli_run_dbt_command(["docs", "generate"] + profile_args)
             # Stash the docs and the manifest
-            ctx.stash_files(
-                "target/manifest.json", "target/catalog.json", "target/index.html"
-            )
+            ctx.stash_files(*docs_files)
             # Get manifest
             manifest = ctx.read_file("manifest.json")
             # Build docs and update manifest.
@@ -533,9 +975,7 @@ def database_deploy(schedule, current_hash, defer_to_state, deploy_order):
         # Upload docs here.
         if schedule.filestore:
             click.secho("Uploading Docs.", fg="bright_blue")
-            schedule.filestore.upload_files(
-                "target/manifest.json", "target/catalog.json", "target/index.html"
-            )
+            schedule.filestore.upload_files(*docs_files)
             schedule.handle_event(
                 "upload_docs_success",
                 success=True,
@@ -549,26 +989,34 @@ def database_deploy(schedule, current_hash, defer_to_state, deploy_order):
 @click.option("--profiles-dir", default="~/.dbt/")
 @click.option("--schedule-dir", default=None)
 @click.option("-s", "--schema", default=None)
-def refresh(project_dir, profiles_dir, schedule_dir, schema):
+@click.option(
+    "-j",
+    "--jobs",
+    default=1,
+    type=click.IntRange(min=1),
+    help="Number of schemas to refresh concurrently.",
+)
+@click.option(
+    "--lock-timeout",
+    default=None,
+    type=click.FloatRange(min=0),
+    help="Wait up to this many seconds for locks, rather than failing if they're taken.",
+)
+def refresh(project_dir, profiles_dir, schedule_dir, schema, jobs, lock_timeout):
     """Runs an appropriate refresh of the existing state."""
     schedule, status_dict = common_setup(
-        project_dir, profiles_dir, schedule_dir, deploy=False
+        project_dir,
+        profiles_dir,
+        schedule_dir,
+        deploy=False,
+        lock_timeout=lock_timeout,
     )
     # Output the status.
     echo_status(status_dict, schedule.name)
     # Validate state
-    deployed_hash = status_dict["deployed_hash"]
-    current_hash = status_dict["current_hash"]
-    if deployed_hash != current_hash:
-        raise click.UsageError(
-            f"Deployed hash is {deployed_hash}. "
-            "Return to that commit to run refresh."
-        )
-    if status_dict["dirty_tree"]:
-        raise click.UsageError(
-            "Uncommitted Git changes. Please "
-            "stash or discard changes to run refresh."
-        )
+    problem = refresh_problem(status_dict)
+    if problem:
+        raise click.UsageError(problem)
 
     if schema:
         schema_options = {name for name, _ in schedule.iter_schemas()}
@@ -584,23 +1032,148 @@ def refresh(project_dir, profiles_dir, schedule_dir, schema):
         click.secho("No refreshes due...", fg="green")
     else:
         # Fetch manifest of current live build
-        manifest = schedule.warehouse.fetch_manifest(schedule.name, deployed_hash)
-        # If redeploy is due, then do a redeploy.
-        if status_dict["redeploy_due"]:
-            click.secho(
-                "WARNING: Full redeploy is due. This may take some time on a large project.",
-                fg="yellow",
+        manifest = schedule.warehouse.fetch_manifest(
+            schedule.name, status_dict["deployed_hash"]
+        )
+        run_refresh(schedule, status_dict, deploy_plan, manifest, jobs=jobs)
+    click.secho("DONE", fg="green")
+
+
+def refresh_problem(status_dict):
+    """Why we can't refresh in the current state, if we can't."""
+    deployed_hash = status_dict["deployed_hash"]
+    if deployed_hash != status_dict["current_hash"]:
+        return f"Deployed hash is {deployed_hash}. Return to that commit to run refresh."
+    if status_dict["dirty_tree"]:
+        return "Uncommitted Git changes. Please stash or discard changes to run refresh."
+    return None
+
+
+def run_refresh(schedule, status_dict, deploy_plan, manifest, jobs=1):
+    """Refresh the schemas in the plan, or redeploy if that's due."""
+    current_hash = status_dict["current_hash"]
+    # If redeploy is due, then do a redeploy.
+    if status_dict["redeploy_due"]:
+        click.secho(
+            "WARNING: Full redeploy is due. This may take some time on a large project.",
+            fg="yellow",
+        )
+        database_deploy(
+            schedule,
+            current_hash,
+            defer_to_state=False,
+            deploy_order=deploy_plan,
+        )
+    else:
+        click.secho(f"Refreshing schemas: {deploy_plan!r}", fg="cyan")
+        # Refresh cycle.
+        schemawise_refresh(deploy_plan, schedule, manifest, current_hash, jobs=jobs)
+
+
+@cli.command()
+@click.option("--project-dir", default=".")
+@click.option("--profiles-dir", default="~/.dbt/")
+@click.option("--schedule-dir", default=None)
+@click.option(
+    "-j",
+    "--jobs",
+    default=1,
+    type=click.IntRange(min=1),
+    help="Number of schemas to refresh concurrently.",
+)
+@click.option(
+    "--lock-timeout",
+    default=None,
+    type=click.FloatRange(min=0),
+    help="Wait up to this many seconds for locks, rather than failing if they're taken.",
+)
+@click.option(
+    "--max-sleep",
+    default=900,
+    type=click.FloatRange(min=1),
+    help="Check the deployed state at least this often (in seconds).",
+)
+@click.option(
+    "--retry-delay",
+    default=600,
+    type=click.FloatRange(min=0),
+    help="How long to wait (in seconds) before retrying a failed refresh.",
+)
+def serve(
+    project_dir, profiles_dir, schedule_dir, jobs, lock_timeout, max_sleep, retry_delay
+):
+    """Keep running, refreshing schemas as they fall due.
+
+    Unlike running `dbtease refresh` from cron, the schedule, warehouse
+    connections and live manifest are kept between refreshes, and we
+    sleep until the next refresh is due rather than polling.
+    """
+    schedule, status_dict = common_setup(
+        project_dir,
+        profiles_dir,
+        schedule_dir,
+        deploy=False,
+        lock_timeout=lock_timeout,
+    )
+    echo_status(status_dict, schedule.name)
+    # Stop cleanly on SIGTERM, once any refresh in progress has finished.
+    stop = threading.Event()
+
+    def _stop(signum, frame):
+        click.secho("Received SIGTERM. Stopping after this refresh.", fg="yellow")
+        stop.set()
+
+    signal.signal(signal.SIGTERM, _stop)
+    # The live manifest, and the hash it's for.
+    manifest_hash, manifest = None, None
+    while not stop.is_set():
+        wait = max_sleep
+        # Anything here can fail (e.g. if the warehouse is unreachable).
+        # If it does, keep serving and try again after the retry delay.
+        try:
+            if status_dict is None:
+                status_dict = schedule.status_dict(deploy=False)
+            problem = refresh_problem(status_dict)
+            deploy_plan = status_dict["refreshes_due"]
+            if problem:
+                click.secho(f"Unable to refresh: {problem}", fg="yellow")
+            elif deploy_plan or status_dict["redeploy_due"]:
+                if manifest_hash != status_dict["deployed_hash"]:
+                    manifest = schedule.warehouse.fetch_manifest(
+                        schedule.name, status_dict["deployed_hash"]
+                    )
+                    manifest_hash = status_dict["deployed_hash"]
+                with tracing.span("serve.refresh"):
+                    run_refresh(schedule, status_dict, deploy_plan, manifest, jobs=jobs)
+                # Check straight away whether anything else is due.
+                wait = 0
+            elif status_dict["next_due"]:
+                until_due = (
+                    status_dict["next_due"] - datetime.datetime.utcnow()
+                ).total_seconds()
+                wait = min(max(until_due, 1), max_sleep)
+        except Exception as err:
+            # Keep serving, but let people know.
+            click.secho(f"Refresh failed: {err}", fg="red")
+            schedule.handle_event(
+                "refresh_fail",
+                success=False,
+                message="Failed Refresh",
+                metadata={
+                    "error": str(err),
+                    "hash": status_dict["current_hash"] if status_dict else None,
+                },
             )
-            database_deploy(
-                schedule,
-                current_hash,
-                defer_to_state=False,
-                deploy_order=status_dict["deploy_order"],
+            wait = retry_delay
+        if wait:
+            click.secho(
+                f"Sleeping for {format_duration(wait, estimated=False)}.",
+                fg="bright_blue",
             )
-        else:
-            click.secho(f"Refreshing schemas: {deploy_plan!r}", fg="cyan")
-            # Refresh cycle.
-            schemawise_refresh(deploy_plan, schedule, manifest, current_hash)
+        if stop.wait(wait):
+            break
+        # Fetch the status afresh next time round.
+        status_dict = None
     click.secho("DONE", fg="green")
 
 
@@ -610,13 +1183,52 @@ def refresh(project_dir, profiles_dir, schedule_dir, schema):
 @click.option("--schedule-dir", default=None)
 @click.option("--aws-profile", default=None)
 @click.option("-f", "--force", is_flag=True, help="Force a full deploy cycle.")
-def deploy(project_dir, profiles_dir, schedule_dir, aws_profile, force):
+@click.option(
+    "--no-cache", is_flag=True, help="Always compile, ignoring cached manifests."
+)
+@click.option(
+    "--incremental",
+    is_flag=True,
+    help="On partial deploys, only rebuild modified models and their dependents.",
+)
+@click.option(
+    "--lock-timeout",
+    default=None,
+    type=click.FloatRange(min=0),
+    help="Wait up to this many seconds for locks, rather than failing if they're taken.",
+)
+def deploy(
+    project_dir,
+    profiles_dir,
+    schedule_dir,
+    aws_profile,
+    force,
+    no_cache,
+    incremental,
+    lock_timeout,
+):
     """Attempt to deploy the current commit as the new live version."""
     schedule, status_dict = common_setup(
-        project_dir, profiles_dir, schedule_dir, aws_profile=aws_profile
+        project_dir,
+        profiles_dir,
+        schedule_dir,
+        aws_profile=aws_profile,
+        lock_timeout=lock_timeout,
     )
     # Output the status.
     echo_status(status_dict, schedule.name)
+    run_deploy(
+        schedule,
+        status_dict,
+        force=force,
+        use_cache=not no_cache,
+        incremental=incremental,
+    )
+    click.secho("DONE", fg="green")
+
+
+def run_deploy(schedule, status_dict, force=False, use_cache=True, incremental=False):
+    """Deploy the current commit, rebuilding only what's changed if we can."""
     # Validate state
     deployed_hash = status_dict["deployed_hash"]
     current_hash = status_dict["current_hash"]
@@ -645,7 +1257,7 @@ def deploy(project_dir, profiles_dir, schedule_dir, aws_profile, force):
             "\nGenerating Manifest to plan deploy...",
             fg="cyan",
         )
-        plan, manifest = generate_plan(schedule, status_dict)
+        plan, manifest = generate_plan(schedule, status_dict, use_cache=use_cache)
         deploy_order = plan["deploy_order"]
         trigger_full_deploy = plan["trigger_full_deploy"]
 
@@ -665,7 +1277,6 @@ def deploy(project_dir, profiles_dir, schedule_dir, aws_profile, force):
                 message="Successful Non-Project Deploy",
                 metadata={"hash": current_hash},
             )
-            click.secho("\nDONE", fg="green")
             return
 
     if not deployed_hash or force or trigger_full_deploy:
@@ -687,8 +1298,241 @@ def deploy(project_dir, profiles_dir, schedule_dir, aws_profile, force):
         )
         defer_to_state = True
 
+    live_manifest = None
+    if defer_to_state and incremental:
+        # NOTE: This will usually come from the local cache.
+        live_manifest = schedule.warehouse.fetch_manifest(schedule.name, deployed_hash)
+
     # Do the deploy.
-    database_deploy(schedule, current_hash, defer_to_state, deploy_order)
+    database_deploy(
+        schedule,
+        current_hash,
+        defer_to_state,
+        deploy_order,
+        live_manifest=live_manifest,
+    )
+
+
+def echo_profile(title, rows, wall_time, limit):
+    click.echo(f"--- {title} ---")
+    click.echo(f"{'total (s)':>10} {'% wall':>7} {'count':>6} {'max (s)':>9}  name")
+    for key, count, total, longest in rows[:limit]:
+        share = 100 * total / wall_time if wall_time else 0
+        click.echo(f"{total:>10.1f} {share:>6.1f}% {count:>6} {longest:>9.1f}  {key}")
+
+
+@cli.command()
+@click.option(
+    "--trace-file",
+    default=tracing.DEFAULT_TRACE_PATH,
+    type=click.Path(exists=True, dir_okay=False),
+    help="The trace file to read.",
+)
+@click.option("--run-id", default=None, help="The run to profile. Defaults to the latest.")
+@click.option("-n", "--limit", default=20, help="Number of rows to show in each table.")
+def profile(trace_file, run_id, limit):
+    """Summarise where the time went in a previous run."""
+    spans = tracing.read_trace(trace_file, run_id=run_id)
+    if not spans:
+        raise click.UsageError(f"No traced runs found in {trace_file!r}.")
+    wall_time = tracing.wall_time(spans)
+    # Some tags are only set part way through the run.
+    tags = {}
+    for s in spans:
+        tags.update(s["tags"])
+    click.echo("=== dbtease profile ===")
+    for key, value in [
+        ("Run ID", spans[0]["run_id"]),
+        ("Command", tags.get("command")),
+        ("Deployment Name", tags.get("deployment")),
+        ("Commit Hash", tags.get("commit")),
+        ("Wall Time (s)", round(wall_time, 1)),
+        ("Failed Spans", sum(s["status"] != "ok" for s in spans)),
+    ]:
+        click.echo(f"{key}: {value}")
+    # NB: Spans nest and may run concurrently, so totals can exceed the wall time.
+    echo_profile("By Step", tracing.summarise_spans(spans), wall_time, limit)
+    by_schema = tracing.summarise_spans(spans, by="schema")
+    if by_schema:
+        echo_profile("By Schema", by_schema, wall_time, limit)
+
+
+@cli.group()
+def workspace():
+    """Run many deployments together, as set out in a workspace file."""
+
+
+def workspace_setup(workspace_dir, profiles_dir, lock_timeout=None, read_only=False):
+    workspace = Workspace.from_path(
+        workspace_dir, workspace_dir=workspace_dir, profiles_dir=profiles_dir
+    )
+    click.get_current_context().call_on_close(workspace.close)
+    for _, schedule in workspace.iter_schedules():
+        if lock_timeout is not None:
+            schedule.warehouse.lock_config = dataclasses.replace(
+                schedule.warehouse.lock_config, wait=True, timeout=lock_timeout
+            )
+        # Only commands which change things should create the state store.
+        if not read_only:
+            schedule.warehouse.ensure_state_store()
+    return workspace
+
+
+@workspace.command("status")
+@click.option("--workspace-dir", default=".")
+@click.option("--profiles-dir", default="~/.dbt/")
+def workspace_status(workspace_dir, profiles_dir):
+    """Outputs the status of every deployment in the workspace."""
+    workspace = workspace_setup(workspace_dir, profiles_dir, read_only=True)
+    for name, status_dict in workspace.status_dicts().items():
+        echo_status(status_dict, name)
+
+
+def workspace_actions(status_dicts, deploy=False):
+    """Work out whether each deployment needs a deploy or refresh."""
+    actions = {}
+    for name, status_dict in status_dicts.items():
+        problem = refresh_problem(status_dict)
+        if deploy and not status_dict["dirty_tree"] and problem:
+            actions[name] = "deploy"
+        elif problem:
+            click.secho(f"[{name}] Unable to refresh: {problem}", fg="yellow")
+        elif status_dict["refreshes_due"] or status_dict["redeploy_due"]:
+            actions[name] = "refresh"
+    return actions
+
+
+def workspace_run_action(deployment, action, status_dict):
+    """Deploy or refresh one deployment, using the status we already have."""
+    schedule = deployment.schedule
+    click.secho(f"[{schedule.name}] Running: dbtease {action}", fg="bright_blue")
+    with tracing.tag(deployment=schedule.name), tracing.span("workspace." + action):
+        if action == "deploy":
+            run_deploy(schedule, status_dict)
+        else:
+            manifest = schedule.warehouse.fetch_manifest(
+                schedule.name, status_dict["deployed_hash"]
+            )
+            run_refresh(schedule, status_dict, status_dict["refreshes_due"], manifest)
+
+
+@workspace.command("run")
+@click.option("--workspace-dir", default=".")
+@click.option("--profiles-dir", default="~/.dbt/")
+@click.option(
+    "--deploy",
+    is_flag=True,
+    help="Also deploy any deployments whose current commit isn't live.",
+)
+@click.option(
+    "--serve", is_flag=True, help="Keep running, sleeping until anything is due."
+)
+@click.option(
+    "--max-sleep",
+    default=900,
+    type=click.FloatRange(min=1),
+    help="When serving, check the deployed state at least this often (in seconds).",
+)
+@click.option(
+    "--retry-delay",
+    default=600,
+    type=click.FloatRange(min=0),
+    help="When serving, how long to wait (in seconds) before retrying a failed deployment.",
+)
+@click.option(
+    "--lock-timeout",
+    default=None,
+    type=click.FloatRange(min=0),
+    help="Wait up to this many seconds for locks, rather than failing if they're taken.",
+)
+def workspace_run(
+    workspace_dir,
+    profiles_dir,
+    deploy,
+    serve,
+    max_sleep,
+    retry_delay,
+    lock_timeout,
+):
+    """Refresh (and optionally deploy) every deployment which needs it.
+
+    Deploys and refreshes run concurrently in this process, up to the
+    `jobs` limit of the workspace overall and the limit for each warehouse.
+    """
+    workspace = workspace_setup(workspace_dir, profiles_dir, lock_timeout=lock_timeout)
+    stop = threading.Event()
+    if serve:
+
+        def _stop(signum, frame):
+            click.secho("Received SIGTERM. Stopping after this run.", fg="yellow")
+            stop.set()
+
+        signal.signal(signal.SIGTERM, _stop)
+    # When failed deployments can next be retried.
+    retry_after = {}
+    while not stop.is_set():
+        now = datetime.datetime.utcnow()
+        try:
+            status_dicts = workspace.status_dicts()
+        except Exception as err:
+            if not serve:
+                raise
+            # Keep serving (e.g. through a warehouse outage), but let people know.
+            click.secho(f"Failed to fetch status: {err}", fg="red")
+            for _, schedule in workspace.iter_schedules():
+                schedule.handle_event(
+                    "refresh_fail",
+                    success=False,
+                    message="Failed to fetch status",
+                    metadata={"error": str(err)},
+                )
+            click.secho(
+                f"Sleeping for {format_duration(retry_delay, estimated=False)}.",
+                fg="bright_blue",
+            )
+            stop.wait(retry_delay)
+            continue
+        actions = {
+            name: action
+            for name, action in workspace_actions(status_dicts, deploy=deploy).items()
+            if retry_after.get(name, now) <= now
+        }
+        if actions:
+            deployments = workspace.deployments
+            errors = run_limited(
+                {name: deployments[name].schedule.warehouse.compute for name in actions},
+                lambda name: workspace_run_action(
+                    deployments[name], actions[name], status_dicts[name]
+                ),
+                jobs=workspace.jobs,
+                group_jobs=workspace.warehouse_jobs,
+                default_group_jobs=workspace.default_warehouse_jobs,
+            )
+            failed = [name for name, err in errors.items() if err]
+            for name in failed:
+                click.secho(f"[{name}] {actions[name]} failed: {errors[name]}", fg="red")
+                retry_after[name] = now + datetime.timedelta(seconds=retry_delay)
+            if not serve:
+                if failed:
+                    raise click.ClickException(f"Failed: {', '.join(failed)}")
+                break
+            # Check straight away whether anything else is due.
+            continue
+        if not serve:
+            click.secho("Nothing due...", fg="green")
+            break
+        due_times = []
+        for name, status_dict in status_dicts.items():
+            if retry_after.get(name, now) > now:
+                due_times.append(retry_after[name])
+            elif status_dict["next_due"] and not refresh_problem(status_dict):
+                due_times.append(status_dict["next_due"])
+        until_due = (min(due_times) - now).total_seconds() if due_times else max_sleep
+        wait = min(max(until_due, 1), max_sleep)
+        click.secho(
+            f"Sleeping for {format_duration(wait, estimated=False)}.", fg="bright_blue"
+        )
+        stop.wait(wait)
     click.secho("DONE", fg="green")
 
 
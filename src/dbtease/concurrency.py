@@ -0,0 +1,188 @@
+"""Routines for running interdependent work concurrently."""
+
+import contextvars
+import heapq
+import logging
+from concurrent.futures import Future, ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger("dbtease.concurrency")
+
+
+def run_dag(
+    dependencies: Dict[str, Set[str]],
+    func: Callable[[str], None],
+    jobs: int = 1,
+    priority: Optional[Dict[str, float]] = None,
+    on_interrupt: Optional[Callable[[], None]] = None,
+    weights: Optional[Dict[str, float]] = None,
+    capacity: Optional[float] = None,
+) -> List[str]:
+    """Call func on every key of dependencies, respecting dependencies.
+
+    Each key is started as soon as all of the keys it depends on have
+    completed, with at most `jobs` running at any one time. Keys which
+    are ready at the same time are started highest `priority` first,
+    and otherwise in the order they appear in `dependencies`.
+
+    Given a `capacity`, keys are also only started while the total of
+    the `weights` of those running (default 1 each) fits within it. A
+    key heavier than the whole capacity can still run on its own.
+
+    If any call fails, nothing further is started, any calls already
+    in progress are allowed to finish and then the first error is raised.
+    If we're interrupted (e.g. by Ctrl-C), `on_interrupt` is called so that
+    the calls in progress can be stopped, before waiting on them.
+
+    Returns:
+        The keys in the order they completed.
+    """
+    pending = {key: set(deps) & set(dependencies) for key, deps in dependencies.items()}
+    completed: List[str] = []
+    running: Dict[Future, str] = {}
+    first_error = None
+    with ThreadPoolExecutor(max_workers=max(jobs, 1)) as executor:
+        try:
+            while pending or running:
+                if first_error is None:
+                    ready = [key for key, deps in pending.items() if not deps]
+                    if priority:
+                        ready.sort(key=lambda key: -priority.get(key, 0))
+                    for key in ready:
+                        if len(running) >= max(jobs, 1):
+                            break
+                        if not _fits(key, running.values(), weights, capacity):
+                            # Don't let lighter keys jump the queue.
+                            break
+                        del pending[key]
+                        logger.debug("Starting %r", key)
+                        # Run in a copy of our context so that tracing
+                        # tags carry over into the worker threads.
+                        context = contextvars.copy_context()
+                        running[executor.submit(context.run, func, key)] = key
+                if not running:
+                    if pending and first_error is None:
+                        raise ValueError(
+                            f"Unable to resolve dependencies for: {sorted(pending)!r}"
+                        )
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    key = running.pop(future)
+                    err = future.exception()
+                    if err is not None:
+                        logger.debug("Failed %r: %s", key, err)
+                        first_error = first_error or err
+                        continue
+                    completed.append(key)
+                    for deps in pending.values():
+                        deps.discard(key)
+        except KeyboardInterrupt:
+            if on_interrupt:
+                on_interrupt()
+            raise
+    if first_error is not None:
+        raise first_error
+    return completed
+
+
+def _fits(key, running, weights, capacity):
+    """Whether a key fits alongside those running, within the capacity."""
+    if capacity is None:
+        return True
+    weights = weights or {}
+    used = sum(weights.get(other, 1) for other in running)
+    return not used or used + weights.get(key, 1) <= capacity
+
+
+def simulate_dag(
+    dependencies: Dict[str, Set[str]],
+    durations: Dict[str, float],
+    jobs: int = 1,
+    priority: Optional[Dict[str, float]] = None,
+    weights: Optional[Dict[str, float]] = None,
+    capacity: Optional[float] = None,
+) -> float:
+    """Predict how long run_dag would take, given the duration of each key.
+
+    This follows the same rules as run_dag for which key starts next.
+
+    Returns:
+        The predicted total elapsed time (i.e. the makespan).
+    """
+    order = {key: idx for idx, key in enumerate(dependencies)}
+    priority = priority or {}
+    pending = {key: set(deps) & set(dependencies) for key, deps in dependencies.items()}
+    # Heaps of (priority, order, key) for ready keys and (finish time, key) for running ones.
+    ready: List[Tuple[float, int, str]] = []
+    running: List[Tuple[float, str]] = []
+    now = 0.0
+    while pending or ready or running:
+        for key in [key for key, deps in pending.items() if not deps]:
+            del pending[key]
+            heapq.heappush(ready, (-priority.get(key, 0), order[key], key))
+        while (
+            ready
+            and len(running) < max(jobs, 1)
+            and _fits(ready[0][2], [key for _, key in running], weights, capacity)
+        ):
+            _, _, key = heapq.heappop(ready)
+            heapq.heappush(running, (now + durations.get(key, 0.0), key))
+        if not running:
+            raise ValueError(f"Unable to resolve dependencies for: {sorted(pending)!r}")
+        now, key = heapq.heappop(running)
+        for deps in pending.values():
+            deps.discard(key)
+    return now
+
+
+def run_limited(
+    groups: Dict[str, str],
+    func: Callable[[str], None],
+    jobs: int = 1,
+    group_jobs: Optional[Dict[str, int]] = None,
+    default_group_jobs: Optional[int] = None,
+) -> Dict[str, Optional[BaseException]]:
+    """Call func on every key of groups, limiting how many run at once.
+
+    At most `jobs` calls run at any one time, and at most the limit for
+    each group (from `group_jobs`, or otherwise `default_group_jobs`) from
+    that group. Keys are started in the order they appear in `groups`,
+    skipping those whose group is full.
+
+    Unlike run_dag, a failing call doesn't stop the others.
+
+    Returns:
+        The error raised by each key, or None if it succeeded.
+    """
+    group_jobs = group_jobs or {}
+    pending = list(groups)
+    results: Dict[str, Optional[BaseException]] = {}
+    running: Dict[Future, str] = {}
+    group_running: Dict[str, int] = {}
+
+    def _has_capacity(group):
+        limit = group_jobs.get(group, default_group_jobs)
+        return limit is None or group_running.get(group, 0) < limit
+
+    with ThreadPoolExecutor(max_workers=max(jobs, 1)) as executor:
+        while pending or running:
+            for key in list(pending):
+                if len(running) >= max(jobs, 1):
+                    break
+                group = groups[key]
+                if not _has_capacity(group):
+                    continue
+                pending.remove(key)
+                group_running[group] = group_running.get(group, 0) + 1
+                logger.debug("Starting %r in %r", key, group)
+                context = contextvars.copy_context()
+                running[executor.submit(context.run, func, key)] = key
+            if not running:
+                raise ValueError(f"Group limits prevent running: {pending!r}")
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                key = running.pop(future)
+                group_running[groups[key]] -= 1
+                results[key] = future.exception()
+    return results
@@ -1,17 +1,136 @@
 """CRON routines."""
 
-# import logging
 import datetime
+import heapq
+from typing import Dict, List, Optional, Tuple, Union
+
 from crontab import CronTab
 
 
-def refresh_due(schedule: str, last_refresh: datetime.datetime) -> bool:
+class CronSchedule:
+    """A cron schedule, parsed once.
+
+    Schedules are either a cron expression, or a dict with
+    the expression under `cron` (as in the schedule file).
+    """
+
+    def __init__(self, schedule: Union[str, dict]):
+        if isinstance(schedule, dict):
+            schedule = schedule["cron"]
+        self.expression = schedule
+        self._cron = CronTab(schedule)
+
+    def __repr__(self):
+        return f"<CronSchedule: {self.expression}>"
+
+    def previous(self, now: datetime.datetime) -> datetime.datetime:
+        """The last time the schedule fired, at or before now."""
+        return now + datetime.timedelta(
+            seconds=self._cron.previous(now=now, default_utc=True)
+        )
+
+    def next(self, now: datetime.datetime) -> datetime.datetime:
+        """The next time the schedule fires, after now."""
+        return now + datetime.timedelta(
+            seconds=self._cron.next(now=now, default_utc=True)
+        )
+
+    def next_due(
+        self, last_refresh: Optional[datetime.datetime]
+    ) -> datetime.datetime:
+        """When a refresh falls due, given the last refresh.
+
+        If there's never been a refresh, it's been due forever.
+        """
+        if not last_refresh:
+            return datetime.datetime.min
+        return self.next(last_refresh)
+
+    def refresh_due(
+        self,
+        last_refresh: Optional[datetime.datetime],
+        now: Optional[datetime.datetime] = None,
+    ) -> bool:
+        """Work out whether a refresh is due based on cron and last refresh."""
+        if not last_refresh:
+            return True
+        return last_refresh < self.previous(now or datetime.datetime.utcnow())
+
+
+def refresh_due(
+    schedule: Union[str, dict, CronSchedule], last_refresh: datetime.datetime
+) -> bool:
     """Work out whether a refresh is due based on cron and last refresh."""
-    if not last_refresh:
-        return True
-    cron_expr = CronTab(schedule)
-    last_schedule_due = datetime.datetime.utcnow() - datetime.timedelta(
-        seconds=-cron_expr.previous(default_utc=True)
-    )
-    # logging.warning(f"SCHEDULE: {schedule}, LAST REFRESH: {last_refresh}, LAST DUE: {last_schedule_due}")
-    return last_refresh < last_schedule_due
+    if not isinstance(schedule, CronSchedule):
+        schedule = CronSchedule(schedule)
+    return schedule.refresh_due(last_refresh)
+
+
+def next_due(
+    schedule: Union[str, dict, CronSchedule],
+    last_refresh: Optional[datetime.datetime],
+) -> datetime.datetime:
+    """Work out when a refresh next falls due, based on cron and last refresh."""
+    if not isinstance(schedule, CronSchedule):
+        schedule = CronSchedule(schedule)
+    return schedule.next_due(last_refresh)
+
+
+class ScheduleIndex:
+    """The next due time of many schedules, ordered in a heap.
+
+    Due times only change when a last refresh does, so after
+    updating the last refreshes, finding what's due before a
+    given time costs O(log n) per result rather than evaluating
+    every schedule.
+    """
+
+    def __init__(self, schedules: Dict[str, CronSchedule]):
+        self.schedules = schedules
+        # NB: Superseded entries are left in the heap, and skipped.
+        self._heap: List[Tuple[datetime.datetime, str]] = []
+        self._due: Dict[str, datetime.datetime] = {}
+        self._last_refreshes: Dict[str, Optional[datetime.datetime]] = {}
+        for name in schedules:
+            self._set_due(name, None)
+
+    def _set_due(self, name, last_refresh):
+        self._last_refreshes[name] = last_refresh
+        due = self.schedules[name].next_due(last_refresh)
+        if self._due.get(name) != due:
+            self._due[name] = due
+            heapq.heappush(self._heap, (due, name))
+
+    def update(self, last_refreshes: Dict[str, Optional[datetime.datetime]]):
+        """Update the last refreshes, recalculating any which have changed."""
+        for name in self.schedules:
+            last_refresh = last_refreshes.get(name, None)
+            if last_refresh != self._last_refreshes[name]:
+                self._set_due(name, last_refresh)
+        # Don't let superseded entries build up indefinitely.
+        if len(self._heap) > 2 * len(self._due):
+            self._heap = [(due, name) for name, due in self._due.items()]
+            heapq.heapify(self._heap)
+
+    def _pop_stale(self):
+        while self._heap and self._due[self._heap[0][1]] != self._heap[0][0]:
+            heapq.heappop(self._heap)
+
+    def next_due(self) -> Optional[Tuple[datetime.datetime, str]]:
+        """The next due time, and what's due then (if anything is scheduled)."""
+        self._pop_stale()
+        return self._heap[0] if self._heap else None
+
+    def due_before(self, when: datetime.datetime) -> List[str]:
+        """Everything due at or before a time, soonest first."""
+        due: List[Tuple[datetime.datetime, str]] = []
+        self._pop_stale()
+        while self._heap and self._heap[0][0] <= when:
+            entry = heapq.heappop(self._heap)
+            if self._due[entry[1]] == entry[0]:
+                due.append(entry)
+            self._pop_stale()
+        # Put them back, they're still due.
+        for entry in due:
+            heapq.heappush(self._heap, entry)
+        return [name for _, name in due]
@@ -1,31 +1,184 @@
 """Methods for interacting with dbt."""
 
+import io
 import json
 import yaml
 import copy
+import datetime
+import hashlib
 import os.path
+import statistics
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import ijson
 
 from dbtease.common import YamlFileObject
 
 
+# Top level sections of the manifest which contain things we deploy.
+# NOTE: Seeds and snapshots are included in "nodes".
+MANIFEST_SECTIONS = ("nodes", "sources", "macros")
+# Node properties which vary between environments rather than with changes.
+VOLATILE_NODE_KEYS = {"root_path", "build_path", "compiled_path", "created_at", "deferred"}
+
+
+def _manifest_stream(manifest):
+    """Get a binary stream from a manifest string, bytes or file object."""
+    if isinstance(manifest, str):
+        return io.BytesIO(manifest.encode("utf8"))
+    elif isinstance(manifest, bytes):
+        return io.BytesIO(manifest)
+    return manifest
+
+
+def _iter_manifest_fingerprints(manifest):
+    """Stream (node, fingerprint, path) from a manifest.
+
+    This uses an incremental parser so that we never hold more than
+    one node's worth of the manifest in memory. The fingerprint is the
+    dbt checksum where the node has one, otherwise a digest of the
+    node's (non-volatile) content.
+    """
+    depth = 0
+    keys: List[str] = []
+    section = None
+    node = None
+    checksum = None
+    path = None
+    digest = None
+    for event, value in ijson.basic_parse(_manifest_stream(manifest)):
+        if event == "map_key":
+            del keys[depth - 1 :]
+            keys.append(value)
+            if depth == 1:
+                section = value if value in MANIFEST_SECTIONS else None
+            elif depth == 2 and section:
+                node, checksum, path = value, None, None
+                digest = hashlib.sha256()
+            continue
+        if event in ("end_map", "end_array"):
+            depth -= 1
+            if depth == 2 and node and digest:
+                yield node, checksum or digest.hexdigest(), path
+                node = None
+            continue
+        # Only process events inside a node, which aren't volatile.
+        if node and digest and depth >= 3 and keys[2] not in VOLATILE_NODE_KEYS:
+            digest.update(f"{keys[2:depth]}:{event}:{value}".encode("utf8"))
+            if depth == 3 and keys[2] == "original_file_path":
+                path = value
+            elif depth == 4 and keys[2:4] == ["checksum", "checksum"]:
+                checksum = value
+        if event in ("start_map", "start_array"):
+            depth += 1
+
+
 def diff_manifests(live_manifest, local_manifest):
-    live_manifest_obj = json.loads(live_manifest)
-    local_manifest_obj = json.loads(local_manifest)
-    node_names = set(live_manifest_obj["nodes"].keys()) | set(
-        local_manifest_obj["nodes"].keys()
-    )
+    """Compare two manifests, returning a list of changed (node, path) tuples.
+
+    Both manifests are streamed rather than loaded whole, and nodes
+    from the sources and macros sections are compared as well as
+    those in the nodes section.
+    """
+    live_fingerprints = {
+        node: (fingerprint, path)
+        for node, fingerprint, path in _iter_manifest_fingerprints(live_manifest)
+    }
     # A list of (node, path) tuples
     changed_nodes = []
-    for node in node_names:
-        live_node = live_manifest_obj["nodes"].get(node, {})
-        local_node = local_manifest_obj["nodes"].get(node, {})
-        path = live_node.get("original_file_path", None) or local_node.get(
-            "original_file_path", None
-        )
+    for node, fingerprint, path in _iter_manifest_fingerprints(local_manifest):
+        live_fingerprint, live_path = live_fingerprints.pop(node, (None, None))
         # Compare checksums
-        if live_node.get("checksum", None) != local_node.get("checksum", None):
-            changed_nodes.append((node, path))
-    return changed_nodes
+        if live_fingerprint != fingerprint:
+            changed_nodes.append((node, live_path or path))
+    # Anything left over has been deleted.
+    changed_nodes.extend(
+        (node, path) for node, (_, path) in live_fingerprints.items()
+    )
+    return sorted(changed_nodes)
+
+
+def manifest_node_paths(manifest) -> Dict[str, str]:
+    """Get the file path of every node in a manifest."""
+    return {
+        node: path for node, _, path in _iter_manifest_fingerprints(manifest) if path
+    }
+
+
+@dataclass
+class NodeTiming:
+    """The result of running a single node in dbt."""
+
+    node: str
+    status: str
+    execution_time: float
+    rows_affected: Optional[int] = None
+    # The dbtease schema the node belongs to, if known.
+    schema: Optional[str] = None
+    command: Optional[str] = None
+    invocation_id: Optional[str] = None
+    completed_at: Optional[datetime.datetime] = None
+
+
+def _parse_timestamp(value):
+    if not value:
+        return None
+    # dbt uses a trailing Z, which fromisoformat doesn't understand.
+    return datetime.datetime.fromisoformat(value.rstrip("Z"))
+
+
+def parse_run_results(run_results) -> List[NodeTiming]:
+    """Get the timings of each node from a run_results.json."""
+    if isinstance(run_results, (str, bytes)):
+        run_results = json.loads(run_results)
+    metadata = run_results.get("metadata", {})
+    command = run_results.get("args", {}).get("which")
+    timings = []
+    for result in run_results.get("results", []):
+        completed = [
+            step["completed_at"]
+            for step in result.get("timing", [])
+            if step.get("completed_at")
+        ]
+        timings.append(
+            NodeTiming(
+                node=result["unique_id"],
+                status=str(result.get("status")),
+                execution_time=result.get("execution_time") or 0.0,
+                rows_affected=(result.get("adapter_response") or {}).get(
+                    "rows_affected"
+                ),
+                command=command,
+                invocation_id=metadata.get("invocation_id"),
+                completed_at=_parse_timestamp(max(completed)) if completed else None,
+            )
+        )
+    return timings
+
+
+def estimate_schema_durations(timings: List[NodeTiming], recent=5) -> Dict[str, float]:
+    """Estimate how long each schema takes to build from past timings.
+
+    For each schema, each dbt command (e.g. run or test) is timed
+    separately as the sum of its node timings per invocation. The
+    estimate is the sum over commands of the median of the most
+    `recent` invocations.
+    """
+    # Mapping of (schema, command) to invocation totals, in order.
+    totals: Dict[tuple, Dict[str, float]] = {}
+    for timing in timings:
+        if not timing.schema:
+            continue
+        invocations = totals.setdefault((timing.schema, timing.command), {})
+        invocation = timing.invocation_id or ""
+        invocations[invocation] = invocations.get(invocation, 0.0) + timing.execution_time
+    durations: Dict[str, float] = {}
+    for (schema, _), invocations in totals.items():
+        durations[schema] = durations.get(schema, 0.0) + statistics.median(
+            list(invocations.values())[-recent:]
+        )
+    return durations
 
 
 class DbtProfiles(YamlFileObject):
@@ -86,10 +239,19 @@ class DbtProject(YamlFileObject):
     default_file_name = "dbt_project.yml"
     templated = False
 
-    def __init__(self, package_name, profile_name, profiles_dir="~/.dbt/"):
+    def __init__(
+        self,
+        package_name,
+        profile_name,
+        profiles_dir="~/.dbt/",
+        packages_install_path=None,
+        target_path="target",
+    ):
         self.package_name = package_name
         self.profile_name = profile_name
         self.profiles_dir = os.path.expanduser(profiles_dir)
+        self.packages_install_path = packages_install_path
+        self.target_path = target_path
 
     @classmethod
     def from_dict(cls, config, profiles_dir="~/.dbt/"):
@@ -98,6 +260,10 @@ class DbtProject(YamlFileObject):
             package_name=config["name"],
             profile_name=config["profile"],
             profiles_dir=profiles_dir,
+            # Older versions of dbt call this modules-path.
+            packages_install_path=config.get("packages-install-path", None)
+            or config.get("modules-path", None),
+            target_path=config.get("target-path", "target"),
         )
 
     def generate_profiles_yml(self, database=None, schema=None, target=None):
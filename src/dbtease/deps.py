@@ -0,0 +1,144 @@
+"""Management of installed dbt packages.
+
+Running `dbt deps` hits the package hub every time, even if nothing
+has changed. Instead we keep a copy of the installed packages in the
+local cache for each distinct packages.yml, and only run `dbt deps`
+when we haven't seen those packages before.
+"""
+
+import os
+import os.path
+import json
+import shutil
+import logging
+import tempfile
+from typing import Callable, Dict, Optional
+
+import yaml
+
+from dbtease.cache import default_cache_dir, digest
+
+logger = logging.getLogger("dbtease.deps")
+
+# Files which determine which packages get installed.
+PACKAGE_FILES = ("packages.yml", "package-lock.yml")
+# Default install paths for newer and older versions of dbt.
+DEFAULT_INSTALL_PATHS = ("dbt_packages", "dbt_modules")
+# Marker file written into the install path once installed.
+MARKER_FILE = ".dbtease_deps.json"
+
+
+class DepsManager:
+    """Installs dbt packages, skipping `dbt deps` where we can."""
+
+    def __init__(self, project_dir=".", install_path=None, cache_dir=None):
+        self.project_dir = project_dir
+        self.install_path = install_path
+        self.cache_dir = cache_dir or os.path.join(default_cache_dir(), "packages")
+
+    def packages_digest(self) -> Optional[str]:
+        """Digest of the package config, or None if there are no packages."""
+        content = []
+        for fname in PACKAGE_FILES:
+            try:
+                with open(os.path.join(self.project_dir, fname), "rb") as package_file:
+                    content.append(package_file.read())
+            except FileNotFoundError:
+                content.append(b"")
+        if not any(content):
+            return None
+        return digest(b"\0".join(content))
+
+    def _install_dir(self):
+        """Where dbt installs packages, relative to the project."""
+        if self.install_path:
+            return self.install_path
+        for install_path in DEFAULT_INSTALL_PATHS:
+            if os.path.isdir(os.path.join(self.project_dir, install_path)):
+                return install_path
+        return None
+
+    def _read_marker(self, install_dir) -> Dict:
+        try:
+            with open(os.path.join(install_dir, MARKER_FILE), encoding="utf8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    @staticmethod
+    def _resolved_versions(install_dir) -> Dict[str, str]:
+        """The name and version of each installed package."""
+        versions = {}
+        for package in sorted(os.listdir(install_dir)):
+            try:
+                with open(
+                    os.path.join(install_dir, package, "dbt_project.yml"),
+                    encoding="utf8",
+                ) as project_file:
+                    project = yaml.safe_load(project_file) or {}
+            except (OSError, yaml.YAMLError):
+                continue
+            versions[project.get("name", package)] = str(project.get("version", ""))
+        return versions
+
+    def _write_marker(self, install_dir, packages_digest):
+        marker = {
+            "digest": packages_digest,
+            "packages": self._resolved_versions(install_dir),
+        }
+        with open(os.path.join(install_dir, MARKER_FILE), "w", encoding="utf8") as f:
+            json.dump(marker, f)
+        return marker
+
+    def ensure(self, run_deps: Callable[[], None]) -> bool:
+        """Make sure packages are installed, calling run_deps if needed.
+
+        Returns:
+            True if run_deps was called.
+        """
+        packages_digest = self.packages_digest()
+        if not packages_digest:
+            logger.info("No packages configured. Skipping deps.")
+            return False
+
+        # Already installed?
+        install_path = self._install_dir()
+        if install_path:
+            install_dir = os.path.join(self.project_dir, install_path)
+            if self._read_marker(install_dir).get("digest") == packages_digest:
+                logger.info("Packages up to date. Skipping deps.")
+                return False
+
+        # Installed previously?
+        cache_dir = os.path.join(self.cache_dir, packages_digest)
+        cached = os.listdir(cache_dir) if os.path.isdir(cache_dir) else []
+        # Each cache entry should hold just the one install path.
+        if len(cached) == 1:
+            (install_path,) = cached
+            install_dir = os.path.join(self.project_dir, install_path)
+            logger.info("Restoring packages from cache: %r", cache_dir)
+            shutil.rmtree(install_dir, ignore_errors=True)
+            shutil.copytree(os.path.join(cache_dir, install_path), install_dir)
+            return False
+        if os.path.isdir(cache_dir):
+            logger.warning("Ignoring unexpected package cache: %r", cache_dir)
+            shutil.rmtree(cache_dir, ignore_errors=True)
+
+        run_deps()
+        install_path = self._install_dir()
+        if not install_path:
+            logger.warning("Unable to find installed packages to cache.")
+            return True
+        install_dir = os.path.join(self.project_dir, install_path)
+        marker = self._write_marker(install_dir, packages_digest)
+        logger.info("Installed packages: %r", marker["packages"])
+        # Copy to a temporary location first so the cache is never partial.
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(dir=self.cache_dir)
+        try:
+            shutil.copytree(install_dir, os.path.join(tmp_dir, install_path))
+            os.replace(tmp_dir, cache_dir)
+        except OSError as err:
+            logger.warning("Unable to cache packages: %s", err)
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        return True
@@ -1,18 +1,18 @@
 """Filestore connections.
 
-Eventually we should do something smart here to only load the
-ones we can given the installed libraries.
-
-That's a job for another day.
+Filestores are only imported when they're used, so that we
+don't pay for importing their libraries unless we need them.
 """
 
-from dbtease.filestores.local import LocalFilestore
-from dbtease.filestores.aws import S3Filestore
+from dbtease.plugins import PluginRegistry
 
-_filestore_options = {
-    "local": LocalFilestore,
-    "s3": S3Filestore,
-}
+filestore_registry = PluginRegistry(
+    "Filestores",
+    {
+        "local": "dbtease.filestores.local:LocalFilestore",
+        "s3": "dbtease.filestores.aws:S3Filestore",
+    },
+)
 
 
 def get_filestore_from_config(filestore_config, **kwargs):
@@ -20,8 +20,4 @@ def get_filestore_from_config(filestore_config, **kwargs):
     if not filestore_config:
         return None
     filestore_type, config = filestore_config.popitem()
-    if filestore_type not in _filestore_options:
-        raise ValueError(
-            f"Filestore of type {filestore_type} are not supported yet in dbtease."
-        )
-    return _filestore_options[filestore_type].from_dict(config, **kwargs)
+    return filestore_registry.get(filestore_type).from_dict(config, **kwargs)
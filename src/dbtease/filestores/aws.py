@@ -9,6 +9,7 @@ from botocore.exceptions import ClientError
 
 
 from dbtease.filestores.base import Filestore
+from dbtease.tracing import traced
 
 
 class S3Filestore(Filestore):
@@ -25,6 +26,7 @@ class S3Filestore(Filestore):
         # Optionally accept a profile argument
         self.profile = aws_profile
 
+    @traced("filestore.upload", "fname")
     def _upload_filestr(self, fname, content):
         session = boto3.Session(profile_name=self.profile)
         s3_client = session.client("s3")
@@ -37,6 +39,7 @@ class S3Filestore(Filestore):
             logging.error(e)
             raise e
 
+    @traced("filestore.upload_files", "paths")
     def upload_files(self, *paths: str):
         session = boto3.Session(profile_name=self.profile)
         s3_client = session.client("s3")
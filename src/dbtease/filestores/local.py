@@ -5,6 +5,7 @@ import os
 import os.path
 
 from dbtease.filestores.base import Filestore
+from dbtease.tracing import traced
 
 
 class LocalFilestore(Filestore):
@@ -22,6 +23,7 @@ class LocalFilestore(Filestore):
             return False
         return True
 
+    @traced("filestore.upload", "fname")
     def _upload_filestr(self, fname, content):
         # Make folder if it doesn't exist
         if not os.path.exists(self._local_path):
@@ -31,6 +33,7 @@ class LocalFilestore(Filestore):
         ) as dest_file:
             dest_file.write(content)
 
+    @traced("filestore.upload_files", "paths")
     def upload_files(self, *paths: str):
         for path in paths:
             _, fname = os.path.split(path)
@@ -0,0 +1,57 @@
+"""Matching of project file paths to schemas."""
+
+import posixpath
+from typing import Dict, Iterable, Set, Tuple
+
+# Key in each trie node for the names whose paths end at that node.
+_NAMES = None
+
+
+def split_path(path: str) -> Tuple[str, ...]:
+    """Normalise a relative path into its components.
+
+    This is purely lexical, so it doesn't touch the filesystem.
+    """
+    path = posixpath.normpath(path.replace("\\", "/"))
+    return tuple(part for part in path.split("/") if part not in ("", "."))
+
+
+class PathIndex:
+    """A trie of path components, for matching paths to schemas.
+
+    A path matches a schema if one of the schema's paths is a
+    prefix of it, comparing whole path components so that
+    `models/foo` matches `models/foo/bar.sql` but not `models/foobar.sql`.
+    """
+
+    def __init__(self):
+        self._root: Dict = {}
+
+    def add(self, path: str, name: str):
+        """Register a path prefix for a name."""
+        node = self._root
+        for part in split_path(path):
+            node = node.setdefault(part, {})
+        node.setdefault(_NAMES, set()).add(name)
+
+    def match(self, path: str) -> Set[str]:
+        """The names with a path prefix matching this path."""
+        names: Set[str] = set()
+        if not path:
+            return names
+        node = self._root
+        names |= node.get(_NAMES, set())
+        for part in split_path(path):
+            if part not in node:
+                break
+            node = node[part]
+            names |= node.get(_NAMES, set())
+        return names
+
+    def match_all(self, paths: Iterable[str]) -> Dict[str, Set[str]]:
+        """Match many paths at once, returning the paths matched by each name."""
+        matched: Dict[str, Set[str]] = {}
+        for path in paths:
+            for name in self.match(path):
+                matched.setdefault(name, set()).add(path)
+        return matched
@@ -0,0 +1,48 @@
+"""Lazy loading of backends.
+
+Backends (warehouses, filestores and alerters) often depend on
+large libraries, so they're registered by the path to import them
+from and only imported when a schedule actually uses them.
+"""
+
+import importlib
+import threading
+from typing import Dict, Union
+
+
+def load_plugin(path: str):
+    """Import an object from a "module:attribute" path."""
+    module_name, _, attribute = path.partition(":")
+    return getattr(importlib.import_module(module_name), attribute)
+
+
+class PluginRegistry:
+    """Backends of one kind, looked up by name and imported on first use."""
+
+    def __init__(self, kind: str, plugins: Dict[str, Union[str, type]]):
+        self.kind = kind
+        self._plugins = dict(plugins)
+        self._lock = threading.Lock()
+
+    def __contains__(self, name):
+        return name in self._plugins
+
+    def names(self):
+        return sorted(self._plugins)
+
+    def register(self, name: str, plugin: Union[str, type]):
+        """Add a backend, either as a class or a "module:Class" path."""
+        with self._lock:
+            self._plugins[name] = plugin
+
+    def get(self, name: str) -> type:
+        """The class for a backend, importing it if we haven't already."""
+        with self._lock:
+            if name not in self._plugins:
+                raise ValueError(
+                    f"{self.kind} of type {name} are not supported yet in dbtease."
+                )
+            plugin = self._plugins[name]
+            if isinstance(plugin, str):
+                plugin = self._plugins[name] = load_plugin(plugin)
+            return plugin
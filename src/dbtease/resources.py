@@ -0,0 +1,57 @@
+"""Budgeting how much of a warehouse builds may use at once."""
+
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+
+@dataclass
+class ResourceBudget:
+    """A budget of slots on a warehouse, shared between builds.
+
+    A slot is one dbt thread. Each schema build uses as many slots
+    as its weight, and runs dbt with that many threads. Schemas without
+    a weight count as one slot, but run with the profile's threads.
+    Concurrent builds are only started while their weights fit in the
+    budget. A build with the budget to itself (e.g. a full deploy, or
+    refreshing one schema at a time) uses every slot.
+    """
+
+    slots: int = 8
+    # Weight of schemas which don't set one, if any.
+    default_weight: Optional[int] = None
+    # Warehouse size to switch to for full deploys, if any (e.g. XLARGE).
+    full_deploy_size: Optional[str] = None
+    # The usual size of the warehouse, to switch back to afterward.
+    default_size: Optional[str] = None
+
+    def __post_init__(self):
+        # Restoring whatever size we found isn't safe if deploys overlap,
+        # because one may find the warehouse already resized by another.
+        if self.full_deploy_size and not self.default_size:
+            raise ValueError("Resources with a full_deploy_size need a default_size.")
+
+    def threads(self, weight: Optional[float] = None, alone=False) -> Optional[int]:
+        """The dbt threads for a build, or None for the profile's threads."""
+        if alone:
+            return self.slots
+        if weight is None:
+            return None
+        return max(1, min(int(weight), self.slots))
+
+    def weights(self, schemas) -> Dict[str, float]:
+        """The weight of each of some schemas which have one."""
+        weights = {}
+        for schema in schemas:
+            weight = schema.weight or self.default_weight
+            if weight:
+                weights[schema.name] = weight
+        return weights
+
+    @classmethod
+    def from_dict(cls, config: Dict, compute: Optional[str] = None):
+        """Load the budget, using the slots for the given warehouse if set."""
+        config = dict(config)
+        warehouse_slots = config.pop("warehouses", {})
+        if compute in warehouse_slots:
+            config["slots"] = warehouse_slots[compute]
+        return cls(**config)
@@ -1,20 +1,33 @@
 """Routines for loading the dbt_schedule.yml file."""
 
+import datetime
+import os.path
 import networkx as nx
 import logging
 import click
 
 from dbtease.schema import DbtSchema
+from dbtease.paths import PathIndex
 from dbtease.warehouses import get_warehouse_from_target
-from dbtease.dbt import DbtProfiles, DbtProject
+from dbtease.warehouses.base import LockConfig
+from dbtease.resources import ResourceBudget
+from dbtease.dbt import (
+    DbtProfiles,
+    DbtProject,
+    estimate_schema_durations,
+    manifest_node_paths,
+)
 from dbtease.git import get_git_state
 from dbtease.common import YamlFileObject
 from dbtease.filestores import get_filestore_from_config
-from dbtease.cron import refresh_due
+from dbtease.cron import CronSchedule, ScheduleIndex, refresh_due
 from dbtease.alerts import AlterterBundle
 
 logger = logging.getLogger("dbtease.schedule")
 
+# Guess at build time per node, for when we have no timings at all.
+DEFAULT_SECONDS_PER_NODE = 5.0
+
 
 class NotDagException(ValueError):
     pass
@@ -39,6 +52,8 @@ class DbtSchedule(YamlFileObject):
         redeploy_schedule=None,
         alerter_bundle=None,
         schema_prefix=None,
+        dbt_build=False,
+        resources=None,
     ):
         self.name = name
         self.graph = graph
@@ -52,6 +67,12 @@ class DbtSchedule(YamlFileObject):
         self.redeploy_schedule = redeploy_schedule
         self.alerter_bundle = alerter_bundle
         self.schema_prefix = schema_prefix
+        # Use `dbt build` rather than separate seed, run and test commands.
+        self.dbt_build = dbt_build
+        # Budget for builds on the warehouse, if configured.
+        self.resources = resources
+        self._path_index = None
+        self._schedule_index = None
 
     def handle_event(
         self, alert_event: str, success: bool, message: str, metadata=None
@@ -73,23 +94,50 @@ class DbtSchedule(YamlFileObject):
                 f"Schema {schema!r} is referred to but is not defined."
             )
 
+    def project_path(self, *parts):
+        """The absolute path to something in the dbt project.
+
+        dbt is given absolute paths, so that it finds everything
+        whichever directory we run it from (e.g. in a workspace).
+        """
+        return os.path.abspath(os.path.join(self.project_dir, *parts))
+
     def iter_schemas(self):
         for node_name in self.graph.nodes:
             yield node_name, self.get_schema(node_name)
 
-    def _iter_affected_schemas(self, paths):
-        for _, schema in self.iter_schemas():
-            matched_paths = schema.matches_paths(paths)
-            if matched_paths:
-                yield schema, matched_paths
+    @property
+    def path_index(self):
+        """An index of the paths of every schema, built on first use."""
+        if self._path_index is None:
+            self._path_index = PathIndex()
+            for schema_name, schema in self.iter_schemas():
+                for path in schema.paths:
+                    self._path_index.add(path, schema_name)
+        return self._path_index
+
+    @property
+    def schedule_index(self):
+        """An index of when each schema (and redeploy) is due, built on first use."""
+        if self._schedule_index is None:
+            schedules = {
+                schema_name: schema.cron
+                for schema_name, schema in self.iter_schemas()
+                if schema.cron
+            }
+            if self.redeploy_schedule:
+                schedules[self.warehouse.FULL_DEPLOY] = CronSchedule(
+                    self.redeploy_schedule
+                )
+            self._schedule_index = ScheduleIndex(schedules)
+        return self._schedule_index
 
     def _match_changed_files(self, changed_files):
         changed_files = set(changed_files)
         matched_files = set()
-        schema_files = {}
-        for schema, files in self._iter_affected_schemas(paths=changed_files):
+        schema_files = self.path_index.match_all(changed_files)
+        for files in schema_files.values():
             matched_files |= files
-            schema_files[schema.name] = files
         unmatched_files = changed_files - matched_files
         return schema_files, unmatched_files
 
@@ -104,15 +152,92 @@ class DbtSchedule(YamlFileObject):
     def materialized_schemas(self):
         return set(name for name, schema in self.iter_schemas() if schema.materialized)
 
-    def _determine_deploy_order(self, schemas):
-        deploy_order = []
-        for node in nx.topological_sort(self.graph):
+    def critical_path_priorities(self, schemas, durations=None):
+        """The length of the longest chain of work starting at each schema.
+
+        Only the schemas in the plan count towards the length, but chains
+        can pass through schemas which aren't in it. Without durations,
+        each schema in the plan counts as one.
+        """
+        priorities = {}
+        for node in reversed(list(nx.topological_sort(self.graph))):
+            weight = 0.0
             if node in schemas:
-                deploy_order.append(node)
-        return deploy_order
+                weight = durations.get(node, 0.0) if durations else 1.0
+            priorities[node] = weight + max(
+                (priorities[child] for child in self.graph.successors(node)),
+                default=0.0,
+            )
+        return priorities
+
+    def determine_deploy_order(self, schemas, durations=None):
+        """Order schemas so that the longest chains of work start first.
+
+        Ties are broken by name, so the order is deterministic.
+        """
+        priorities = self.critical_path_priorities(schemas, durations)
+        return [
+            node
+            for node in nx.lexicographical_topological_sort(
+                self.graph, key=lambda node: (-priorities[node], node)
+            )
+            if node in schemas
+        ]
+
+    def estimate_durations(self, manifest=None, history_days=7, schemas=None):
+        """Estimate how long it takes to build each schema, in seconds.
+
+        Recent timings are used where we have them. Otherwise we
+        fall back to the size of the schema in nodes (if we have a
+        manifest to count them), scaled by the time per node of the
+        schemas we have timings for.
+
+        If `schemas` are given and there's at most one of them, there's
+        nothing to order, so we don't fetch timings and just use sizes.
+        """
+        history = {}
+        if schemas is None or len(schemas) > 1:
+            since = datetime.datetime.utcnow() - datetime.timedelta(days=history_days)
+            history = estimate_schema_durations(
+                self.warehouse.get_invocation_timings(self.name, since=since)
+            )
+        sizes = {name: 0 if manifest else 1 for name, _ in self.iter_schemas()}
+        if manifest:
+            for path in manifest_node_paths(manifest).values():
+                for name in self.path_index.match(path):
+                    sizes[name] += 1
+        timed = [name for name in history if sizes.get(name)]
+        seconds_per_node = DEFAULT_SECONDS_PER_NODE
+        if timed:
+            seconds_per_node = sum(history[name] for name in timed) / sum(
+                sizes[name] for name in timed
+            )
+        return {
+            name: history.get(name, size * seconds_per_node)
+            for name, size in sizes.items()
+        }
+
+    def plan_dependencies(self, schemas):
+        """For each schema in a plan, which others in the plan must finish first.
+
+        Dependencies are transitive, so a schema still waits for an
+        upstream schema in the plan even if the schemas linking them
+        are not part of the plan.
+        """
+        plan_schemas = set(schemas)
+        return {
+            schema: nx.algorithms.dag.ancestors(self.graph, schema) & plan_schemas
+            for schema in schemas
+        }
+
+    def _plan_from_changed_files(
+        self, changed_files, deploy=True, durations=None, manifest=None
+    ):
+        """Generate a plan of attack from changed files.
 
-    def _plan_from_changed_files(self, changed_files, deploy=True):
-        """Generate a plan of attack from changed files."""
+        Without `durations`, they're estimated (given the new `manifest`)
+        for the schemas in the plan, if there are any.
+        """
         schema_files, unmatched_files = self._match_changed_files(changed_files)
         changed_schemas = {*schema_files.keys()}
         # Filter only to materialized schemas using set operators
@@ -121,18 +246,28 @@ class DbtSchedule(YamlFileObject):
         if not deploy:
             deploy_schemas &= self.materialized_schemas()
         # Lastly, for the changed and dependent schemas, we need to
-        # identify an appropriate order of operations.
-        # We do this by iterating a sorted generator on the graph.
-        # NOTE: This is not necessarily deterministic in the case
-        # that nodes have the same level in the tree, but I don't think
-        # that really matters at this stage.
+        # identify an appropriate order of operations. We start the
+        # schemas with the longest chain of work after them first.
         matched_schemas = changed_schemas | deploy_schemas
+        if durations is None and manifest and matched_schemas:
+            durations = self.estimate_durations(
+                manifest=manifest, schemas=matched_schemas
+            )
+        deploy_order = self.determine_deploy_order(matched_schemas, durations)
+        priorities = self.critical_path_priorities(matched_schemas, durations)
         return {
             "unmatched_files": unmatched_files,
             "matched_files": schema_files,
             "changed_schemas": changed_schemas,
             "dependent_deploy_schemas": deploy_schemas,
-            "deploy_order": self._determine_deploy_order(matched_schemas),
+            "deploy_order": deploy_order,
+            # Predictions in seconds if we have durations, otherwise in schemas.
+            "predicted_duration": sum(
+                durations.get(sch, 0.0) if durations else 1.0 for sch in deploy_order
+            ),
+            "critical_path": max(
+                (priorities[sch] for sch in deploy_order), default=0.0
+            ),
             "trigger_full_deploy": any(
                 self.get_schema(sch).triggers_full_deploy for sch in matched_schemas
             ),
@@ -145,38 +280,57 @@ class DbtSchedule(YamlFileObject):
             return False
         return refresh_due(self.redeploy_schedule, last_refresh)
 
-    def evaluate_schedules(self):
-        last_refreshes = self.warehouse.get_last_refreshes(self.name)
-        last_redeploy = last_refreshes.get(self.warehouse.FULL_DEPLOY, None)
-        refresh_due_schemas = [
-            schema_name
-            for schema_name, schema in self.iter_schemas()
-            if schema.refresh_due(last_refreshes.get(schema_name, None))
-        ]
+    def evaluate_schedules(self, last_refreshes=None, now=None):
+        """Work out what's due now, and when anything is next due.
+
+        The next due time is None if nothing is scheduled, and
+        no earlier than now if something's already due.
+        """
+        if last_refreshes is None:
+            last_refreshes = self.warehouse.get_last_refreshes(self.name)
+        now = now or datetime.datetime.utcnow()
+        index = self.schedule_index
+        index.update(last_refreshes)
+        refresh_due_schemas = set(index.due_before(now))
+        redeploy_due = self.warehouse.FULL_DEPLOY in refresh_due_schemas
+        refresh_due_schemas.discard(self.warehouse.FULL_DEPLOY)
+        next_due = index.next_due()
         return {
-            "redeploy_due": self.redeploy_due(last_redeploy),
-            "refreshes_due": self._determine_deploy_order(refresh_due_schemas),
+            "redeploy_due": redeploy_due,
+            "refreshes_due": self.determine_deploy_order(refresh_due_schemas),
+            "next_due": max(next_due[0], now) if next_due else None,
         }
 
-    def status_dict(self, deploy=True):
-        """Determine the current status of the repository."""
-        # Load state
-        deployed_hash = self.warehouse.get_current_deployed(self.name)
+    def status_dict(self, deploy=True, state=None):
+        """Determine the current status of the repository.
+
+        The warehouse state is fetched, unless it's provided
+        (e.g. having fetched it for many schedules at once).
+        """
+        # Load state (in one go)
+        if state is None:
+            state = self.warehouse.fetch_state(self.name)
         # Evaluate refreshes due
-        refreshes_due = self.evaluate_schedules()
+        refreshes_due = self.evaluate_schedules(last_refreshes=state.last_refreshes)
         # Introspect git status
         git_status = get_git_state(repo_dir=self.git_path)
         return {
-            "deployed_hash": deployed_hash,
+            "deployed_hash": state.deployed_hash,
+            "manifest_available": state.has_manifest,
+            "locks": state.locks,
             "current_hash": git_status["commit_hash"],
             "dirty_tree": git_status["dirty"],
             **refreshes_due,
         }
 
-    def generate_plan_from_paths(self, changed_files, deploy=True):
+    def generate_plan_from_paths(
+        self, changed_files, deploy=True, durations=None, manifest=None
+    ):
         """From differing paths, determine a plan."""
         # Adjust for project dir if we need to.
-        return self._plan_from_changed_files(changed_files, deploy=deploy)
+        return self._plan_from_changed_files(
+            changed_files, deploy=deploy, durations=durations, manifest=manifest
+        )
 
     @classmethod
     def from_dict(
@@ -241,6 +395,10 @@ class DbtSchedule(YamlFileObject):
             "project_dir": project_dir,
             "filestore": filestore,
         }
+        # Configure locking if provided.
+        if "locking" in config:
+            warehouse.lock_config = LockConfig(**config["locking"])
+
         # Use the git path if provided.
         if "git_path" in config:
             schedule_kwargs["git_path"] = config["git_path"]
@@ -255,6 +413,16 @@ class DbtSchedule(YamlFileObject):
         if "build" in config:
             schedule_kwargs["build_config"] = config["build"]
 
+        # Budget warehouse use if configured.
+        if "resources" in config:
+            schedule_kwargs["resources"] = ResourceBudget.from_dict(
+                config["resources"], compute=warehouse.compute
+            )
+
+        # Use dbt build if configured.
+        if "dbt_build" in config:
+            schedule_kwargs["dbt_build"] = config["dbt_build"]
+
         # Add redeploy schedule if present
         if "redeploy_schedule" in config:
             schedule_kwargs["redeploy_schedule"] = config["redeploy_schedule"]
@@ -1,8 +1,7 @@
 """Define the schema object."""
 
-import os.path
-
-from dbtease.cron import refresh_due
+from dbtease.cron import CronSchedule
+from dbtease.paths import PathIndex
 
 
 class DbtSchema:
@@ -16,6 +15,7 @@ class DbtSchema:
         build=None,
         schemas=None,
         triggers_full_deploy=False,
+        weight=None,
     ):
         self.name = name
         self.paths = paths
@@ -25,30 +25,43 @@ class DbtSchema:
         self.build_config = build or {}
         self.schemas = schemas or [name]
         self.triggers_full_deploy = triggers_full_deploy
+        # How much of the warehouse a build of this schema uses.
+        self.weight = weight
         if self.materialized and not self.schedule:
             raise ValueError(f"Schema {self.name} is materialized but has no schedule!")
+        self.cron = CronSchedule(schedule) if schedule else None
 
     def __repr__(self):
         return f"<DbtSchema: {self.name}>"
 
     def matches_paths(self, paths):
-        self_paths = [os.path.realpath(path) for path in self.paths]
-        matched_paths = set()
-        for self_path in self_paths:
-            matched_paths |= set(
-                path for path in paths if os.path.realpath(path).startswith(self_path)
-            )
-        return matched_paths
-
-    def selector(self):
+        path_index = PathIndex()
+        for path in self.paths:
+            path_index.add(path, self.name)
+        return path_index.match_all(paths).get(self.name, set())
+
+    def selector(self, intersect=None):
+        """A dbt selector for the schema.
+
+        Optionally intersected with another selector, e.g. to
+        select only the modified models in the schema.
+        """
         selectors = ["path:" + path for path in self.paths]
+        if intersect:
+            selectors = [f"{intersect},{selector}" for selector in selectors]
         return " ".join(selectors)
 
     def refresh_due(self, last_refresh):
         """Work out whether a refresh is due based on cron and last refresh."""
-        if not self.schedule:
+        if not self.cron:
             return False
-        return refresh_due(self.schedule, last_refresh)
+        return self.cron.refresh_due(last_refresh)
+
+    def next_due(self, last_refresh):
+        """Work out when a refresh is next due, or None if never."""
+        if not self.cron:
+            return None
+        return self.cron.next_due(last_refresh)
 
     @classmethod
     def from_dict(cls, name, config):
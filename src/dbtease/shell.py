@@ -1,14 +1,26 @@
 """Methods for running shell commands."""
 
+import os
+import os.path
+import signal
 import subprocess
+import threading
+import time
 import logging
-from typing import List
+import logging.handlers
+from collections import deque
+from typing import Deque, Dict, List, Optional
+
+from dbtease.tracing import span
 
 
 logger = logging.getLogger("dbtease.shell")
 
 cmd_logger = logging.getLogger("dbtease.shell.cmd")
 
+# How long to give a process to exit after we've asked it to stop.
+STOP_GRACE_SECONDS = 30
+
 
 def _process_line(line):
     # Turn from bytes to unicode for unicode chars
@@ -16,20 +28,117 @@ def _process_line(line):
     return line.rstrip()  # .decode("utf8")
 
 
-def _log_from(iterator, echo=None):
-    for raw_line in iterator:
+# One rotating handler per log file, shared by every command writing
+# to it, so that concurrent commands don't each rotate the file.
+_output_handlers: Dict[str, logging.handlers.RotatingFileHandler] = {}
+_output_handlers_lock = threading.Lock()
+
+
+def _output_handler(log_path, max_bytes, backup_count):
+    """The shared handler for a log file, creating it on first use."""
+    key = os.path.abspath(log_path)
+    with _output_handlers_lock:
+        if key not in _output_handlers:
+            log_dir = os.path.dirname(key)
+            os.makedirs(log_dir, exist_ok=True)
+            handler = logging.handlers.RotatingFileHandler(
+                key, maxBytes=max_bytes, backupCount=backup_count, encoding="utf8"
+            )
+            handler.setFormatter(logging.Formatter("%(asctime)s - %(message)s"))
+            _output_handlers[key] = handler
+        return _output_handlers[key]
+
+
+class _OutputLog:
+    """Writes the output of commands to a rotating log file."""
+
+    def __init__(self, log_path, max_bytes=10 * 1024 * 1024, backup_count=5):
+        self.handler = _output_handler(log_path, max_bytes, backup_count)
+
+    def write(self, stream_name, line):
+        # The handler serialises writes (and rollovers) under its own lock.
+        self.handler.handle(
+            logging.LogRecord(
+                name=cmd_logger.name,
+                level=logging.INFO,
+                pathname=__file__,
+                lineno=0,
+                msg="%s: %s",
+                args=(stream_name, line),
+                exc_info=None,
+            )
+        )
+
+    def close(self):
+        # The handler is shared with other commands, so just flush it.
+        self.handler.flush()
+
+
+def _drain(stream, stream_name, tail, echo=None, output_log=None):
+    """Read a stream to the end, keeping only the tail in memory."""
+    for raw_line in stream:
         # Echo the raw line if we have an echo function.
         if echo:
             echo(raw_line.rstrip())
         line = _process_line(raw_line)
         # Log as we go
         cmd_logger.debug(line)
-        yield line
+        if output_log:
+            output_log.write(stream_name, line)
+        tail.append(line)
+    stream.close()
 
 
-def run_shell_command(cmd: List[str], echo=None):
-    """Run a shell command, logging the output."""
+def _stop_process(process, sig=signal.SIGINT):
+    """Ask a process to stop, killing it if it doesn't."""
+    if process.poll() is not None:
+        return
+    logger.warning("Stopping process %s with signal %s", process.pid, sig)
+    process.send_signal(sig)
+    try:
+        process.wait(timeout=STOP_GRACE_SECONDS)
+    except subprocess.TimeoutExpired:
+        logger.warning("Process %s didn't stop. Killing.", process.pid)
+        process.kill()
+        process.wait()
+
+
+def run_shell_command(
+    cmd: List[str],
+    echo=None,
+    log_path: Optional[str] = None,
+    timeout: Optional[float] = None,
+    tail_lines: int = 500,
+):
+    """Run a shell command, logging the output.
+
+    stdout and stderr are read concurrently so that neither can fill
+    its pipe and block the process. Only the last `tail_lines` of each
+    are kept in memory, but if `log_path` is provided all output is
+    written there, in a rotating log file.
+
+    If the command takes longer than `timeout` seconds it is stopped and
+    subprocess.TimeoutExpired is raised. If we're interrupted or
+    terminated while waiting, the signal is passed on to the command
+    before we stop too.
+
+    Returns:
+        A tuple of the return code, and the tail of stdout and stderr.
+    """
     logger.debug("Command: %r", cmd)
+    # Name the span by the command and subcommand (e.g. "dbt run").
+    with span("command." + " ".join(cmd[:2]), command=" ".join(cmd)) as span_tags:
+        retcode, stdout_tail, stderr_tail = _run(
+            cmd, echo, log_path, timeout, tail_lines
+        )
+        span_tags["retcode"] = retcode
+    return retcode, stdout_tail, stderr_tail
+
+
+def _run(cmd, echo, log_path, timeout, tail_lines):
+    output_log = _OutputLog(log_path) if log_path else None
+    stdout_tail: Deque[str] = deque(maxlen=tail_lines)
+    stderr_tail: Deque[str] = deque(maxlen=tail_lines)
     # Start the process
     process = subprocess.Popen(
         cmd,
@@ -39,17 +148,58 @@ def run_shell_command(cmd: List[str], echo=None):
         universal_newlines=True,
         bufsize=1,
     )
-    # Cache for stdout lines, outputting as we go...
-    stdoutlines = []
-    if process.stdout:
-        stdoutlines = list(_log_from(process.stdout, echo=echo))
-
-    # Wait for command to finish
-    retcode = process.wait()
-
-    # Process stderr
-    stderrlines = []
-    if process.stderr:
-        stderrlines = [_process_line(line) for line in process.stderr]
+    readers = [
+        threading.Thread(
+            target=_drain,
+            args=(process.stdout, "stdout", stdout_tail),
+            kwargs={"echo": echo, "output_log": output_log},
+            daemon=True,
+        ),
+        threading.Thread(
+            target=_drain,
+            args=(process.stderr, "stderr", stderr_tail),
+            kwargs={"output_log": output_log},
+            daemon=True,
+        ),
+    ]
+    for reader in readers:
+        reader.start()
+
+    # Pass on SIGTERM to the command, if we can (signal
+    # handlers can only be set from the main thread).
+    previous_handler = None
+    if threading.current_thread() is threading.main_thread():
+
+        def _forward_sigterm(signum, frame):
+            logger.warning("Received SIGTERM. Passing on to command.")
+            process.send_signal(signal.SIGTERM)
+            # Let anything else listening know too.
+            if callable(previous_handler):
+                previous_handler(signum, frame)
+
+        previous_handler = signal.signal(signal.SIGTERM, _forward_sigterm)
+
+    started = time.monotonic()
+    try:
+        # Wait for command to finish. We wait in short increments so
+        # that we can respond to interrupts and timeouts.
+        while process.poll() is None:
+            if timeout is not None and time.monotonic() - started > timeout:
+                _stop_process(process)
+                raise subprocess.TimeoutExpired(cmd, timeout)
+            try:
+                process.wait(timeout=1)
+            except subprocess.TimeoutExpired:
+                pass
+    except KeyboardInterrupt:
+        _stop_process(process)
+        raise
+    finally:
+        if previous_handler is not None:
+            signal.signal(signal.SIGTERM, previous_handler)
+        for reader in readers:
+            reader.join()
+        if output_log:
+            output_log.close()
     # Don't check for success, just return with the relevant code
-    return retcode, stdoutlines, stderrlines
+    return process.returncode, list(stdout_tail), list(stderr_tail)
@@ -0,0 +1,240 @@
+"""Tracing of where the time goes during a dbtease run.
+
+Spans are written as JSON lines to a trace file and, if configured
+(and installed), exported to OpenTelemetry. Tags set with `tag()` or
+`set_tags()` are added to every span started within them, including
+those in worker threads started by `run_dag`.
+"""
+
+import contextvars
+import datetime
+import functools
+import inspect
+import json
+import logging
+import os
+import os.path
+import threading
+import time
+import uuid
+from contextlib import ExitStack, contextmanager
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger("dbtease.tracing")
+
+DEFAULT_TRACE_PATH = os.path.join("logs", "dbtease_trace.jsonl")
+
+_tags: contextvars.ContextVar = contextvars.ContextVar("dbtease_trace_tags", default={})
+_parent_id: contextvars.ContextVar = contextvars.ContextVar(
+    "dbtease_trace_parent", default=None
+)
+
+
+def _get_otel_tracer():
+    try:
+        from opentelemetry import trace
+    except ImportError:
+        logger.warning(
+            "OpenTelemetry export requested, but opentelemetry-api isn't installed."
+        )
+        return None
+    return trace.get_tracer("dbtease")
+
+
+class Tracer:
+    """Writes finished spans to a trace file and/or OpenTelemetry."""
+
+    def __init__(self, path=None, otel=False, max_bytes=50 * 1024 * 1024):
+        self.path = path
+        self.run_id = uuid.uuid4().hex
+        self.otel_tracer = _get_otel_tracer() if otel else None
+        self._lock = threading.Lock()
+        self._file = None
+        if path:
+            log_dir = os.path.dirname(path)
+            if log_dir:
+                os.makedirs(log_dir, exist_ok=True)
+            # Keep one old trace file once the current one gets big.
+            if os.path.exists(path) and os.path.getsize(path) > max_bytes:
+                os.replace(path, path + ".1")
+
+    @property
+    def enabled(self):
+        return bool(self.path or self.otel_tracer)
+
+    def write(self, record: Dict[str, Any]):
+        if not self.path:
+            return
+        line = json.dumps(record, default=str)
+        with self._lock:
+            if self._file is None:
+                self._file = open(self.path, "a", encoding="utf8")
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+_tracer = Tracer()
+
+
+def configure(path: Optional[str] = None, otel: bool = False) -> Tracer:
+    """Start tracing to a file and/or OpenTelemetry."""
+    global _tracer
+    _tracer.close()
+    _tracer = Tracer(path=path, otel=otel)
+    return _tracer
+
+
+def set_tags(**tags):
+    """Add tags to all spans in the current context from now on."""
+    _tags.set({**_tags.get(), **tags})
+
+
+@contextmanager
+def tag(**tags):
+    """Add tags to all spans started within this block."""
+    token = _tags.set({**_tags.get(), **tags})
+    try:
+        yield
+    finally:
+        _tags.reset(token)
+
+
+@contextmanager
+def span(name: str, **tags):
+    """Time a block of code.
+
+    Yields a dict to which further tags can be added (e.g. results)
+    before the span finishes.
+    """
+    tracer = _tracer
+    if not tracer.enabled:
+        yield {}
+        return
+    span_tags = {**_tags.get(), **tags}
+    span_id = uuid.uuid4().hex[:16]
+    parent_token = _parent_id.set(span_id)
+    status = "ok"
+    started_at = datetime.datetime.utcnow()
+    started = time.perf_counter()
+    try:
+        with ExitStack() as stack:
+            if tracer.otel_tracer:
+                stack.enter_context(
+                    tracer.otel_tracer.start_as_current_span(
+                        name,
+                        attributes={k: str(v) for k, v in span_tags.items()},
+                    )
+                )
+            yield span_tags
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        duration = time.perf_counter() - started
+        _parent_id.reset(parent_token)
+        tracer.write(
+            {
+                "run_id": tracer.run_id,
+                "span_id": span_id,
+                "parent_id": _parent_id.get(),
+                "name": name,
+                "start": started_at.isoformat(),
+                "duration": round(duration, 6),
+                "status": status,
+                "thread": threading.current_thread().name,
+                "tags": span_tags,
+            }
+        )
+
+
+def traced(name: str, *tag_args: str):
+    """Decorate a function to run in a span.
+
+    Args:
+        name: The name of the span.
+        tag_args: Names of arguments of the function to
+            add as tags on the span.
+    """
+
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _tracer.enabled:
+                return func(*args, **kwargs)
+            tags = {}
+            if tag_args:
+                arguments = signature.bind(*args, **kwargs).arguments
+                tags = {arg: arguments[arg] for arg in tag_args if arg in arguments}
+            with span(name, **tags):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def read_trace(path: str, run_id: Optional[str] = None):
+    """Read the spans of one run from a trace file.
+
+    If no run_id is given, the most recent run is returned.
+    """
+    spans = []
+    with open(path, encoding="utf8") as trace_file:
+        for line in trace_file:
+            line = line.strip()
+            if line:
+                spans.append(json.loads(line))
+    if not spans:
+        return []
+    run_id = run_id or spans[-1]["run_id"]
+    return [s for s in spans if s["run_id"] == run_id]
+
+
+def summarise_spans(spans, by=None):
+    """Summarise spans, either by span name or by a tag.
+
+    Returns:
+        A list of (key, count, total duration, max duration)
+        tuples, longest first. When summarising by tag, only
+        the outermost span with each value of the tag is counted.
+    """
+    by_id = {s["span_id"]: s for s in spans}
+    summary: Dict[str, list] = {}
+    for s in spans:
+        key = s["tags"].get(by) if by else s["name"]
+        if key is None:
+            continue
+        # Only count the outermost span for each tag, so
+        # nested spans aren't counted twice.
+        parent = by_id.get(s["parent_id"])
+        if by and parent and parent["tags"].get(by) == key:
+            continue
+        entry = summary.setdefault(str(key), [0, 0.0, 0.0])
+        entry[0] += 1
+        entry[1] += s["duration"]
+        entry[2] = max(entry[2], s["duration"])
+    return sorted(
+        ((key, count, total, longest) for key, (count, total, longest) in summary.items()),
+        key=lambda row: row[2],
+        reverse=True,
+    )
+
+
+def wall_time(spans) -> float:
+    """The elapsed time from the first span starting to the last finishing."""
+    if not spans:
+        return 0.0
+    starts = [datetime.datetime.fromisoformat(s["start"]) for s in spans]
+    ends = [
+        start + datetime.timedelta(seconds=s["duration"])
+        for start, s in zip(starts, spans)
+    ]
+    return (max(ends) - min(starts)).total_seconds()
@@ -1,20 +1,16 @@
 """Warehouse connections.
 
-Eventually we should do something smart here to only load the
-ones we can given the installed libraries.
-
-That's a job for another day.
+Warehouses are only imported when they're used, so that we
+don't pay for importing their libraries unless we need them.
 """
 
-from dbtease.warehouses.snowflake import SnowflakeWarehouse
+from dbtease.plugins import PluginRegistry
 
-_warehouse_options = {"snowflake": SnowflakeWarehouse}
+warehouse_registry = PluginRegistry(
+    "Warehouses",
+    {"snowflake": "dbtease.warehouses.snowflake:SnowflakeWarehouse"},
+)
 
 
 def get_warehouse_from_target(target_dict):
-    target_type = target_dict["type"]
-    if target_type not in _warehouse_options:
-        raise ValueError(
-            f"Warehouses of type {target_type} are not supported yet in dbtease."
-        )
-    return _warehouse_options[target_type].from_target(target_dict)
+    return warehouse_registry.get(target_dict["type"]).from_target(target_dict)
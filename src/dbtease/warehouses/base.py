@@ -1,15 +1,25 @@
 """Base warehouse class."""
 
 import datetime
+import logging
+import random
+import time
 
 from abc import ABC, abstractmethod
-from dataclasses import dataclass
-from typing import Union, Tuple, Dict, Optional, List
+from dataclasses import dataclass, field
+from typing import Hashable, Iterable, Union, Tuple, Dict, Optional, List
 
 import click
+import threading
 import uuid
 from contextlib import contextmanager
 
+from dbtease.concurrency import run_dag
+from dbtease.dbt import NodeTiming
+from dbtease.tracing import span
+
+logger = logging.getLogger("dbtease.warehouses")
+
 
 @dataclass
 class Sql:
@@ -29,10 +39,96 @@ class Sql:
         return repr(self.sql)
 
 
+@dataclass
+class WarehouseState:
+    """Snapshot of the stored state of a project."""
+
+    deployed_hash: Optional[str] = None
+    has_manifest: bool = False
+    last_refreshes: Dict[str, datetime.datetime] = field(default_factory=dict)
+    # Mapping of locked target to the process holding the lock.
+    locks: Dict[str, str] = field(default_factory=dict)
+
+
+@dataclass
+class LockConfig:
+    """How to acquire and hold locks.
+
+    Locks are leases which expire after `ttl_minutes` unless renewed,
+    which happens every `heartbeat_seconds` while they're held.
+    """
+
+    ttl_minutes: float = 10
+    heartbeat_seconds: float = 60
+    # Whether to wait for a lock, rather than failing straight away.
+    wait: bool = False
+    # How long to wait in seconds, or None to wait indefinitely.
+    timeout: Optional[float] = None
+    # Bounds on the delay between attempts, in seconds.
+    backoff_initial: float = 1
+    backoff_max: float = 60
+
+
+class _Heartbeat(threading.Thread):
+    """Renews a lock in the background until stopped."""
+
+    def __init__(self, warehouse, target, lock_key, ttl_minutes, interval):
+        super().__init__(name=f"heartbeat-{target}", daemon=True)
+        self.warehouse = warehouse
+        self.target = target
+        self.lock_key = lock_key
+        self.ttl_minutes = ttl_minutes
+        self.interval = interval
+        self.lost = False
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                renewed = self.warehouse.renew_lock(
+                    self.target, self.lock_key, ttl_minutes=self.ttl_minutes
+                )
+            except Exception as err:
+                # Try again next time, the lease should outlast a blip.
+                logger.warning("Failed to renew lock on %r: %s", self.target, err)
+                continue
+            if not renewed:
+                logger.error("Lost lock on %r. It may have expired.", self.target)
+                self.lost = True
+                return
+
+    def check(self):
+        """Make sure we still hold the lock, before doing anything irreversible.
+
+        This renews the lock there and then, rather than trusting the
+        last renewal, so the lease is fresh for what comes next.
+        """
+        if not self.lost:
+            self.lost = not self.warehouse.renew_lock(
+                self.target, self.lock_key, ttl_minutes=self.ttl_minutes
+            )
+        if self.lost:
+            raise click.ClickException(
+                f"Lock on {self.target!r} was lost while held. "
+                "Check for conflicting runs."
+            )
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+def _normalise_size(size: str) -> str:
+    # Sizes are e.g. "X-Large" from Snowflake, but "XLARGE" in config.
+    return size.replace("-", "").upper()
+
+
 class Warehouse(ABC):
     """Base interactions with warehouse."""
 
     FULL_DEPLOY = "<full-deploy>"
+    # Replaced (rather than modified) to configure locking.
+    lock_config = LockConfig()
 
     @abstractmethod
     def __init__(self, **kwargs):
@@ -42,10 +138,106 @@ class Warehouse(ABC):
     def from_target(cls, target_dict: Dict):
         return cls(**target_dict)
 
+    def ensure_state_store(self) -> None:
+        """Create or upgrade the state store if needed, before using it to deploy."""
+
+    def close(self) -> None:
+        """Release any connections held by the warehouse."""
+
+    def cancel(self) -> None:
+        """Cancel any queries running in other threads."""
+
+    def clear_cancel(self) -> None:
+        """Allow queries again after a cancel (e.g. for the next run)."""
+
+    def connection_stats(self) -> Dict[str, int]:
+        """Counts of connections and statements made so far."""
+        return {}
+
+    def get_warehouse_size(self) -> Optional[str]:
+        """The current size of the warehouse, if it can be resized."""
+        return None
+
+    def set_warehouse_size(self, size: str) -> None:
+        """Resize the warehouse, if it can be resized."""
+        logger.warning("%s can't be resized. Not resizing to %s.", type(self).__name__, size)
+
+    @contextmanager
+    def resized(self, size: Optional[str], restore_size: Optional[str] = None):
+        """Switch the warehouse to a size, and back again afterward.
+
+        It's switched back to `restore_size` if given. Otherwise it goes
+        back to its size beforehand, which is only right if nothing else
+        resizes it meanwhile (e.g. an overlapping deploy would see and
+        restore the bigger size).
+
+        Does nothing if no size is given, or if the warehouse
+        can't be resized.
+        """
+        current = self.get_warehouse_size() if size else None
+        if not size or not current:
+            if size:
+                logger.warning(
+                    "%s can't be resized. Not resizing to %s.", type(self).__name__, size
+                )
+            yield
+            return
+        restore_size = restore_size or current
+        if _normalise_size(current) != _normalise_size(size):
+            logger.info("Resizing warehouse from %s to %s", current, size)
+            self.set_warehouse_size(size)
+        try:
+            yield
+        finally:
+            if _normalise_size(restore_size) != _normalise_size(size):
+                logger.info("Resizing warehouse back to %s", restore_size)
+                self.set_warehouse_size(restore_size)
+
+    @property
+    def state_store(self) -> Hashable:
+        """Where state is stored, so that fetches sharing it can be batched."""
+        return id(self)
+
+    @property
+    def compute(self) -> str:
+        """What runs our queries, for limiting how many deploys use it at once."""
+        return type(self).__name__
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
     @abstractmethod
     def get_current_deployed(self, project_name: str) -> Optional[str]:
         ...
 
+    @abstractmethod
+    def get_last_refreshes(self, project_name: str) -> Dict[str, datetime.datetime]:
+        ...
+
+    def fetch_state(self, project_name: str) -> WarehouseState:
+        """Fetch all the state for a project.
+
+        Warehouses should override this to fetch everything in as
+        few round trips as possible.
+        """
+        deployed_hash = self.get_current_deployed(project_name)
+        return WarehouseState(
+            deployed_hash=deployed_hash,
+            has_manifest=bool(deployed_hash),
+            last_refreshes=self.get_last_refreshes(project_name),
+        )
+
+    def fetch_states(self, project_names: Iterable[str]) -> Dict[str, WarehouseState]:
+        """Fetch all the state for several projects.
+
+        Warehouses should override this to fetch everything in as
+        few round trips as possible.
+        """
+        return {name: self.fetch_state(name) for name in project_names}
+
     @abstractmethod
     def deploy(
         self,
@@ -59,37 +251,193 @@ class Warehouse(ABC):
         ...
 
     @abstractmethod
-    def acquire_lock(self, target: str, ttl_minutes=1) -> Optional[str]:
+    def record_run_results(
+        self, project_name: str, commit_hash: str, timings: List[NodeTiming]
+    ) -> None:
+        """Store the timings of the nodes in a dbt invocation."""
+        ...
+
+    @abstractmethod
+    def get_node_timings(
+        self, project_name: str, since: Optional[datetime.datetime] = None
+    ) -> List[NodeTiming]:
+        """Get stored node timings, oldest first."""
+        ...
+
+    def get_invocation_timings(
+        self, project_name: str, since: Optional[datetime.datetime] = None
+    ) -> List[NodeTiming]:
+        """Get stored timings totalled per schema, command and invocation.
+
+        Each timing has the total execution time of the schema's nodes
+        in one dbt invocation, oldest invocation first. Warehouses which
+        can should do the totalling themselves, rather than fetching
+        every node timing.
+        """
+        totals: Dict[tuple, NodeTiming] = {}
+        for timing in self.get_node_timings(project_name, since=since):
+            key = (timing.schema, timing.command, timing.invocation_id)
+            if key not in totals:
+                totals[key] = NodeTiming(
+                    node="",
+                    status="",
+                    execution_time=0.0,
+                    schema=timing.schema,
+                    command=timing.command,
+                    invocation_id=timing.invocation_id,
+                )
+            total = totals[key]
+            total.execution_time += timing.execution_time
+            total.completed_at = timing.completed_at
+        return list(totals.values())
+
+    @abstractmethod
+    def clone_schema(self, schema: str, destination: str, source: str) -> None:
+        ...
+
+    def clone_schemas(
+        self,
+        schemas: List[str],
+        destination: str,
+        source: str,
+        concurrency: int = 8,
+        progress=None,
+    ) -> None:
+        """Clone several schemas, with up to `concurrency` at once.
+
+        Args:
+            progress: Optional callback, called with the schema, the
+                number of clones done and the total as each finishes.
+        """
+        done = []
+        lock = threading.Lock()
+
+        def _clone(schema):
+            self.clone_schema(schema, destination, source=source)
+            with lock:
+                done.append(schema)
+                if progress:
+                    progress(schema, len(done), len(schemas))
+
+        run_dag(
+            {schema: set() for schema in schemas},
+            _clone,
+            jobs=concurrency,
+            on_interrupt=self.cancel,
+        )
+
+    @abstractmethod
+    def acquire_lock(
+        self, target: str, ttl_minutes: float = 10, lock_key: Optional[str] = None
+    ) -> Optional[str]:
+        """Try to acquire a lock, returning the lock key if we got it.
+
+        Locks should not be granted while others are queueing for
+        them, unless the lock key is at the front of the queue.
+        """
+        ...
+
+    @abstractmethod
+    def renew_lock(self, target: str, lock_key: str, ttl_minutes: float = 10) -> bool:
+        """Extend a lock we hold, returning False if we no longer hold it."""
         ...
 
     @abstractmethod
     def release_lock(self, target: str, lock_key: str) -> None:
         ...
 
+    def join_lock_queue(self, target: str, lock_key: str, ttl_minutes: float = 10) -> None:
+        """Join (or stay in) the queue for a lock.
+
+        Places in the queue expire after `ttl_minutes`, so
+        waiters must call this again as they wait.
+        """
+
+    def leave_lock_queue(self, target: str, lock_key: str) -> None:
+        """Leave the queue for a lock."""
+
+    def _acquire_lock_waiting(self, target: str, config: LockConfig) -> str:
+        """Acquire a lock, waiting in the queue for it if configured to."""
+        lock_key = str(uuid.uuid4())
+        delay = config.backoff_initial
+        started = time.monotonic()
+        try:
+            while True:
+                if config.wait:
+                    self.join_lock_queue(target, lock_key, ttl_minutes=config.ttl_minutes)
+                if self.acquire_lock(
+                    target=target, ttl_minutes=config.ttl_minutes, lock_key=lock_key
+                ):
+                    return lock_key
+                if not config.wait:
+                    raise click.ClickException(
+                        f"Unable to lock {target!r}. Someone else has the lock. Try again later."
+                    )
+                waited = time.monotonic() - started
+                if config.timeout is not None and waited >= config.timeout:
+                    raise click.ClickException(
+                        f"Unable to lock {target!r}. Timed out after {int(waited)}s."
+                    )
+                # Exponential backoff with jitter, so waiters don't retry in step.
+                pause = delay * random.uniform(0.5, 1.0)
+                if config.timeout is not None:
+                    pause = min(pause, config.timeout - waited)
+                logger.info("Waiting %.1fs for lock on %r", pause, target)
+                time.sleep(pause)
+                delay = min(delay * 2, config.backoff_max)
+        finally:
+            if config.wait:
+                self.leave_lock_queue(target, lock_key)
+
     @contextmanager
-    def lock(self, target: str, ttl_minutes: int = 1):
-        """Context Manager which implements acquire and release lock."""
-        lock_key = self.acquire_lock(target=target, ttl_minutes=ttl_minutes)
-        if not lock_key:
-            raise click.ClickException(
-                f"Unable to lock {target!r}. Someone else has the lock. Try again later."
-            )
+    def lock(self, target: str, config: Optional[LockConfig] = None):
+        """Context Manager which implements acquire and release lock.
+
+        While the lock is held, a background thread renews it, so
+        that it only expires if we stop running. If it's lost anyway,
+        the renewal can't stop the body of the `with`, so this yields
+        the lease: call its `check()` before anything irreversible
+        (e.g. a swap) to abort if the lock is no longer ours.
+        """
+        config = config or self.lock_config
+        with span("warehouse.lock_wait", target=target):
+            lock_key = self._acquire_lock_waiting(target, config)
+        heartbeat = _Heartbeat(
+            self,
+            target,
+            lock_key,
+            ttl_minutes=config.ttl_minutes,
+            # Renew well before the lock could expire.
+            interval=min(config.heartbeat_seconds, config.ttl_minutes * 60 / 3),
+        )
+        heartbeat.start()
         try:
-            yield
+            yield heartbeat
         finally:
+            heartbeat.stop()
             self.release_lock(target, lock_key)
+            if heartbeat.lost:
+                logger.error(
+                    "Lock on %r was lost while held. Check for conflicting runs.", target
+                )
 
 
 class DummyWarehouse(Warehouse):
     """Dummy warehouse for testing."""
 
-    def __init__(self, live_hash=None, **kwargs):
+    def __init__(self, live_hash=None, last_refreshes=None, **kwargs):
         self.live_hash = live_hash
+        self.last_refreshes = last_refreshes or {}
+        self.node_timings: List[NodeTiming] = []
+        self.clones: List[Tuple[str, str, str]] = []
         self._locks = {}
 
     def get_current_deployed(self, project_name: str) -> Optional[str]:
         return self.live_hash
 
+    def get_last_refreshes(self, project_name: str):
+        return dict(self.last_refreshes)
+
     def deploy(
         self,
         project_name: str,
@@ -100,12 +448,36 @@ class DummyWarehouse(Warehouse):
         build_timestamp: datetime.datetime,
     ) -> None:
         self.live_hash = commit_hash
+        for schema in schemas + [self.FULL_DEPLOY]:
+            self.last_refreshes[schema] = build_timestamp
 
-    def acquire_lock(self, target: str, ttl_minutes=1):
-        key = uuid.uuid4()
+    def record_run_results(
+        self, project_name: str, commit_hash: str, timings: List[NodeTiming]
+    ) -> None:
+        self.node_timings.extend(timings)
+
+    def get_node_timings(
+        self, project_name: str, since: Optional[datetime.datetime] = None
+    ) -> List[NodeTiming]:
+        return [
+            timing
+            for timing in self.node_timings
+            if not since or (timing.completed_at and timing.completed_at >= since)
+        ]
+
+    def clone_schema(self, schema: str, destination: str, source: str) -> None:
+        self.clones.append((schema, destination, source))
+
+    def acquire_lock(self, target: str, ttl_minutes=10, lock_key=None):
+        if target in self._locks:
+            return None
+        key = lock_key or str(uuid.uuid4())
         self._locks[target] = key
         return key
 
+    def renew_lock(self, target: str, lock_key: str, ttl_minutes=10):
+        return self._locks.get(target) == lock_key
+
     def release_lock(self, target: str, lock_key: str):
         if self._locks[target] == lock_key:
             del self._locks[target]
@@ -1,14 +1,21 @@
 """Snowflake warehouse connection class."""
 
+import gzip
+import os
 import time
 import datetime
 import logging
+import threading
 import snowflake.connector
 import uuid
 import click
-from typing import List, Optional
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Set, Tuple
 
-from dbtease.warehouses.base import Sql, Warehouse
+from dbtease.cache import FileCache, digest
+from dbtease.dbt import NodeTiming
+from dbtease.tracing import traced
+from dbtease.warehouses.base import Sql, Warehouse, WarehouseState
 
 logger = logging.getLogger("dbtease.warehouses.snowflake")
 
@@ -19,6 +26,24 @@ class SnowflakeWarehouse(Warehouse):
     # Locations for the state database
     state_database = "_dbtease_state"
     state_schema = "public"
+    # State stores known to exist, shared for the whole process.
+    _ready_state_stores: Set[Tuple[str, str]] = set()
+    # Pools of idle connections, shared by every instance connecting
+    # the same way (e.g. for different deployments in a workspace).
+    _pools: Dict[Tuple[str, str, str], Tuple[threading.Lock, list]] = {}
+    _pools_lock = threading.Lock()
+    # Error number for objects which don't exist (or we can't see).
+    OBJECT_DOES_NOT_EXIST = 2003
+    # Error number for columns which don't exist (e.g. in an older state store).
+    INVALID_IDENTIFIER = 904
+    # Stored manifests are split into chunks below the 8MB BINARY limit.
+    manifest_chunk_size = 4 * 1024 * 1024
+    # Rows of node timings per insert statement.
+    timings_batch_size = 1000
+    # Seconds between status checks of asynchronous queries.
+    poll_interval = 2
+    # Seconds between progress reports of long running queries.
+    progress_interval = 30
 
     def __init__(self, user, password, account, warehouse, schema, database, **kwargs):
         if "type" in kwargs:
@@ -34,8 +59,27 @@ class SnowflakeWarehouse(Warehouse):
         self.schema = schema
 
         self._first_connect = True
+        # Pool of idle, authenticated connections for reuse.
+        with self._pools_lock:
+            self._pool_lock, self._idle_connections = self._pools.setdefault(
+                (account, user, warehouse), (threading.Lock(), [])
+            )
+        # Counts of connections and statements, which may come from many threads.
+        self._stats_lock = threading.Lock()
+        self.connect_count = 0
+        self.statement_count = 0
+        # Local cache of downloaded manifests.
+        self.cache = FileCache()
+        # Timeout for long running (asynchronous) queries, in seconds.
+        query_timeout = os.environ.get("DBTEASE_QUERY_TIMEOUT")
+        self.query_timeout = float(query_timeout) if query_timeout else None
+        # Set to cancel asynchronous queries running in other threads.
+        self._cancelled = threading.Event()
 
+    @traced("warehouse.connect")
     def _connect(self, autocommit=True):
+        with self._stats_lock:
+            self.connect_count += 1
         con = snowflake.connector.connect(
             user=self.user,
             password=self.password,
@@ -50,6 +94,8 @@ class SnowflakeWarehouse(Warehouse):
             session_parameters={
                 "QUERY_TAG": "dbtease",
             },
+            # Keep pooled sessions alive over long dbt runs.
+            client_session_keep_alive=True,
         )
         if self._first_connect:
             version = (
@@ -66,46 +112,322 @@ class SnowflakeWarehouse(Warehouse):
             self._first_connect = False
         return con
 
+    @contextmanager
+    def _connection(self, autocommit=True):
+        """Borrow a connection from the pool, returning it afterward.
+
+        Connections are always returned to the pool in autocommit mode,
+        unless an error was raised while using them, in which case they're
+        closed instead.
+        """
+        con = None
+        with self._pool_lock:
+            while self._idle_connections and con is None:
+                con = self._idle_connections.pop()
+                if con.is_closed():
+                    con = None
+        if con is None:
+            con = self._connect(autocommit=True)
+        try:
+            if not autocommit:
+                con.autocommit(False)
+            yield con
+        except BaseException:
+            # We don't know what state it was left in, so don't reuse it.
+            con.close()
+            raise
+        if not con.is_closed():
+            if not autocommit:
+                con.autocommit(True)
+            with self._pool_lock:
+                self._idle_connections.append(con)
+
+    def _count_statement(self):
+        with self._stats_lock:
+            self.statement_count += 1
+
+    def close(self):
+        """Close all pooled connections."""
+        with self._pool_lock:
+            connections = self._idle_connections[:]
+            self._idle_connections.clear()
+        for con in connections:
+            con.close()
+        logger.info(
+            "Closed snowflake connections. Connects: %s, Statements: %s",
+            self.connect_count,
+            self.statement_count,
+        )
+
+    def connection_stats(self):
+        return {
+            "connects": self.connect_count,
+            "statements": self.statement_count,
+        }
+
     def _execute_sql(self, sql, params=None):
-        con = self._connect(autocommit=True)
+        self._count_statement()
         logger.debug("Executing: %s", sql)
         if params and isinstance(sql, Sql) and sql.params:
             raise ValueError("Cannot use Sql.params and params in _execute_sql!")
-        elif isinstance(sql, Sql):
-            return con.cursor().execute(*sql).fetchall()
-        elif params:
-            return con.cursor().execute(sql, params).fetchall()
-        else:
-            return con.cursor().execute(sql).fetchall()
+        with self._connection(autocommit=True) as con:
+            if isinstance(sql, Sql):
+                return con.cursor().execute(*sql).fetchall()
+            elif params:
+                return con.cursor().execute(sql, params).fetchall()
+            else:
+                return con.cursor().execute(sql).fetchall()
+
+    def _execute_async(self, sql, params=None):
+        """Execute a long running statement asynchronously.
+
+        We poll for completion, logging progress, so that if we're
+        interrupted, cancelled or time out we can cancel the query
+        rather than leaving it running.
+        """
+        self._count_statement()
+        logger.debug("Executing (async): %s", sql)
+        with self._connection(autocommit=True) as con:
+            cur = con.cursor()
+            cur.execute_async(sql, params)
+            query_id = cur.sfqid
+            logger.info("Started query %s", query_id)
+            started = last_report = time.monotonic()
+            try:
+                while con.is_still_running(con.get_query_status(query_id)):
+                    now = time.monotonic()
+                    if self._cancelled.is_set():
+                        raise click.ClickException(f"Query {query_id} cancelled.")
+                    if self.query_timeout and now - started > self.query_timeout:
+                        raise click.ClickException(
+                            f"Query {query_id} timed out after {self.query_timeout}s."
+                        )
+                    if now - last_report >= self.progress_interval:
+                        logger.info(
+                            "Query %s still running after %ss", query_id, int(now - started)
+                        )
+                        last_report = now
+                    time.sleep(self.poll_interval)
+            except BaseException:
+                logger.warning("Cancelling query %s", query_id)
+                try:
+                    con.cursor().execute("SELECT SYSTEM$CANCEL_QUERY(%s)", (query_id,))
+                except Exception as err:
+                    logger.error("Failed to cancel query %s: %s", query_id, err)
+                raise
+            # Raises if the query failed.
+            con.get_query_status_throw_if_error(query_id)
+            logger.info(
+                "Query %s finished in %ss", query_id, int(time.monotonic() - started)
+            )
+            cur.get_results_from_sfqid(query_id)
+            return cur.fetchall()
+
+    def cancel(self):
+        """Cancel asynchronous queries running in other threads.
+
+        After this, any further asynchronous queries are also cancelled,
+        until `clear_cancel` is called.
+        """
+        self._cancelled.set()
+
+    def clear_cancel(self):
+        self._cancelled.clear()
 
     def _execute_transaction(self, *statements):
         """Execute a series of statements in a transaction.
 
         https://docs.snowflake.com/en/user-guide/python-connector-example.html#using-context-manager-to-connect-and-control-transactions
         """
-        con = self._connect(autocommit=False)
-        logger.debug("Starting Transaction...")
+        with self._connection(autocommit=False) as con:
+            logger.debug("Starting Transaction...")
+            try:
+                for statement in statements:
+                    self._count_statement()
+                    logger.debug("Executing: %s", statement)
+                    if isinstance(statement, Sql):
+                        con.cursor().execute(*statement)
+                    else:
+                        con.cursor().execute(statement)
+                logger.debug("Committing Transaction...")
+                con.commit()
+            except Exception as e:
+                logger.debug("Rolling Back Transaction...")
+                con.rollback()
+                raise e
+
+    def _table(self, table_name):
+        """Fully qualified name of a table in the state store.
+
+        Pooled connections may have been opened before the state store
+        existed, so we can't rely on their default database.
+        """
+        return f"{self.state_database}.{self.state_schema}.{table_name}"
+
+    # A column from the latest version of each state table.
+    _state_store_columns = [
+        ("live_deploys", "manifest_hash"),
+        ("last_refresh", "build_timestamp"),
+        ("database_locks", "lock_timeout"),
+        ("manifests", "chunk"),
+        ("manifest_history", "deployed_at"),
+        ("node_timings", "recorded_at"),
+        ("lock_queue", "expires_at"),
+    ]
+
+    def _state_store_up_to_date(self):
+        """Check in one query whether every state table and column exists."""
+        pairs = ", ".join(["(%s, %s)"] * len(self._state_store_columns))
+        params: List[str] = [self.state_schema.upper()]
+        for table_name, column_name in self._state_store_columns:
+            params += [table_name.upper(), column_name.upper()]
         try:
-            for statement in statements:
-                logger.debug("Executing: %s", statement)
-                if isinstance(statement, Sql):
-                    con.cursor().execute(*statement)
-                else:
-                    con.cursor().execute(statement)
-            logger.debug("Committing Transaction...")
-            con.commit()
-        except Exception as e:
-            logger.debug("Rolling Back Transaction...")
-            con.rollback()
-            raise e
-        finally:
-            con.close()
+            rows = self._execute_sql(
+                f"select count(*) from {self.state_database}.information_schema.columns "
+                f"where table_schema = %s and (table_name, column_name) in ({pairs})",
+                tuple(params),
+            )
+        except snowflake.connector.errors.ProgrammingError:
+            # Most likely the database doesn't exist yet.
+            return False
+        return rows[0][0] == len(self._state_store_columns)
+
+    def ensure_state_store(self):
+        """Create or upgrade the state store tables if we need to."""
+        store_key = (self.account, self.state_database)
+        if store_key in self._ready_state_stores:
+            return
+        if self._state_store_up_to_date():
+            self._ready_state_stores.add(store_key)
+            return
+        logger.info("Creating or upgrading the state store.")
+        for statement in (
+            f"CREATE DATABASE IF NOT EXISTS {self.state_database}",
+            f"CREATE SCHEMA IF NOT EXISTS {self.state_database}.{self.state_schema}",
+            f"CREATE TABLE IF NOT EXISTS {self._table('live_deploys')} "
+            " (project_name string, commit_hash string, manifest string)",
+            f"CREATE TABLE IF NOT EXISTS {self._table('last_refresh')} "
+            " (project_name string, schema string, build_timestamp TIMESTAMP_NTZ)",
+            f"CREATE TABLE IF NOT EXISTS {self._table('database_locks')} "
+            " (target_database string, process_id string, lock_timeout TIMESTAMP_NTZ)",
+            # Manifests are stored compressed, addressed by their content hash.
+            f"ALTER TABLE {self._table('live_deploys')} "
+            " ADD COLUMN IF NOT EXISTS manifest_hash string",
+            f"CREATE TABLE IF NOT EXISTS {self._table('manifests')} "
+            " (project_name string, manifest_hash string, chunk_index integer,"
+            " chunk binary, created_at TIMESTAMP_NTZ)",
+            f"CREATE TABLE IF NOT EXISTS {self._table('manifest_history')} "
+            " (project_name string, commit_hash string, manifest_hash string,"
+            " deployed_at TIMESTAMP_NTZ)",
+            f"CREATE TABLE IF NOT EXISTS {self._table('node_timings')} "
+            " (project_name string, commit_hash string, invocation_id string,"
+            " command string, node string, schema string, status string,"
+            " execution_time float, rows_affected integer,"
+            " completed_at TIMESTAMP_NTZ, recorded_at TIMESTAMP_NTZ)",
+            f"CREATE TABLE IF NOT EXISTS {self._table('lock_queue')} "
+            " (target_database string, process_id string,"
+            " enqueued_at TIMESTAMP_NTZ, expires_at TIMESTAMP_NTZ)",
+        ):
+            self._execute_sql(statement)
+        self._ready_state_stores.add(store_key)
 
+    @traced("warehouse.get_warehouse_size")
+    def get_warehouse_size(self):
+        self._count_statement()
+        with self._connection(autocommit=True) as con:
+            cur = con.cursor().execute("show warehouses like %s", (self.warehouse,))
+            columns = [column[0].lower() for column in cur.description]
+            rows = cur.fetchall()
+        # LIKE treats _ and % as wildcards, so it may match other warehouses too.
+        for row in rows:
+            if row[columns.index("name")].upper() == self.warehouse.upper():
+                return row[columns.index("size")]
+        return None
+
+    @traced("warehouse.set_warehouse_size", "size")
+    def set_warehouse_size(self, size):
+        self._execute_sql(
+            f"alter warehouse {self.warehouse} set warehouse_size = %s", (size.upper(),)
+        )
+
+    @property
+    def state_store(self):
+        return (self.account, self.state_database, self.state_schema)
+
+    @property
+    def compute(self):
+        return self.warehouse
+
+    def _fetch_state_rows(self, project_names, has_manifest_hash=True):
+        names = ", ".join(["%s"] * len(project_names))
+        has_manifest = "manifest is not null"
+        if has_manifest_hash:
+            has_manifest += " or manifest_hash is not null"
+        return self._execute_sql(
+            f"""
+            select 'deploy', project_name, commit_hash, iff({has_manifest}, 'Y', 'N'), null::timestamp_ntz
+                from {self._table('live_deploys')} where project_name in ({names})
+            union all
+            select 'refresh', project_name, schema, null, build_timestamp
+                from {self._table('last_refresh')} where project_name in ({names})
+            union all
+            select 'lock', null, target_database, process_id, lock_timeout
+                from {self._table('database_locks')} where lock_timeout >= current_timestamp()
+            """,
+            tuple(project_names) * 2,
+        )
+
+    def fetch_state(self, project_name: str) -> WarehouseState:
+        """Fetch deploy, refresh and lock state in a single query."""
+        return self.fetch_states([project_name])[project_name]
+
+    @traced("warehouse.fetch_states")
+    def fetch_states(self, project_names: Iterable[str]) -> Dict[str, WarehouseState]:
+        """Fetch deploy, refresh and lock state for several projects in a single query."""
+        project_names = list(project_names)
+        states = {name: WarehouseState() for name in project_names}
+        try:
+            try:
+                rows = self._fetch_state_rows(project_names)
+            except snowflake.connector.errors.ProgrammingError as err:
+                if err.errno != self.INVALID_IDENTIFIER:
+                    raise
+                # State stores from before manifests were stored separately
+                # have no manifest_hash. We can still read them, and they're
+                # upgraded by the next command which writes state.
+                logger.info("State store is out of date. Reading it as it is.")
+                rows = self._fetch_state_rows(project_names, has_manifest_hash=False)
+        except snowflake.connector.errors.ProgrammingError as err:
+            # Anything other than missing objects is a real problem,
+            # so don't hide it.
+            if err.errno != self.OBJECT_DOES_NOT_EXIST:
+                raise
+            logger.warning(
+                "State store %s.%s doesn't exist, or we aren't authorised to read it: %s. "
+                "It will be created on first deploy.",
+                self.state_database,
+                self.state_schema,
+                err,
+            )
+            return states
+        for kind, project_name, key, value, timestamp in rows:
+            if kind == "deploy":
+                states[project_name].deployed_hash = key
+                states[project_name].has_manifest = value == "Y"
+            elif kind == "refresh":
+                states[project_name].last_refreshes[key] = timestamp
+            elif kind == "lock":
+                # Locks are on databases, so they apply to every project.
+                for state in states.values():
+                    state.locks[key] = value
+        return states
+
+    @traced("warehouse.get_current_deployed")
     def get_current_deployed(self, project_name):
         """Get the details of the currently deployed state."""
         try:
             current_live = self._execute_sql(
-                "select commit_hash from live_deploys where project_name = %s",
+                f"select commit_hash from {self._table('live_deploys')} where project_name = %s",
                 project_name,
             )
         except snowflake.connector.errors.ProgrammingError:
@@ -118,6 +440,34 @@ class SnowflakeWarehouse(Warehouse):
             return current_live[0][0]
         return None
 
+    def _merge_last_refreshes(
+        self,
+        project_name: str,
+        schemas: List[str],
+        build_timestamp: datetime.datetime,
+    ) -> Sql:
+        """A single statement to update the last refresh of many schemas."""
+        # Duplicate rows would make the merge nondeterministic.
+        schemas = list(dict.fromkeys(schemas))
+        values = ", ".join(["(%s, %s, %s)"] * len(schemas))
+        params: List[str] = []
+        for schema in schemas:
+            params += [project_name, schema, build_timestamp.isoformat()]
+        return Sql(
+            f"""
+            merge into {self._table('last_refresh')} as last_refresh
+                using (
+                    select column1 as project_name, column2 as schema, column3::timestamp_ntz as build_timestamp
+                    from values {values}
+                ) as b
+                    on last_refresh.project_name = b.project_name and last_refresh.schema = b.schema
+                when matched then update set last_refresh.build_timestamp = b.build_timestamp
+                when not matched then insert (project_name, schema, build_timestamp) values (b.project_name, b.schema, b.build_timestamp)
+            """,
+            tuple(params),
+        )
+
+    @traced("warehouse.deploy", "deploy_db")
     def deploy(
         self,
         project_name: str,
@@ -128,47 +478,27 @@ class SnowflakeWarehouse(Warehouse):
         build_timestamp: datetime.datetime,
     ):
         """Deploy the current project."""
+        self.ensure_state_store()
         self._execute_transaction(
-            # Create metadata schema if not exists
-            f"CREATE DATABASE IF NOT EXISTS {self.state_database}",
-            f"CREATE SCHEMA IF NOT EXISTS {self.state_schema}",
-            # Create deploys table if not exists
-            Sql(
-                "CREATE TABLE IF NOT EXISTS live_deploys "
-                " (project_name string, commit_hash string, manifest string)"
-            ),
             # Do the upsert of new metadata
             Sql(
-                """
-                merge into live_deploys using (select %s as project_name, %s as commit_hash) as b
+                f"""
+                merge into {self._table('live_deploys')} as live_deploys
+                    using (select %s as project_name, %s as commit_hash) as b
                         on live_deploys.project_name = b.project_name
-                    when matched then update set live_deploys.commit_hash = b.commit_hash, live_deploys.manifest = NULL
-                    when not matched then insert (project_name, commit_hash, manifest) values (b.project_name, b.commit_hash, NULL)
+                    when matched then update set live_deploys.commit_hash = b.commit_hash, live_deploys.manifest = NULL, live_deploys.manifest_hash = NULL
+                    when not matched then insert (project_name, commit_hash, manifest, manifest_hash) values (b.project_name, b.commit_hash, NULL, NULL)
                 """,
                 (
                     project_name,
                     commit_hash,
                 ),
             ),
-            # Create last_refresh table if not exists
-            Sql(
-                "CREATE TABLE IF NOT EXISTS last_refresh "
-                " (project_name string, schema string, build_timestamp TIMESTAMP_NTZ)"
+            # Update values for all the schemas. We add the full
+            # deploy flag here to keep track of the last deploy.
+            self._merge_last_refreshes(
+                project_name, schemas + [self.FULL_DEPLOY], build_timestamp
             ),
-            # Update values for all the schemas.
-            *[
-                Sql(
-                    """
-                    merge into last_refresh using (select %s as project_name, %s as schema, %s as build_timestamp) as b
-                            on last_refresh.project_name = b.project_name and last_refresh.schema = b.schema
-                        when matched then update set last_refresh.build_timestamp = b.build_timestamp
-                        when not matched then insert (project_name, schema, build_timestamp) values (b.project_name, b.schema, b.build_timestamp)
-                    """,
-                    (project_name, schema, build_timestamp.isoformat())
-                    # We add the full deploy flag here to keep track of the last deploy.
-                )
-                for schema in schemas + [self.FULL_DEPLOY]
-            ],
             # Do the swap (creating the destination if it doesn't already exist).
             f"CREATE DATABASE IF NOT EXISTS {deploy_db}",
             f"ALTER DATABASE {build_db} SWAP WITH {deploy_db}",
@@ -176,6 +506,7 @@ class SnowflakeWarehouse(Warehouse):
         )
         logger.info("Deployed from %r to %r", build_db, deploy_db)
 
+    @traced("warehouse.deploy_schemas", "deploy_db")
     def deploy_schemas(
         self,
         project_name: str,
@@ -191,19 +522,80 @@ class SnowflakeWarehouse(Warehouse):
             f"ALTER SCHEMA {build_db}.{self.schema}_{sch} SWAP WITH {deploy_db}.{self.schema}_{sch}"
             for sch in schemas
         ]
-        update_statements = [
-            Sql(
-                "UPDATE last_refresh SET build_timestamp = %s WHERE project_name = %s AND schema = %s",
-                (build_timestamp.isoformat(), project_name, schema),
-            )
-            for schema in schemas
-        ]
         self._execute_transaction(
             *swap_statements,
-            *update_statements,
+            self._merge_last_refreshes(project_name, schemas, build_timestamp),
         )
         logger.info("Deployed %r from %r to %r", schemas, build_db, deploy_db)
 
+    def _store_manifest(self, project_name: str, manifest: str) -> str:
+        """Store a compressed manifest, returning its hash.
+
+        Manifests are addressed by the hash of their content, so each
+        distinct manifest is only ever written once.
+        """
+        manifest_bytes = manifest.encode("utf8")
+        manifest_hash = digest(manifest_bytes)
+        existing = self._execute_sql(
+            f"SELECT count(*) FROM {self._table('manifests')} "
+            "WHERE project_name = %s AND manifest_hash = %s",
+            (project_name, manifest_hash),
+        )
+        if existing[0][0]:
+            logger.debug("Manifest %s already stored.", manifest_hash)
+            return manifest_hash
+        compressed = gzip.compress(manifest_bytes)
+        chunks = [
+            compressed[idx : idx + self.manifest_chunk_size]
+            for idx in range(0, len(compressed), self.manifest_chunk_size)
+        ]
+        logger.info(
+            "Storing manifest %s (%s bytes compressed to %s).",
+            manifest_hash,
+            len(manifest_bytes),
+            len(compressed),
+        )
+        self._execute_transaction(
+            *[
+                Sql(
+                    f"INSERT INTO {self._table('manifests')} "
+                    "(project_name, manifest_hash, chunk_index, chunk, created_at) "
+                    "VALUES (%s, %s, %s, %s, current_timestamp())",
+                    (project_name, manifest_hash, idx, chunk),
+                )
+                for idx, chunk in enumerate(chunks)
+            ]
+        )
+        # We've got it locally too, so cache it.
+        self.cache.put(f"manifests/{manifest_hash}.json.gz", compressed)
+        return manifest_hash
+
+    def _load_manifest(self, project_name: str, manifest_hash: str) -> str:
+        """Load a stored manifest, from the local cache if we can."""
+        cache_key = f"manifests/{manifest_hash}.json.gz"
+        compressed = self.cache.get(cache_key)
+        if compressed:
+            manifest_bytes = gzip.decompress(compressed)
+            if digest(manifest_bytes) == manifest_hash:
+                return manifest_bytes.decode("utf8")
+            logger.warning("Cached manifest %s is corrupt. Ignoring.", manifest_hash)
+        rows = self._execute_sql(
+            f"SELECT chunk_index, chunk FROM {self._table('manifests')} "
+            "WHERE project_name = %s AND manifest_hash = %s ORDER BY chunk_index",
+            (project_name, manifest_hash),
+        )
+        # NOTE: Concurrent writers may have duplicated chunks.
+        chunks = {chunk_index: bytes(chunk) for chunk_index, chunk in rows}
+        compressed = b"".join(chunks[idx] for idx in sorted(chunks))
+        manifest_bytes = gzip.decompress(compressed)
+        if digest(manifest_bytes) != manifest_hash:
+            raise click.ClickException(
+                f"Stored manifest {manifest_hash} doesn't match its hash."
+            )
+        self.cache.put(cache_key, compressed)
+        return manifest_bytes.decode("utf8")
+
+    @traced("warehouse.deploy_manifest")
     def deploy_manifest(
         self,
         project_name: str,
@@ -212,41 +604,66 @@ class SnowflakeWarehouse(Warehouse):
         update_commit: bool = False,
     ):
         """update manifest for current project."""
+        self.ensure_state_store()
+        manifest_hash = self._store_manifest(project_name, manifest)
         # Update manifest for this project
         if update_commit:
             # Optionally, also update the commit hash
-            self._execute_sql(
-                "UPDATE live_deploys SET manifest = %s, commit_hash = %s WHERE project_name = %s",
-                (manifest, commit_hash, project_name),
+            update_statement = Sql(
+                f"UPDATE {self._table('live_deploys')} SET manifest = NULL, manifest_hash = %s, commit_hash = %s WHERE project_name = %s",
+                (manifest_hash, commit_hash, project_name),
             )
         else:
-            self._execute_sql(
-                "UPDATE live_deploys SET manifest = %s WHERE project_name = %s and commit_hash = %s",
-                (manifest, project_name, commit_hash),
+            update_statement = Sql(
+                f"UPDATE {self._table('live_deploys')} SET manifest = NULL, manifest_hash = %s WHERE project_name = %s and commit_hash = %s",
+                (manifest_hash, project_name, commit_hash),
             )
+        self._execute_transaction(
+            update_statement,
+            # Keep a record of which manifest went with each commit.
+            Sql(
+                f"INSERT INTO {self._table('manifest_history')} "
+                "(project_name, commit_hash, manifest_hash, deployed_at) "
+                "VALUES (%s, %s, %s, current_timestamp())",
+                (project_name, commit_hash, manifest_hash),
+            ),
+        )
 
     def _fetch_manifest(self, project_name: str, commit_hash: str):
-        result = self._execute_sql(
-            "SELECT commit_hash, manifest FROM live_deploys WHERE project_name = %s",
-            project_name,
-        )
+        try:
+            result = self._execute_sql(
+                f"SELECT commit_hash, manifest, manifest_hash FROM {self._table('live_deploys')} WHERE project_name = %s",
+                project_name,
+            )
+        except snowflake.connector.errors.ProgrammingError as err:
+            # Older state stores only have the manifest itself.
+            if err.errno != self.INVALID_IDENTIFIER:
+                raise
+            result = self._execute_sql(
+                f"SELECT commit_hash, manifest, null FROM {self._table('live_deploys')} WHERE project_name = %s",
+                project_name,
+            )
         if not result:
             raise click.ClickException(
                 f"No deploy for {project_name!r}. Run deploy first."
             )
         return result[0]
 
+    @traced("warehouse.fetch_manifest")
     def fetch_manifest(self, project_name: str, commit_hash: str, attempts=5, pause=5):
         """fetch manifest for current project."""
         # Update manifest for this project
         for attempt in range(attempts):
-            current_commit, manifest = self._fetch_manifest(
+            current_commit, manifest, manifest_hash = self._fetch_manifest(
                 project_name=project_name, commit_hash=commit_hash
             )
             if current_commit != commit_hash:
                 raise click.ClickException(
                     "Commit hash out of date. Another deploy has happened. Try again."
                 )
+            if manifest_hash:
+                return self._load_manifest(project_name, manifest_hash)
+            # Older deploys store the manifest directly.
             if manifest:
                 return manifest
             logger.warning(
@@ -258,36 +675,130 @@ class SnowflakeWarehouse(Warehouse):
             f"Manifest no present after {attempts} attempts. Somthing is very wrong."
         )
 
-    def acquire_lock(self, target: str, ttl_minutes=1) -> Optional[str]:
-        lock_key = str(uuid.uuid4())
+    @traced("warehouse.record_run_results")
+    def record_run_results(
+        self, project_name: str, commit_hash: str, timings: List[NodeTiming]
+    ) -> None:
+        """Store node timings, in batches of many rows per insert."""
+        self.ensure_state_store()
+        for offset in range(0, len(timings), self.timings_batch_size):
+            batch = timings[offset : offset + self.timings_batch_size]
+            params: List = []
+            for timing in batch:
+                params += [
+                    project_name,
+                    commit_hash,
+                    timing.invocation_id,
+                    timing.command,
+                    timing.node,
+                    timing.schema,
+                    timing.status,
+                    timing.execution_time,
+                    timing.rows_affected,
+                    timing.completed_at.isoformat() if timing.completed_at else None,
+                ]
+            self._execute_sql(
+                f"INSERT INTO {self._table('node_timings')} "
+                "(project_name, commit_hash, invocation_id, command, node, schema,"
+                " status, execution_time, rows_affected, completed_at, recorded_at) "
+                "VALUES "
+                + ", ".join(
+                    ["(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, current_timestamp())"]
+                    * len(batch)
+                ),
+                params,
+            )
+        logger.info("Recorded timings of %s nodes.", len(timings))
+
+    @traced("warehouse.get_node_timings")
+    def get_node_timings(
+        self, project_name: str, since: Optional[datetime.datetime] = None
+    ) -> List[NodeTiming]:
+        try:
+            rows = self._execute_sql(
+                "SELECT node, status, execution_time, rows_affected, schema,"
+                " command, invocation_id, completed_at "
+                f"FROM {self._table('node_timings')} "
+                "WHERE project_name = %s AND completed_at >= %s "
+                "ORDER BY completed_at",
+                (project_name, (since or datetime.datetime(1970, 1, 1)).isoformat()),
+            )
+        except snowflake.connector.errors.ProgrammingError:
+            logger.warning("Error fetching node timings. None recorded yet?")
+            return []
+        return [NodeTiming(*row) for row in rows]
+
+    @traced("warehouse.get_invocation_timings")
+    def get_invocation_timings(
+        self, project_name: str, since: Optional[datetime.datetime] = None
+    ) -> List[NodeTiming]:
+        # Total in the warehouse, so we only fetch one row per invocation.
+        try:
+            rows = self._execute_sql(
+                "SELECT schema, command, invocation_id,"
+                " sum(execution_time), max(completed_at) "
+                f"FROM {self._table('node_timings')} "
+                "WHERE project_name = %s AND completed_at >= %s"
+                " AND schema IS NOT NULL "
+                "GROUP BY schema, command, invocation_id "
+                "ORDER BY max(completed_at)",
+                (project_name, (since or datetime.datetime(1970, 1, 1)).isoformat()),
+            )
+        except snowflake.connector.errors.ProgrammingError:
+            logger.warning("Error fetching node timings. None recorded yet?")
+            return []
+        return [
+            NodeTiming(
+                node="",
+                status="",
+                execution_time=execution_time,
+                schema=schema,
+                command=command,
+                invocation_id=invocation_id,
+                completed_at=completed_at,
+            )
+            for schema, command, invocation_id, execution_time, completed_at in rows
+        ]
+
+    @traced("warehouse.acquire_lock", "target")
+    def acquire_lock(self, target: str, ttl_minutes=10, lock_key=None) -> Optional[str]:
+        lock_key = lock_key or str(uuid.uuid4())
         # Make sure we have a locks table.
-        self._execute_sql(f"CREATE DATABASE IF NOT EXISTS {self.state_database}")
-        self._execute_sql(f"CREATE SCHEMA IF NOT EXISTS {self.state_schema}")
+        self.ensure_state_store()
+        # Acquire lock if we can, and nobody is ahead of us in the queue.
         self._execute_sql(
-            "CREATE TABLE IF NOT EXISTS database_locks "
-            " (target_database string, process_id string, lock_timeout TIMESTAMP_NTZ)"
-        )
-        # Acquire lock if we can.
-        self._execute_sql(
-            """
-            merge into database_locks using (
+            f"""
+            merge into {self._table('database_locks')} as database_locks using (
                         select
-                            %s as target_database,
-                            %s as process_id,
+                            %(target)s as target_database,
+                            %(lock_key)s as process_id,
                             TIMESTAMPADD(
-                                minute , %s , current_timestamp()
+                                second , %(ttl_seconds)s , current_timestamp()
                             ) as lock_timeout
+                        where not exists (
+                            select 1 from {self._table('lock_queue')} as waiting
+                            where waiting.target_database = %(target)s
+                                and waiting.process_id != %(lock_key)s
+                                and waiting.expires_at >= current_timestamp()
+                                and waiting.enqueued_at < coalesce(
+                                    (
+                                        select min(enqueued_at) from {self._table('lock_queue')}
+                                        where target_database = %(target)s and process_id = %(lock_key)s
+                                    ),
+                                    current_timestamp()
+                                )
+                        )
                     ) as b
                     on database_locks.target_database = b.target_database
                 when matched and database_locks.lock_timeout < current_timestamp()
                     then update set database_locks.process_id = b.process_id, database_locks.lock_timeout = b.lock_timeout
                 when not matched then insert (target_database, process_id, lock_timeout) values (b.target_database, b.process_id, b.lock_timeout)
             """,
-            (target, lock_key, ttl_minutes),
+            {"target": target, "lock_key": lock_key, "ttl_seconds": int(ttl_minutes * 60)},
         )
         # Did we get it?
         current_lock = self._execute_sql(
-            "SELECT process_id FROM database_locks WHERE target_database = %s", target
+            f"SELECT process_id FROM {self._table('database_locks')} WHERE target_database = %s", target
         )[0][0]
         if current_lock == lock_key:
             logger.info("Acquired lock on %r", target)
@@ -296,28 +807,70 @@ class SnowflakeWarehouse(Warehouse):
             logger.info("Failed lock acquisition on %r", target)
             return None
 
+    @traced("warehouse.renew_lock", "target")
+    def renew_lock(self, target: str, lock_key: str, ttl_minutes=10) -> bool:
+        result = self._execute_sql(
+            f"UPDATE {self._table('database_locks')} "
+            "SET lock_timeout = TIMESTAMPADD(second, %s, current_timestamp()) "
+            "WHERE target_database = %s AND process_id = %s",
+            (int(ttl_minutes * 60), target, lock_key),
+        )
+        # Snowflake returns the number of rows updated.
+        return bool(result and result[0][0])
+
+    def join_lock_queue(self, target: str, lock_key: str, ttl_minutes=10) -> None:
+        self.ensure_state_store()
+        self._execute_sql(
+            f"""
+            merge into {self._table('lock_queue')} as lock_queue using (
+                select %s as target_database, %s as process_id
+            ) as b
+                on lock_queue.target_database = b.target_database and lock_queue.process_id = b.process_id
+            when matched then update set lock_queue.expires_at = TIMESTAMPADD(second, %s, current_timestamp())
+            when not matched then insert (target_database, process_id, enqueued_at, expires_at)
+                values (b.target_database, b.process_id, current_timestamp(), TIMESTAMPADD(second, %s, current_timestamp()))
+            """,
+            (target, lock_key, int(ttl_minutes * 60), int(ttl_minutes * 60)),
+        )
+
+    def leave_lock_queue(self, target: str, lock_key: str) -> None:
+        # Also tidy up any places left by processes which have gone away.
+        self._execute_sql(
+            f"DELETE FROM {self._table('lock_queue')} WHERE target_database = %s AND process_id = %s"
+            " OR expires_at < current_timestamp()",
+            (target, lock_key),
+        )
+
+    @traced("warehouse.create_wipe_db", "db_name")
     def create_wipe_db(self, db_name, source=None):
         if source:
-            self._execute_sql(f"create or replace database {db_name} CLONE {source}")
+            self._execute_async(f"create or replace database {db_name} CLONE {source}")
         else:
-            self._execute_sql(f"create or replace database {db_name}")
+            self._execute_async(f"create or replace database {db_name}")
+
+    @traced("warehouse.drop_db", "db_name")
+    def drop_db(self, db_name):
+        self._execute_sql(f"drop database if exists {db_name}")
 
+    @traced("warehouse.clone_schema", "destination")
     def clone_schema(self, schema, destination, source):
-        self._execute_sql(
+        self._execute_async(
             f"create or replace schema {destination}.{self.schema}_{schema} CLONE {source}.{self.schema}_{schema}"
         )
 
+    @traced("warehouse.release_lock", "target")
     def release_lock(self, target: str, lock_key: str) -> None:
         # SHOULD THIS BE A CONTEXT MANAGER?
         self._execute_sql(
-            "DELETE FROM database_locks WHERE target_database = %s and process_id = %s",
+            f"DELETE FROM {self._table('database_locks')} WHERE target_database = %s and process_id = %s",
             (target, lock_key),
         )
         logger.info("Lock released on %r", target)
 
+    @traced("warehouse.get_last_refreshes")
     def get_last_refreshes(self, project_name: str):
         results = self._execute_sql(
-            "SELECT schema, build_timestamp FROM last_refresh WHERE project_name = %s",
+            f"SELECT schema, build_timestamp FROM {self._table('last_refresh')} WHERE project_name = %s",
             project_name,
         )
         return {schema: last_refresh for schema, last_refresh in results}
@@ -0,0 +1,121 @@
+"""A workspace of several deployments, run from one process."""
+
+import os.path
+from typing import Dict, List, Optional
+
+from dbtease.common import YamlFileObject
+from dbtease.schedule import DbtSchedule
+
+
+class Deployment:
+    """A deployment in a workspace, and where to find it."""
+
+    def __init__(self, schedule, project_dir, schedule_dir, profiles_dir):
+        self.schedule = schedule
+        self.project_dir = project_dir
+        self.schedule_dir = schedule_dir
+        self.profiles_dir = profiles_dir
+
+    def __repr__(self):
+        return f"<Deployment: {self.schedule.name}>"
+
+
+class Workspace(YamlFileObject):
+    """Several deployments, sharing connections and concurrency limits.
+
+    Each deployment is a dbt project with its own schedule. They all
+    run in one process: deployments using the same warehouse credentials
+    share a connection pool, and their state is fetched together from
+    each state store.
+    """
+
+    default_file_name = "dbtease_workspace.yml"
+
+    def __init__(
+        self,
+        deployments: List[Deployment],
+        jobs=1,
+        warehouse_jobs: Optional[Dict[str, int]] = None,
+        default_warehouse_jobs=1,
+    ):
+        self.deployments = {
+            deployment.schedule.name: deployment for deployment in deployments
+        }
+        if len(self.deployments) != len(deployments):
+            raise ValueError("Deployment names in a workspace must be unique.")
+        # dbt writes its artifacts into the project, so deployments
+        # running at the same time can't share one.
+        project_dirs = {
+            os.path.abspath(deployment.project_dir) for deployment in deployments
+        }
+        if len(project_dirs) != len(deployments):
+            raise ValueError("Deployments in a workspace need their own project_dir.")
+        # At most this many deploys or refreshes at once.
+        self.jobs = jobs
+        # And at most this many using each warehouse.
+        self.warehouse_jobs = warehouse_jobs or {}
+        self.default_warehouse_jobs = default_warehouse_jobs
+
+    def __repr__(self):
+        return f"<Workspace: {', '.join(self.deployments)}>"
+
+    def iter_schedules(self):
+        for name, deployment in self.deployments.items():
+            yield name, deployment.schedule
+
+    def status_dicts(self):
+        """The status of every deployment, fetching state once per state store."""
+        by_store: Dict = {}
+        for name, schedule in self.iter_schedules():
+            by_store.setdefault(schedule.warehouse.state_store, []).append(schedule)
+        states = {}
+        for schedules in by_store.values():
+            states.update(schedules[0].warehouse.fetch_states(s.name for s in schedules))
+        return {
+            name: schedule.status_dict(deploy=False, state=states[name])
+            for name, schedule in self.iter_schedules()
+        }
+
+    def close(self):
+        for _, schedule in self.iter_schedules():
+            schedule.warehouse.close()
+
+    @classmethod
+    def from_dict(cls, config, workspace_dir=".", profiles_dir=None, **kwargs):
+        """Load a workspace from a dict.
+
+        Paths to projects are relative to the workspace directory.
+        """
+        deployments = []
+        for deployment_config in config["deployments"]:
+            project_dir = os.path.join(workspace_dir, deployment_config["project_dir"])
+            schedule_dir = os.path.join(
+                workspace_dir,
+                deployment_config.get("schedule_dir", deployment_config["project_dir"]),
+            )
+            deployment_profiles_dir = (
+                deployment_config.get("profiles_dir", None) or profiles_dir
+            )
+            schedule = DbtSchedule.from_path(
+                schedule_dir,
+                project_dir=project_dir,
+                profiles_dir=deployment_profiles_dir,
+                **kwargs,
+            )
+            # As if dbtease were run from the project directory, the
+            # git path is relative to that.
+            schedule.git_path = os.path.join(project_dir, schedule.git_path)
+            deployments.append(
+                Deployment(
+                    schedule,
+                    project_dir=project_dir,
+                    schedule_dir=schedule_dir,
+                    profiles_dir=deployment_profiles_dir,
+                )
+            )
+        return cls(
+            deployments,
+            jobs=config.get("jobs", 1),
+            warehouse_jobs=config.get("warehouses", None),
+            default_warehouse_jobs=config.get("warehouse_jobs", 1),
+        )
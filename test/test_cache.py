@@ -0,0 +1,28 @@
+"""Test the local file cache."""
+
+import os
+
+from dbtease.cache import FileCache
+
+
+def test__cache_roundtrip(tmp_path):
+    """Test that we get back what we put in."""
+    cache = FileCache(path=str(tmp_path))
+    assert cache.get("foo/bar.json") is None
+    cache.put("foo/bar.json", b"content")
+    assert cache.get("foo/bar.json") == b"content"
+
+
+def test__cache_evicts_least_recently_used(tmp_path):
+    """Test that pruning keeps the most recently used items."""
+    cache = FileCache(path=str(tmp_path), max_size=10)
+    cache.put("a", b"aaaa")
+    cache.put("b", b"bbbb")
+    # Make "a" older, then use it so it becomes the most recent.
+    os.utime(tmp_path / "a", (0, 0))
+    os.utime(tmp_path / "b", (1, 1))
+    assert cache.get("a") == b"aaaa"
+    cache.put("c", b"cccc")
+    assert cache.get("b") is None
+    assert cache.get("a") == b"aaaa"
+    assert cache.get("c") == b"cccc"
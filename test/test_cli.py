@@ -0,0 +1,107 @@
+"""Test the dbt commands the cli runs."""
+
+import os.path
+
+import pytest
+
+from dbtease import cli
+from dbtease.schedule import DbtSchedule
+from dbtease.warehouses.base import DummyWarehouse
+
+
+@pytest.fixture
+def commands(monkeypatch):
+    """The dbt commands run, rather than running them."""
+    commands = []
+    monkeypatch.setattr(
+        cli, "cli_run_dbt_command", lambda cmd: commands.append(cmd) or (0, [])
+    )
+    return commands
+
+
+def _schedule(dbt_build):
+    schedule = DbtSchedule.from_path(
+        "test/fixtures", project_dir="test/fixtures", warehouse=DummyWarehouse()
+    )
+    schedule.dbt_build = dbt_build
+    return schedule
+
+
+def test_run_dbt_phase_build(commands):
+    cli.cli_run_dbt_phase(_schedule(True), "foo", ["--profiles-dir", "x"])
+    assert commands == [
+        [
+            "build",
+            "--select",
+            "foo",
+            "--exclude",
+            "resource_type:seed resource_type:snapshot",
+            "--fail-fast",
+            "--profiles-dir",
+            "x",
+        ]
+    ]
+
+
+def test_run_dbt_phase_build_with_seeds(commands):
+    cli.cli_run_dbt_phase(
+        _schedule(True), "foo", ["--profiles-dir", "x"], seed_selector="", exclude="bar"
+    )
+    assert commands == [
+        [
+            "build",
+            "--select",
+            "foo",
+            "--exclude",
+            "bar resource_type:snapshot",
+            "--fail-fast",
+            "--profiles-dir",
+            "x",
+        ]
+    ]
+
+
+def test_run_dbt_phase_separate_commands(commands):
+    cli.cli_run_dbt_phase(_schedule(False), "foo", ["--profiles-dir", "x"])
+    assert commands == [
+        ["run", "--models", "foo", "--fail-fast", "--profiles-dir", "x"],
+        ["test", "--models", "foo", "--profiles-dir", "x"],
+    ]
+
+
+def test_run_dbt_phase_separate_commands_with_seeds(commands):
+    cli.cli_run_dbt_phase(
+        _schedule(False), "foo", ["--profiles-dir", "x"], seed_selector="", exclude="bar"
+    )
+    assert commands == [
+        ["seed", "--full-refresh", "--profiles-dir", "x"],
+        ["run", "--models", "foo", "--exclude", "bar", "--fail-fast", "--profiles-dir", "x"],
+        ["test", "--models", "foo", "--exclude", "bar", "--profiles-dir", "x"],
+    ]
+
+
+def test_dbt_project_args():
+    """dbt is pointed at the project, wherever we run it from."""
+    assert cli.dbt_project_args(_schedule(False), "profiles") == [
+        "--profiles-dir",
+        "profiles",
+        "--project-dir",
+        os.path.abspath(os.path.join("test", "fixtures")),
+    ]
+
+
+def test_generate_plan_estimates_durations_once(monkeypatch):
+    """The plan is worked out once, with its durations."""
+    schedule = _schedule(False)
+    estimates = []
+    monkeypatch.setattr(schedule.warehouse, "fetch_manifest", lambda *args: {}, raising=False)
+    monkeypatch.setattr(cli, "get_compiled_manifest", lambda *args, **kwargs: {"nodes": {}})
+    monkeypatch.setattr(cli, "diff_manifests", lambda *args: [("model.a", "foo/foo/a.sql")])
+    monkeypatch.setattr(
+        schedule,
+        "estimate_durations",
+        lambda **kwargs: estimates.append(kwargs["schemas"]) or {"mid": 10.0},
+    )
+    plan, _ = cli.generate_plan(schedule, {"deployed_hash": "abc"})
+    assert estimates == [{"mid", "upper_a", "upper_b", "top"}]
+    assert plan["deploy_order"][0] == "mid"
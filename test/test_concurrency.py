@@ -0,0 +1,104 @@
+"""Test the concurrency module."""
+
+import threading
+import time
+
+import pytest
+
+from dbtease.concurrency import run_dag, run_limited, simulate_dag
+from dbtease.schedule import DbtSchedule
+from dbtease.warehouses.base import DummyWarehouse
+
+
+def test__run_dag_respects_dependencies():
+    """Check every schema only starts once its parents are done."""
+    schedule = DbtSchedule.from_path("test/fixtures", project_dir="test/fixtures", warehouse=DummyWarehouse())
+    plan = ["base", "mid", "upper_a", "upper_b", "top"]
+    dependencies = schedule.plan_dependencies(plan)
+    finished = set()
+    lock = threading.Lock()
+
+    def _work(name):
+        with lock:
+            assert dependencies[name] <= finished
+        with lock:
+            finished.add(name)
+
+    completed = run_dag(dependencies, _work, jobs=3)
+    assert set(completed) == set(plan)
+    assert completed[0] == "base"
+    assert completed[-1] == "top"
+
+
+def test__run_dag_stops_on_failure():
+    """Check that downstream work isn't started after a failure."""
+    started = []
+
+    def _work(name):
+        started.append(name)
+        if name == "a":
+            raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        run_dag({"a": set(), "b": {"a"}}, _work, jobs=2)
+    assert started == ["a"]
+
+
+def test__simulate_dag_prefers_priority():
+    """Starting the long chain first finishes sooner."""
+    dependencies = {"short": set(), "long_a": set(), "long_b": {"long_a"}}
+    durations = {"short": 10, "long_a": 10, "long_b": 10}
+    # In order, the short job delays the long chain.
+    assert simulate_dag(dependencies, durations, jobs=1) == 30
+    assert simulate_dag(dependencies, durations, jobs=2) == 20
+    dependencies = {"short": set(), "other": set(), "long_a": set(), "long_b": {"long_a"}}
+    durations["other"] = 10
+    assert simulate_dag(dependencies, durations, jobs=2) == 30
+    priority = {"short": 10, "other": 10, "long_a": 20, "long_b": 10}
+    assert simulate_dag(dependencies, durations, jobs=2, priority=priority) == 20
+
+
+def test__run_limited_respects_group_limits():
+    """Check no group runs more than its limit, and failures don't stop others."""
+    groups = {"a1": "a", "a2": "a", "a3": "a", "b1": "b", "b2": "b", "c1": "c"}
+    running = {"a": 0, "b": 0, "c": 0}
+    peak = {"a": 0, "b": 0, "c": 0}
+    lock = threading.Lock()
+
+    def _work(key):
+        group = groups[key]
+        with lock:
+            running[group] += 1
+            peak[group] = max(peak[group], running[group])
+        time.sleep(0.02)
+        with lock:
+            running[group] -= 1
+        if key == "b1":
+            raise ValueError("Failed!")
+
+    results = run_limited(groups, _work, jobs=4, group_jobs={"b": 2}, default_group_jobs=1)
+    assert peak == {"a": 1, "b": 2, "c": 1}
+    assert isinstance(results.pop("b1"), ValueError)
+    assert set(results) == set(groups) - {"b1"}
+    assert not any(results.values())
+
+
+def test__run_dag_respects_capacity():
+    """Check the weights of keys running at once fit in the capacity."""
+    dependencies = {"heavy": set(), "light_a": set(), "light_b": set(), "light_c": set()}
+    weights = {"heavy": 3, "light_a": 1, "light_b": 1, "light_c": 1}
+    running = []
+    peak = [0]
+    lock = threading.Lock()
+
+    def _work(key):
+        with lock:
+            running.append(key)
+            peak[0] = max(peak[0], sum(weights[k] for k in running))
+        time.sleep(0.02)
+        with lock:
+            running.remove(key)
+
+    run_dag(dependencies, _work, jobs=4, weights=weights, capacity=3)
+    assert peak[0] == 3
+    assert simulate_dag(dependencies, weights, jobs=4, weights=weights, capacity=3) == 4
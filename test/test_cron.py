@@ -0,0 +1,44 @@
+"""Test the cron routines."""
+
+import datetime
+
+from dbtease.cron import CronSchedule, ScheduleIndex, next_due, refresh_due
+
+
+def test__next_due():
+    last_refresh = datetime.datetime(2021, 1, 1, 1, 30)
+    assert next_due("0 */2 * * *", last_refresh) == datetime.datetime(2021, 1, 1, 2)
+    # Never refreshed means due now.
+    assert next_due("0 */2 * * *", None) <= datetime.datetime.utcnow()
+    assert refresh_due("0 */2 * * *", None)
+
+
+def test__schedule_index():
+    index = ScheduleIndex(
+        {
+            "hourly": CronSchedule("0 * * * *"),
+            "daily": CronSchedule({"cron": "0 0 * * *"}),
+            "never_run": CronSchedule("0 0 * * *"),
+        }
+    )
+    index.update(
+        {
+            "hourly": datetime.datetime(2021, 1, 1, 10, 30),
+            "daily": datetime.datetime(2021, 1, 1, 0, 10),
+        }
+    )
+    assert index.due_before(datetime.datetime(2021, 1, 1, 10, 45)) == ["never_run"]
+    assert index.due_before(datetime.datetime(2021, 1, 1, 11)) == ["never_run", "hourly"]
+    index.update(
+        {
+            "hourly": datetime.datetime(2021, 1, 1, 11, 5),
+            "daily": datetime.datetime(2021, 1, 1, 0, 10),
+            "never_run": datetime.datetime(2021, 1, 1, 11, 5),
+        }
+    )
+    assert index.next_due() == (datetime.datetime(2021, 1, 1, 12), "hourly")
+    assert index.due_before(datetime.datetime(2021, 1, 2)) == [
+        "hourly",
+        "daily",
+        "never_run",
+    ]
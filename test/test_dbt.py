@@ -0,0 +1,126 @@
+"""Test the dbt module."""
+
+import datetime
+import json
+
+from dbtease.dbt import diff_manifests, estimate_schema_durations, parse_run_results
+
+
+def _manifest(nodes=None, sources=None, macros=None, root_path="/a"):
+    """Make a minimal manifest string."""
+    return json.dumps(
+        {
+            "metadata": {"generated_at": "2021-01-01"},
+            "nodes": {
+                name: {
+                    "root_path": root_path,
+                    "original_file_path": path,
+                    "checksum": {"name": "sha256", "checksum": checksum},
+                    "tags": ["foo"],
+                }
+                for name, (path, checksum) in (nodes or {}).items()
+            },
+            "sources": {
+                name: {"root_path": root_path, "original_file_path": path, "loader": loader}
+                for name, (path, loader) in (sources or {}).items()
+            },
+            "macros": {
+                name: {"original_file_path": path, "macro_sql": sql}
+                for name, (path, sql) in (macros or {}).items()
+            },
+        }
+    )
+
+
+def test__diff_manifests_nodes():
+    """Test that changed, added and removed nodes are found."""
+    live = _manifest(
+        nodes={
+            "model.a.same": ("models/same.sql", "1"),
+            "model.a.changed": ("models/changed.sql", "2"),
+            "model.a.removed": ("models/removed.sql", "3"),
+        }
+    )
+    local = _manifest(
+        nodes={
+            "model.a.same": ("models/same.sql", "1"),
+            "model.a.changed": ("models/changed.sql", "22"),
+            "seed.a.added": ("data/added.csv", "4"),
+        },
+        root_path="/b",
+    )
+    assert diff_manifests(live, local) == [
+        ("model.a.changed", "models/changed.sql"),
+        ("model.a.removed", "models/removed.sql"),
+        ("seed.a.added", "data/added.csv"),
+    ]
+
+
+def test__diff_manifests_sources_and_macros():
+    """Test that nodes without a checksum are compared on content."""
+    live = _manifest(
+        sources={"source.a.x": ("models/src.yml", "fivetran")},
+        macros={
+            "macro.a.same": ("macros/same.sql", "select 1"),
+            "macro.a.changed": ("macros/changed.sql", "select 1"),
+        },
+    )
+    local = _manifest(
+        sources={"source.a.x": ("models/src.yml", "stitch")},
+        macros={
+            "macro.a.same": ("macros/same.sql", "select 1"),
+            "macro.a.changed": ("macros/changed.sql", "select 2"),
+        },
+        root_path="/b",
+    )
+    assert diff_manifests(live, local) == [
+        ("macro.a.changed", "macros/changed.sql"),
+        ("source.a.x", "models/src.yml"),
+    ]
+
+
+def _run_results(invocation_id, command, timings):
+    """Make a minimal run_results.json string."""
+    return json.dumps(
+        {
+            "metadata": {"invocation_id": invocation_id},
+            "args": {"which": command},
+            "results": [
+                {
+                    "unique_id": node,
+                    "status": "success",
+                    "execution_time": execution_time,
+                    "adapter_response": {"rows_affected": 10},
+                    "timing": [
+                        {"name": "compile", "completed_at": "2021-06-01T10:00:00.000000Z"},
+                        {"name": "execute", "completed_at": "2021-06-01T10:00:05.500000Z"},
+                    ],
+                }
+                for node, execution_time in timings
+            ],
+        }
+    )
+
+
+def test__parse_run_results():
+    """Check we get the timing of each node."""
+    timings = parse_run_results(_run_results("inv", "run", [("model.a.foo", 5.5)]))
+    assert len(timings) == 1
+    assert timings[0].node == "model.a.foo"
+    assert timings[0].command == "run"
+    assert timings[0].execution_time == 5.5
+    assert timings[0].rows_affected == 10
+    assert timings[0].completed_at == datetime.datetime(2021, 6, 1, 10, 0, 5, 500000)
+
+
+def test__estimate_schema_durations():
+    """Check schema durations sum commands and take the median of invocations."""
+    timings = []
+    for idx, run_time in enumerate([10, 30, 20]):
+        for timing in parse_run_results(
+            _run_results(f"run{idx}", "run", [("model.a.foo", run_time), ("model.a.bar", 1)])
+        ) + parse_run_results(_run_results(f"test{idx}", "test", [("test.a.foo", 2)])):
+            timing.schema = "a"
+            timings.append(timing)
+    # Median run of 21s, and 2s of tests.
+    assert estimate_schema_durations(timings) == {"a": 23}
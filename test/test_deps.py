@@ -0,0 +1,59 @@
+"""Test the deps module."""
+
+import os
+
+from dbtease.deps import DepsManager
+
+
+def _fake_deps(project_dir, calls):
+    """Pretend to be dbt deps, installing a package."""
+
+    def _run_deps():
+        calls.append(True)
+        package_dir = project_dir / "dbt_packages" / "dbt_utils"
+        package_dir.mkdir(parents=True, exist_ok=True)
+        (package_dir / "dbt_project.yml").write_text("name: dbt_utils\nversion: 0.7.0\n")
+
+    return _run_deps
+
+
+def test_deps_skipped_when_up_to_date(tmp_path):
+    project_dir = tmp_path / "project"
+    project_dir.mkdir()
+    (project_dir / "packages.yml").write_text("packages: [dbt_utils]\n")
+    manager = DepsManager(project_dir=str(project_dir), cache_dir=str(tmp_path / "cache"))
+    calls = []
+    assert manager.ensure(_fake_deps(project_dir, calls))
+    # The marker matches, so there's nothing to do.
+    assert not manager.ensure(_fake_deps(project_dir, calls))
+    assert len(calls) == 1
+    # Changing the packages means running deps again.
+    (project_dir / "packages.yml").write_text("packages: [dbt_utils, codegen]\n")
+    assert manager.ensure(_fake_deps(project_dir, calls))
+    assert len(calls) == 2
+
+
+def test_deps_restored_from_cache(tmp_path):
+    project_dir = tmp_path / "project"
+    project_dir.mkdir()
+    (project_dir / "packages.yml").write_text("packages: [dbt_utils]\n")
+    manager = DepsManager(project_dir=str(project_dir), cache_dir=str(tmp_path / "cache"))
+    calls = []
+    manager.ensure(_fake_deps(project_dir, calls))
+    # Without the installed packages, they come back from the cache.
+    os.rename(project_dir / "dbt_packages", tmp_path / "removed")
+    assert not manager.ensure(_fake_deps(project_dir, calls))
+    assert len(calls) == 1
+    assert (project_dir / "dbt_packages" / "dbt_utils" / "dbt_project.yml").exists()
+
+
+def test_deps_ignores_broken_cache(tmp_path):
+    project_dir = tmp_path / "project"
+    project_dir.mkdir()
+    (project_dir / "packages.yml").write_text("packages: [dbt_utils]\n")
+    manager = DepsManager(project_dir=str(project_dir), cache_dir=str(tmp_path / "cache"))
+    # An empty cache entry (e.g. from an interrupted copy) is a miss.
+    os.makedirs(os.path.join(manager.cache_dir, manager.packages_digest()))
+    calls = []
+    assert manager.ensure(_fake_deps(project_dir, calls))
+    assert len(calls) == 1
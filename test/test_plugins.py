@@ -0,0 +1,35 @@
+"""Test the plugins module."""
+
+import subprocess
+import sys
+
+import pytest
+
+from dbtease.filestores import filestore_registry
+from dbtease.filestores.local import LocalFilestore
+from dbtease.plugins import PluginRegistry
+
+
+def test_registry_imports_lazily():
+    registry = PluginRegistry("Things", {"local": "dbtease.filestores.local:LocalFilestore"})
+    assert "local" in registry
+    assert registry.get("local") is LocalFilestore
+    assert filestore_registry.get("local") is LocalFilestore
+    with pytest.raises(ValueError, match="Things of type foo"):
+        registry.get("foo")
+
+
+def test_cli_import_skips_backends():
+    """Importing the CLI shouldn't import any of the heavy backend libraries."""
+    heavy = ["snowflake.connector", "boto3", "slack_sdk", "pkg_resources"]
+    output = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            f"import sys, dbtease.cli; print([m for m in {heavy!r} if m in sys.modules])",
+        ],
+        check=True,
+        stdout=subprocess.PIPE,
+        universal_newlines=True,
+    ).stdout
+    assert output.strip() == "[]"
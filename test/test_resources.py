@@ -0,0 +1,31 @@
+"""Test the resources module."""
+
+import pytest
+
+from dbtease.resources import ResourceBudget
+from dbtease.schema import DbtSchema
+
+
+def test_resource_budget():
+    budget = ResourceBudget.from_dict(
+        {"slots": 8, "default_weight": 2, "warehouses": {"BIG_WH": 16}},
+        compute="BIG_WH",
+    )
+    assert budget.slots == 16
+    schemas = [DbtSchema("a", paths=["a"]), DbtSchema("b", paths=["b"], weight=32)]
+    assert budget.weights(schemas) == {"a": 2, "b": 32}
+    # Builds get threads for their weight, but never more than the budget.
+    assert budget.threads(2) == 2
+    assert budget.threads(32) == 16
+    # Without a weight, the profile's threads, unless it has the budget to itself.
+    assert budget.threads() is None
+    assert budget.threads(2, alone=True) == 16
+    budget = ResourceBudget.from_dict({"slots": 4}, compute="OTHER_WH")
+    assert budget.slots == 4
+    # Schemas without weights (and no default) aren't weighted.
+    assert budget.weights(schemas) == {"b": 32}
+
+
+def test_resource_budget_needs_default_size():
+    with pytest.raises(ValueError):
+        ResourceBudget.from_dict({"full_deploy_size": "XLARGE"})
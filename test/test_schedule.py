@@ -1,5 +1,7 @@
 """Test the schedule module."""
 
+import datetime
+
 from dbtease.schedule import DbtSchedule
 from dbtease.warehouses.base import DummyWarehouse
 
@@ -20,3 +22,53 @@ def test_load_basic():
         ('upper_a', 'top'),
         ('upper_b', 'top'),
     }
+
+
+def test_match_changed_files():
+    schedule = DbtSchedule.from_path("test/fixtures", project_dir="test/fixtures", warehouse=DummyWarehouse())
+    schema_files, unmatched_files = schedule._match_changed_files(
+        ["foo/bar/a.sql", "./foo/baz/b.sql", "foobar/c.sql", "foo/barx.sql", "foo/buzzer/d.sql"]
+    )
+    assert schema_files == {
+        "base": {"foo/bar/a.sql", "./foo/baz/b.sql"},
+        "upper_a": {"foobar/c.sql"},
+    }
+    # Matching is on whole path components, not just prefixes.
+    assert unmatched_files == {"foo/barx.sql", "foo/buzzer/d.sql"}
+
+
+def test_deploy_order_follows_critical_path():
+    schedule = DbtSchedule.from_path("test/fixtures", project_dir="test/fixtures", warehouse=DummyWarehouse())
+    plan = {"mid", "upper_a", "upper_b", "top"}
+    # Without durations, ties are broken by name.
+    assert schedule.determine_deploy_order(plan) == ["mid", "upper_a", "upper_b", "top"]
+    # The longer schema goes first.
+    durations = {"mid": 10, "upper_a": 5, "upper_b": 50, "top": 1}
+    assert schedule.determine_deploy_order(plan, durations) == ["mid", "upper_b", "upper_a", "top"]
+    assert schedule.critical_path_priorities(plan, durations)["mid"] == 61
+    # Chains pass through schemas which aren't in the plan.
+    assert schedule.critical_path_priorities({"top"})["base"] == 1
+
+
+def test_schema_selector():
+    schedule = DbtSchedule.from_path("test/fixtures", project_dir="test/fixtures", warehouse=DummyWarehouse())
+    schema = schedule.get_schema("base")
+    assert schema.selector() == "path:foo/bar path:foo/baz"
+    assert schema.selector("state:modified+") == (
+        "state:modified+,path:foo/bar state:modified+,path:foo/baz"
+    )
+
+
+def test_evaluate_schedules():
+    schedule = DbtSchedule.from_path("test/fixtures", project_dir="test/fixtures", warehouse=DummyWarehouse())
+    now = datetime.datetime(2021, 1, 1, 13, 30)
+    last_refreshes = {"mid": datetime.datetime(2021, 1, 1, 12, 30), "upper_a": datetime.datetime(2021, 1, 1, 12, 30)}
+    status = schedule.evaluate_schedules(last_refreshes, now=now)
+    # Schemas without a schedule are never due.
+    assert status["refreshes_due"] == ["upper_b"]
+    assert not status["redeploy_due"]
+    assert status["next_due"] == now
+    last_refreshes["upper_b"] = now
+    status = schedule.evaluate_schedules(last_refreshes, now=now)
+    assert status["refreshes_due"] == []
+    assert status["next_due"] == datetime.datetime(2021, 1, 1, 14)
@@ -0,0 +1,48 @@
+"""Tests for running shell commands."""
+
+import subprocess
+import sys
+
+import pytest
+
+from dbtease.shell import _OutputLog, run_shell_command
+
+
+def test_run_shell_command_drains_both_streams(tmp_path):
+    """Lots of stderr shouldn't block, and only the tail is kept."""
+    script = (
+        "import sys\n"
+        "for i in range(20000):\n"
+        "    print(f'out {i}')\n"
+        "    print(f'err {i}', file=sys.stderr)\n"
+        "sys.exit(3)\n"
+    )
+    log_path = tmp_path / "logs" / "commands.log"
+    retcode, stdout, stderr = run_shell_command(
+        [sys.executable, "-c", script], log_path=str(log_path), tail_lines=10
+    )
+    assert retcode == 3
+    assert stdout == [f"out {i}" for i in range(19990, 20000)]
+    assert stderr == [f"err {i}" for i in range(19990, 20000)]
+    assert "stderr: err 0" in log_path.read_text()
+
+
+def test_run_shell_command_timeout():
+    """Commands which run too long are stopped."""
+    with pytest.raises(subprocess.TimeoutExpired):
+        run_shell_command(
+            [sys.executable, "-c", "import time; time.sleep(30)"], timeout=0.5
+        )
+
+
+def test_output_logs_share_a_handler(tmp_path):
+    """Commands logging to the same file rotate it together."""
+    log_path = tmp_path / "logs" / "commands.log"
+    first, second = _OutputLog(str(log_path)), _OutputLog(str(log_path))
+    assert first.handler is second.handler
+    first.write("stdout", "one")
+    first.close()
+    second.write("stdout", "two")
+    second.close()
+    lines = log_path.read_text().splitlines()
+    assert [line.split(" - ")[-1] for line in lines] == ["stdout: one", "stdout: two"]
@@ -0,0 +1,83 @@
+"""Test the snowflake warehouse, without connecting to snowflake."""
+
+from contextlib import contextmanager
+
+import snowflake.connector
+
+from dbtease.warehouses.snowflake import SnowflakeWarehouse
+
+
+class _OldStateStore(SnowflakeWarehouse):
+    """A state store from before manifests were stored by hash."""
+
+    def __init__(self):
+        super().__init__(
+            user="user",
+            password="password",
+            account="account",
+            warehouse="warehouse",
+            schema="schema",
+            database="database",
+        )
+        self.executed = []
+
+    def _execute_sql(self, sql, params=None):
+        self.executed.append(sql)
+        if "manifest_hash" in sql:
+            raise snowflake.connector.errors.ProgrammingError(
+                msg="invalid identifier 'MANIFEST_HASH'",
+                errno=self.INVALID_IDENTIFIER,
+            )
+        if "live_deploys" in sql and "union all" in sql:
+            return [("deploy", "foo", "abc123", "Y", None)]
+        return [("abc123", '{"nodes": {}}', None)]
+
+
+def test_fetch_states_from_old_state_store():
+    warehouse = _OldStateStore()
+    state = warehouse.fetch_state("foo")
+    assert state.deployed_hash == "abc123"
+    assert state.has_manifest
+    # Reading doesn't upgrade the state store.
+    assert not any("ALTER" in sql.upper() for sql in warehouse.executed)
+
+
+def test_fetch_manifest_from_old_state_store():
+    warehouse = _OldStateStore()
+    assert warehouse.fetch_manifest("foo", "abc123") == '{"nodes": {}}'
+
+
+def test_cancel_only_lasts_until_cleared():
+    warehouse = _OldStateStore()
+    warehouse.cancel()
+    assert warehouse._cancelled.is_set()
+    warehouse.clear_cancel()
+    assert not warehouse._cancelled.is_set()
+
+
+class _FakeCursor:
+    description = [("name",), ("state",), ("size",)]
+
+    def execute(self, sql, params=None):
+        return self
+
+    def fetchall(self):
+        # "LIKE 'WH_1'" matches both of these.
+        return [("WHX1", "STARTED", "Small"), ("WH_1", "STARTED", "X-Large")]
+
+
+class _FakeConnection:
+    def cursor(self):
+        return _FakeCursor()
+
+
+def test_get_warehouse_size_matches_name_exactly(monkeypatch):
+    warehouse = _OldStateStore()
+    warehouse.warehouse = "wh_1"
+
+    @contextmanager
+    def _connection(autocommit=True):
+        yield _FakeConnection()
+
+    monkeypatch.setattr(warehouse, "_connection", _connection)
+    assert warehouse.get_warehouse_size() == "X-Large"
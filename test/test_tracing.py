@@ -0,0 +1,36 @@
+"""Tests for tracing."""
+
+from dbtease import tracing
+from dbtease.concurrency import run_dag
+
+
+def test_tracing_tags_reach_worker_threads(tmp_path):
+    """Spans in run_dag workers get the tags of the caller."""
+    trace_path = str(tmp_path / "trace.jsonl")
+    tracing.configure(path=trace_path)
+
+    def _work(name):
+        with tracing.tag(schema=name), tracing.span("refresh_schema"):
+            with tracing.span("command.dbt run"):
+                pass
+
+    try:
+        with tracing.tag(commit="abc"):
+            run_dag({"a": set(), "b": {"a"}, "c": set()}, _work, jobs=2)
+    finally:
+        tracing.configure()
+    spans = tracing.read_trace(trace_path)
+    assert len(spans) == 6
+    assert all(s["tags"]["commit"] == "abc" for s in spans)
+    # Nested spans know their parent.
+    parents = {s["span_id"]: s for s in spans}
+    for s in spans:
+        if s["name"] == "command.dbt run":
+            assert parents[s["parent_id"]]["name"] == "refresh_schema"
+    # Each schema is only counted once, despite the nested spans.
+    by_schema = tracing.summarise_spans(spans, by="schema")
+    assert sorted((key, count) for key, count, _, _ in by_schema) == [
+        ("a", 1),
+        ("b", 1),
+        ("c", 1),
+    ]
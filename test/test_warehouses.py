@@ -0,0 +1,130 @@
+"""Test the base warehouse."""
+
+import threading
+import time
+
+import click
+import pytest
+
+from dbtease.dbt import NodeTiming
+from dbtease.warehouses.base import DummyWarehouse, LockConfig
+
+
+def test__lock_fails_fast_by_default():
+    """Without waiting, a taken lock fails straight away."""
+    warehouse = DummyWarehouse()
+    with warehouse.lock("db"):
+        with pytest.raises(click.ClickException):
+            with warehouse.lock("db"):
+                pass
+
+
+def test__lock_waits_for_release():
+    """Waiting for a lock gets it once it's released, and times out otherwise."""
+    warehouse = DummyWarehouse()
+    config = LockConfig(wait=True, timeout=5, backoff_initial=0.01, backoff_max=0.05)
+    released = threading.Event()
+
+    def _hold():
+        with warehouse.lock("db"):
+            time.sleep(0.2)
+        released.set()
+
+    holder = threading.Thread(target=_hold)
+    holder.start()
+    time.sleep(0.05)
+    with warehouse.lock("db", config=config):
+        assert released.is_set()
+    holder.join()
+
+    with warehouse.lock("db"):
+        with pytest.raises(click.ClickException, match="Timed out"):
+            with warehouse.lock("db", config=LockConfig(wait=True, timeout=0.1, backoff_initial=0.01)):
+                pass
+
+
+def test__lock_heartbeat_renews():
+    """The heartbeat renews the lock, and notices if we lose it."""
+    warehouse = DummyWarehouse()
+    renewals = []
+    renew_lock = warehouse.renew_lock
+    warehouse.renew_lock = lambda *args, **kwargs: (
+        renewals.append(args) or renew_lock(*args, **kwargs)
+    )
+
+    def _wait_for(condition):
+        deadline = time.time() + 5
+        while not condition() and time.time() < deadline:
+            time.sleep(0.01)
+        return condition()
+
+    with warehouse.lock("db", config=LockConfig(heartbeat_seconds=0.01)) as lease:
+        assert _wait_for(lambda: len(renewals) >= 2)
+        assert not lease.lost
+        warehouse._locks["db"] = "someone-else"
+        assert _wait_for(lambda: lease.lost)
+        with pytest.raises(click.ClickException):
+            lease.check()
+
+
+def test__invocation_timings_are_totalled():
+    """Node timings are totalled per schema, command and invocation."""
+    warehouse = DummyWarehouse()
+    warehouse.record_run_results(
+        "project",
+        "abc",
+        [
+            NodeTiming("model.a.foo", "success", 3.0, schema="a", command="run", invocation_id="1"),
+            NodeTiming("model.a.bar", "success", 2.0, schema="a", command="run", invocation_id="1"),
+            NodeTiming("test.a.foo", "pass", 1.0, schema="a", command="test", invocation_id="1"),
+            NodeTiming("model.a.foo", "success", 4.0, schema="a", command="run", invocation_id="2"),
+        ],
+    )
+    totals = [
+        (timing.schema, timing.command, timing.invocation_id, timing.execution_time)
+        for timing in warehouse.get_invocation_timings("project")
+    ]
+    assert totals == [("a", "run", "1", 5.0), ("a", "test", "1", 1.0), ("a", "run", "2", 4.0)]
+
+
+def test__lock_check_fails_once_lost():
+    """Checking a lock which someone else has taken aborts."""
+    warehouse = DummyWarehouse()
+    with warehouse.lock("db") as lease:
+        lease.check()
+        # e.g. it expired and another run took it.
+        warehouse._locks["db"] = "someone-else"
+        with pytest.raises(click.ClickException):
+            lease.check()
+
+
+class _ResizableWarehouse(DummyWarehouse):
+    size = "MEDIUM"
+
+    def get_warehouse_size(self):
+        return self.size
+
+    def set_warehouse_size(self, size):
+        self.size = size
+
+
+def test__resized_restores_configured_size():
+    """Overlapping resizes still end up back at the configured size."""
+    warehouse = _ResizableWarehouse()
+    with warehouse.resized("XLARGE", restore_size="MEDIUM"):
+        assert warehouse.size == "XLARGE"
+        with warehouse.resized("XLARGE", restore_size="MEDIUM"):
+            pass
+    assert warehouse.size == "MEDIUM"
+    # Without one, it goes back to whatever it was.
+    with warehouse.resized("X-Large"):
+        pass
+    assert warehouse.size == "MEDIUM"
+
+
+def test__resized_without_resizing():
+    """Warehouses which can't be resized carry on at their size."""
+    warehouse = DummyWarehouse()
+    with warehouse.resized("XLARGE", restore_size="MEDIUM"):
+        pass
+    warehouse.set_warehouse_size("XLARGE")
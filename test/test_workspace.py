@@ -0,0 +1,73 @@
+"""Test the workspace module."""
+
+import os
+import shutil
+
+from git import Repo
+
+from dbtease import cli
+from dbtease.warehouses.base import DummyWarehouse
+from dbtease.workspace import Workspace
+
+
+def _workspace_repo(tmp_path):
+    """A workspace in a git repo, with the fixture project in a subdirectory."""
+    project_dir = tmp_path / "projects" / "foo"
+    shutil.copytree(os.path.join("test", "fixtures"), project_dir)
+    # The project isn't at the root of the repo.
+    with open(project_dir / "dbt_schedule.yml", "a") as schedule_file:
+        schedule_file.write("\ngit_path: ../..\n")
+    repo = Repo.init(tmp_path)
+    repo.index.add([str(path) for path in project_dir.iterdir()])
+    repo.index.commit("Add project")
+    return repo
+
+
+def test_workspace_status(tmp_path):
+    repo = _workspace_repo(tmp_path)
+    warehouse = DummyWarehouse()
+    workspace = Workspace.from_dict(
+        {"jobs": 2, "deployments": [{"project_dir": "projects/foo"}]},
+        workspace_dir=str(tmp_path),
+        warehouse=warehouse,
+    )
+    deployment = workspace.deployments["foo_prod"]
+    assert deployment.project_dir == os.path.join(str(tmp_path), "projects/foo")
+    assert workspace.jobs == 2
+    status_dicts = workspace.status_dicts()
+    # Nothing has been refreshed yet, so everything with a schedule is due.
+    assert status_dicts["foo_prod"]["refreshes_due"] == ["mid", "upper_a", "upper_b"]
+    # The git path is relative to the project, wherever we run from.
+    assert status_dicts["foo_prod"]["current_hash"] == repo.head.commit.hexsha
+
+
+def test_workspace_runs_in_process(tmp_path, monkeypatch):
+    """Deployments run in this process, with the state we fetched for them."""
+    _workspace_repo(tmp_path)
+    warehouse = DummyWarehouse()
+    workspace = Workspace.from_dict(
+        {"deployments": [{"project_dir": "projects/foo"}]},
+        workspace_dir=str(tmp_path),
+        warehouse=warehouse,
+    )
+    fetches = []
+    fetch_states = warehouse.fetch_states
+    monkeypatch.setattr(
+        warehouse, "fetch_states", lambda names: fetches.append(names) or fetch_states(names)
+    )
+    # The dummy warehouse doesn't store manifests.
+    monkeypatch.setattr(
+        warehouse, "fetch_manifest", lambda name, commit_hash: "{}", raising=False
+    )
+    refreshes = []
+    monkeypatch.setattr(
+        cli, "run_refresh", lambda *args, **kwargs: refreshes.append(args)
+    )
+    status_dicts = workspace.status_dicts()
+    deployment = workspace.deployments["foo_prod"]
+    cli.workspace_run_action(deployment, "refresh", status_dicts["foo_prod"])
+    ((schedule, status_dict, deploy_plan, manifest),) = refreshes
+    assert schedule is deployment.schedule
+    assert status_dict is status_dicts["foo_prod"]
+    assert deploy_plan == ["mid", "upper_a", "upper_b"]
+    assert len(fetches) == 1